@@ -39,6 +39,11 @@ IP_RE = re.compile('^[0-9.]+$')
 
 KNOWN_SECOND_DOMAINS = [x.rstrip() for x in open(util.FindDataFile('data/second_level_domains.txt')).readlines()]
 
+# KNOWN_SECOND_DOMAINS as a trie of nested dictionaries, keyed by label from
+# the right ('uk' -> 'co'). A None key marks the end of a known domain.
+# Built by _SecondDomainTrie() on first use.
+_SECOND_DOMAIN_TRIE = None
+
 def ExtractIPsFromString(ip_string):
   """Return a tuple of ip addressed held in a string."""
 
@@ -69,14 +74,41 @@ def GetNetworkForIp(ip, reverse=False):
     print "GetNetworkForIp() does not yet support IPv6"
     return None
 
+def _SecondDomainTrie():
+  """Return (and build, the first time) the trie of KNOWN_SECOND_DOMAINS."""
+  global _SECOND_DOMAIN_TRIE
+  if _SECOND_DOMAIN_TRIE is None:
+    trie = {}
+    for second_level in KNOWN_SECOND_DOMAINS:
+      node = trie
+      for label in reversed(second_level.lower().split('.')[1:]):
+        node = node.setdefault(label, {})
+      node[None] = True
+    _SECOND_DOMAIN_TRIE = trie
+  return _SECOND_DOMAIN_TRIE
+
+
 def GetDomainFromHostname(hostname):
-  """Get the domain part of a hostname."""
-  for second_level in KNOWN_SECOND_DOMAINS:
-    if hostname.lower().endswith(second_level):
-      custom_part = hostname.replace(second_level, '').split('.')[-1]
-      return '%s%s' % (custom_part, second_level)
+  """Get the domain part of a hostname.
 
-  return '.'.join(hostname.split('.')[-2:]).lower()
+  This is the label before the longest known second-level domain that the
+  hostname ends with (bbc.co.uk), or else its last two labels (google.com).
+  Lookups walk one trie node per label, however many domains are known.
+  """
+  labels = hostname.lower().split('.')
+  node = _SecondDomainTrie()
+  matched = 0
+  # Stop short of the first label: a known domain on its own has no custom part.
+  for depth in range(1, len(labels)):
+    node = node.get(labels[-depth])
+    if node is None:
+      break
+    if None in node:
+      matched = depth
+
+  if matched:
+    return '.'.join(labels[-matched - 1:])
+  return '.'.join(labels[-2:])
 
 def GetProviderPartOfHostname(hostname):
   """Get the custom patr of a hostname"""
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the addr_util module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import unittest
+
+import addr_util
+
+
+class AddrUtilTest(unittest.TestCase):
+  def testGetDomainFromHostname(self):
+    tests = {
+        'www.google.com': 'google.com',
+        'mail.Google.COM': 'google.com',
+        'news.bbc.co.uk': 'bbc.co.uk',
+        'www.BBC.CO.UK': 'bbc.co.uk',
+        'ns1.example.com.au': 'example.com.au',
+        # The longest known domain wins (.co.im and .ltd.co.im are both known).
+        'www.example.ltd.co.im': 'example.ltd.co.im',
+        'www.example.co.im': 'example.co.im',
+        'co.uk': 'co.uk',
+        'localhost': 'localhost',
+    }
+    for (hostname, domain) in tests.items():
+      self.assertEquals(addr_util.GetDomainFromHostname(hostname), domain)
+    self.assertEquals(addr_util.GetProviderPartOfHostname('resolver1.opendns.com'), 'opendns')
+
+
+if __name__ == '__main__':
+  unittest.main()
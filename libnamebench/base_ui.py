@@ -14,18 +14,29 @@
 
 """A base user-interface workflow, to be inherited by UI modules."""
 
+import os.path
+import random
 import tempfile
 
 import addr_util
 import benchmark
+import calibration
+import checkpoint
 import better_webbrowser
 import config
 import data_sources
 import geoip
+import kernel_timing
+import metrics_server
+import monitor
 import nameserver
+import phase_profiler
 import reporter
 import providers
+import query_trace
+import replay
 import site_connector
+import test_plan
 import util
 
 __author__ = 'tstromberg@google.com (Thomas Stromberg)'
@@ -49,9 +60,19 @@ class BaseUI(object):
     self.url = None
     self.share_state = None
     self.test_records = []
+    self.trace_writer = None
+    self.profiler = None
+    self.overhead = None
+    self.seed = None
+    self.kernel_timestamps = False
+    self.test_plan = None
+    self.checkpoint = None
+    self.metrics_server = None
+    self.replay_trace = None
 
   def UpdateStatus(self, msg, **kwargs):
     """Update the little status message on the bottom of the window."""
+    self.ReportProgress(msg, kwargs.get('count'), kwargs.get('total'))
     if hasattr(self, 'status_callback') and self.status_callback:
       self.status_callback(msg, **kwargs)
     else:
@@ -60,15 +81,141 @@ class BaseUI(object):
   def DebugMsg(self, message):
     self.UpdateStatus(message, debug=True)
 
+  def StartQueryTrace(self):
+    """Record every query we send, if the user asked for a trace file."""
+    if getattr(self.options, 'trace_file', None):
+      self.UpdateStatus('Recording query trace to %s' % self.options.trace_file)
+      self.trace_writer = query_trace.TraceWriter(self.options.trace_file)
+      self.trace_writer.Start()
+
+  def StopQueryTrace(self):
+    if self.trace_writer:
+      self.trace_writer.Close()
+      self.UpdateStatus('Saved %s query records to %s' % (self.trace_writer.record_count,
+                                                          self.trace_writer.path))
+      self.trace_writer = None
+
+  def StartMetricsServer(self):
+    """Serve live query metrics over HTTP, if the user asked for them."""
+    address = getattr(self.options, 'metrics_address', None)
+    if address:
+      (host, port) = metrics_server.ParseAddress(address)
+      self.metrics_server = metrics_server.MetricsServer(port, host=host)
+      self.metrics_server.start()
+      self.UpdateStatus('Serving metrics on http://%s:%s/metrics' % (host,
+                                                                    self.metrics_server.port))
+
+  def StopMetricsServer(self):
+    if self.metrics_server:
+      self.metrics_server.Stop()
+      self.metrics_server = None
+
+  def ReportProgress(self, msg, count, total):
+    """Pass progress of the current step to the metrics server."""
+    if getattr(self, 'metrics_server', None) and total:
+      self.metrics_server.collector.UpdateProgress(msg, count, total)
+
+  def StartProfiling(self):
+    """Record how much time, CPU and queries each phase of the run uses.
+
+    Live objects are only counted when profiles were asked for, as counting
+    them is slow.
+    """
+    profile_dir = getattr(self.options, 'profile_dir', None)
+    self.profiler = phase_profiler.PhaseProfiler(profile_dir=profile_dir,
+                                                 count_objects=bool(profile_dir))
+    if self.profiler.profile_dir:
+      self.UpdateStatus('Saving per-phase profiles to %s' % self.profiler.profile_dir)
+
+  def StopProfiling(self):
+    if self.profiler:
+      self.profiler.Close()
+
+  def InstrumentPhases(self, obj, method_names):
+    """Wrap the given methods of obj with the phase profiler, if enabled."""
+    if self.profiler:
+      self.profiler.Instrument(obj, method_names)
+
+  def PrepareTestPlan(self):
+    """Seed the random number generator, and load or start a test plan.
+
+    A plan holds the query order for every server and run, so one is only
+    recorded when it is going to be saved.
+    """
+    self.seed = getattr(self.options, 'seed', None)
+    load_path = getattr(self.options, 'load_plan', None)
+    if load_path:
+      self.UpdateStatus('Loading test plan from %s' % load_path)
+      self.test_plan = test_plan.Load(load_path)
+      if self.seed is None:
+        self.seed = self.test_plan.seed
+    elif getattr(self.options, 'save_plan', None):
+      self.test_plan = test_plan.TestPlan(seed=self.seed)
+
+    if self.seed is not None:
+      self.UpdateStatus('Using random seed %s' % self.seed)
+      random.seed(self.seed)
+
+  def PrepareCheckpoint(self):
+    """Start saving progress to a checkpoint, or resume from an existing one."""
+    path = getattr(self.options, 'checkpoint_file', None)
+    if not path:
+      return
+    self.checkpoint = checkpoint.Checkpoint(path)
+    if getattr(self.options, 'resume', False) and os.path.exists(path):
+      self.checkpoint.Load()
+    elif os.path.exists(path):
+      os.unlink(path)
+
+    if self.checkpoint.is_resuming:
+      self.UpdateStatus('Resuming benchmark from %s' % path)
+      # The checkpoint already supplies the query orders; a plan is only needed to save them.
+      if self.test_plan:
+        self.test_plan = self.checkpoint.CreateTestPlan()
+      self.seed = self.checkpoint.seed
+      if self.seed is not None:
+        random.seed(self.seed)
+    else:
+      self.UpdateStatus('Saving benchmark progress to %s' % path)
+
+  @property
+  def is_resuming(self):
+    return bool(self.checkpoint and self.checkpoint.is_resuming)
+
+  def ReportSourceCount(self, detail):
+    """Show the record count of a data source as soon as it has been counted."""
+    self.UpdateStatus('Found %s (%s records)' % (detail[1], detail[3]))
+
   def LoadDataSources(self):
     self.data_src = data_sources.DataSources(status_callback=self.UpdateStatus)
+    self.InstrumentPhases(self.data_src, phase_profiler.DATA_SOURCES_PHASES)
 
   def PrepareTestRecords(self):
     """Figure out what data source a user wants, and create test_records."""
+    replay_path = getattr(self.options, 'replay_file', None)
+    if replay_path:
+      self.UpdateStatus('Reading queries to replay from %s' % replay_path)
+      limit = data_sources.MAX_NON_UNIQUE_RECORD_COUNT
+      self.replay_trace = replay.LoadTrace(replay_path,
+                                           speedup=getattr(self.options, 'replay_speed', 1.0),
+                                           limit=limit)
+      if len(self.replay_trace) == limit:
+        self.UpdateStatus('Only replaying the first %s queries in %s' % (limit, replay_path))
+      self.test_records = [(x[1], x[2]) for x in self.replay_trace]
+      return
+
+    if self.is_resuming:
+      self.test_records = self.checkpoint.test_records
+      return
+
+    if self.test_plan and self.test_plan.test_records:
+      self.test_records = list(self.test_plan.test_records)
+      return
+
     if self.options.input_source:
       src_type = self.options.input_source
     else:
-      src_type = self.data_src.GetBestSourceDetails()[0]
+      src_type = self.data_src.GetBestSourceDetails(callback=self.ReportSourceCount)[0]
       self.options.input_source = src_type
 
     self.test_records = self.data_src.GetTestsFromSource(
@@ -76,6 +223,8 @@ class BaseUI(object):
         self.options.query_count,
         select_mode=self.options.select_mode
     )
+    if self.test_plan:
+      self.test_plan.test_records = list(self.test_records)
 
   def GatherNameServerData(self):
     """Build a nameserver data set from config and other sources."""
@@ -108,7 +257,24 @@ class BaseUI(object):
 
   def PrepareNameServers(self):
     """Setup self.nameservers to have a list of healthy fast servers."""
+    if self.is_resuming:
+      self.nameservers = self.checkpoint.CreateNameServers()
+      self.nameservers.status_callback = self.UpdateStatus
+      self.InstrumentPhases(self.nameservers, phase_profiler.NAMESERVERS_PHASES)
+      if self.seed is not None:
+        self.nameservers.SetRandomSeed(self.seed)
+      self.PrepareKernelTimestamps()
+      # Durations timed in two different ways can not be mixed in one result.
+      if self.kernel_timestamps != self.checkpoint.kernel_timestamps:
+        raise checkpoint.CheckpointError(
+            '%s was timed %s kernel timestamps: resume with the same -L setting' %
+            (self.checkpoint.path, ('without', 'with')[self.checkpoint.kernel_timestamps]))
+      return
+
     self.nameservers = self.GatherNameServerData()
+    self.InstrumentPhases(self.nameservers, phase_profiler.NAMESERVERS_PHASES)
+    if self.seed is not None:
+      self.nameservers.SetRandomSeed(self.seed)
     self.nameservers.max_servers_to_check = self.options.max_servers_to_check
     self.nameservers.thread_count = self.options.health_thread_count
     require_tags = set()
@@ -147,12 +313,26 @@ class BaseUI(object):
       self.UpdateStatus("Adding locality flags for servers within %skm of %s,%s" % (distance, lat, lon))
       self.nameservers.AddLocalityTags(max_distance=distance)
 
+    self.PrepareKernelTimestamps()
     self.nameservers.status_callback = self.UpdateStatus
     self.UpdateStatus("DNS server filter: %s %s" % (','.join(include_tags),
                                                     ','.join(require_tags)))
     self.nameservers.FilterByTag(include_tags=include_tags,
                                  require_tags=require_tags)
 
+  def PrepareKernelTimestamps(self):
+    """Time queries with kernel receive timestamps, if asked to and available."""
+    self.kernel_timestamps = False
+    if not getattr(self.options, 'kernel_timestamps', False):
+      return
+    if not kernel_timing.IsAvailable():
+      self.UpdateStatus('Kernel timestamps are not available on this platform.')
+      return
+    kernel_timing.Prepare()
+    for ns in self.nameservers:
+      ns.use_kernel_timestamps = True
+    self.kernel_timestamps = True
+
   def ConfiguredLocationData(self):
     self.DiscoverLocation()
     if self.options.country:
@@ -171,10 +351,16 @@ class BaseUI(object):
     return country_code, country_name, lat, lon
 
   def CheckNameServerHealth(self):
+    # A resumed benchmark uses the health check results it was started with.
+    if self.is_resuming:
+      return
     self.nameservers.SetTimeouts(self.options.timeout,
                                  self.options.ping_timeout,
                                  self.options.health_timeout)
-    self.nameservers.CheckHealth(sanity_checks=config.GetSanityChecks())
+    sanity_checks = config.GetSanityChecks()
+    self.nameservers.CheckHealth(sanity_checks=sanity_checks)
+    if self.options.enable_censorship_checks:
+      self.nameservers.CheckCensorship(sanity_checks)
 
   def PrepareBenchmark(self):
     """Setup the benchmark object with the appropriate dataset."""
@@ -183,11 +369,32 @@ class BaseUI(object):
     else:
       thread_count = self.options.benchmark_thread_count
 
-    self.bmark = benchmark.Benchmark(self.nameservers,
-                                     query_count=self.options.query_count,
-                                     run_count=self.options.run_count,
-                                     thread_count=thread_count,
-                                     status_callback=self.UpdateStatus)
+    if self.replay_trace:
+      # A replay is one pass over the capture, so there is nothing to resume.
+      if self.checkpoint:
+        self.UpdateStatus('Checkpoints are not used when replaying a capture')
+        self.checkpoint = None
+      self.bmark = replay.ReplayBenchmark(self.nameservers, self.replay_trace,
+                                          status_callback=self.UpdateStatus)
+    else:
+      self.bmark = benchmark.Benchmark(self.nameservers,
+                                       query_count=self.options.query_count,
+                                       run_count=self.options.run_count,
+                                       thread_count=thread_count,
+                                       status_callback=self.UpdateStatus,
+                                       test_plan=self.test_plan,
+                                       checkpoint=self.checkpoint,
+                                       seed=self.seed)
+    self.InstrumentPhases(self.bmark, phase_profiler.BENCHMARK_PHASES)
+
+    if self.checkpoint and not self.checkpoint.is_resuming:
+      self.checkpoint.WriteHeader(self.nameservers, self.test_records, seed=self.seed,
+                                  kernel_timestamps=self.kernel_timestamps)
+
+    if (getattr(self.options, 'calibrate_overhead', False) or
+        getattr(self.options, 'subtract_overhead', False)):
+      self.overhead = calibration.MeasureClientOverhead(thread_count=thread_count,
+                                                        status_callback=self.UpdateStatus)
 
   def RunBenchmark(self):
     """Run the benchmark."""
@@ -204,8 +411,39 @@ class BaseUI(object):
 
       self.DiscoverLocation()
 
+    if self.checkpoint:
+      self.checkpoint.Close()
+
+    if getattr(self.options, 'save_plan', None):
+      self.UpdateStatus('Saving test plan to %s' % self.options.save_plan)
+      self.test_plan.Save(self.options.save_plan)
+
+    subtract_overhead = getattr(self.options, 'subtract_overhead', False)
     self.reporter = reporter.ReportGenerator(self.options, self.nameservers,
-                                             results, index=index, geodata=self.geodata)
+                                             results, index=index, geodata=self.geodata,
+                                             profiler=self.profiler, overhead=self.overhead,
+                                             subtract_overhead=subtract_overhead,
+                                             histograms=self.bmark.histograms)
+    self.InstrumentPhases(self.reporter, phase_profiler.REPORTER_PHASES)
+
+  def RunMonitor(self):
+    """Benchmark the healthy nameservers at a low rate until interrupted."""
+    if self.options.output_file:
+      output_path = self.options.output_file
+    else:
+      output_path = util.GenerateOutputFilename('resolv.conf')
+    self.UpdateStatus('Monitoring %s servers, updating %s every %ss' %
+                      (len(self.nameservers.enabled_servers), output_path,
+                       self.options.monitor_interval))
+    daemon = monitor.Monitor(self.nameservers, self.test_records, output_path=output_path,
+                             sanity_checks=config.GetSanityChecks()['primary'],
+                             interval=self.options.monitor_interval,
+                             thread_count=self.options.benchmark_thread_count,
+                             status_callback=self.UpdateStatus)
+    try:
+      daemon.Run()
+    except KeyboardInterrupt:
+      self.UpdateStatus('Monitoring stopped.')
 
   def DiscoverLocation(self):
     if not getattr(self, 'geodata', None):
@@ -273,6 +511,14 @@ class BaseUI(object):
 
     self.UpdateStatus('Saving detailed results to %s' % self.csv_path)
     self.reporter.SaveResultsToCsv(self.csv_path)
+    percentiles_path = '%s_percentiles.csv' % os.path.splitext(self.csv_path)[0]
+    self.UpdateStatus('Saving response time percentiles to %s' % percentiles_path)
+    self.reporter.SavePercentilesToCsv(percentiles_path)
+
+    if self.profiler:
+      phases_path = '%s_phases.js' % os.path.splitext(self.csv_path)[0]
+      self.UpdateStatus('Saving phase timings to %s' % phases_path)
+      self.profiler.SaveJson(phases_path)
 
   def DisplayHtmlReport(self):
     self.UpdateStatus('Opening %s' % self.report_path)
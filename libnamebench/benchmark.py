@@ -24,6 +24,13 @@ import random
 import threading
 import time
 
+import latency_histogram
+import query_events
+
+# With checkpointing enabled, results are saved after every block of this
+# many queries to each nameserver.
+DEFAULT_BLOCK_SIZE = 25
+
 
 class BenchmarkThreads(threading.Thread):
   """Benchmark multiple nameservers in parallel."""
@@ -38,10 +45,6 @@ class BenchmarkThreads(threading.Thread):
     while not self.input.empty():
       try:
         (ns, request_type, hostname) = self.input.get_nowait()
-        # We've moved this here so that it's after all of the random selection goes through.
-        if '__RANDOM__' in hostname:
-          hostname = hostname.replace('__RANDOM__', str(random.random() * random.randint(0, 99999)))
-
         (response, duration, error_msg) = ns.TimedRequest(request_type, hostname)
         self.results.put((ns, request_type, hostname, response, duration, error_msg))
       except Queue.Empty:
@@ -52,7 +55,8 @@ class Benchmark(object):
   """The main benchmarking class."""
 
   def __init__(self, nameservers, run_count=2, query_count=30, thread_count=1,
-               status_callback=None):
+               status_callback=None, test_plan=None, checkpoint=None,
+               block_size=DEFAULT_BLOCK_SIZE, seed=None):
     """Constructor.
 
     Args:
@@ -61,13 +65,23 @@ class Benchmark(object):
       query_count: How many DNS lookups to test in each test-run (int)
       thread_count: How many benchmark threads to use (int)
       status_callback: Where to send msg() updates to.
+      test_plan: A TestPlan to replay from, and record query order into.
+      checkpoint: A Checkpoint to save progress to, and resume from.
+      block_size: How many queries per nameserver to run between checkpoints.
+      seed: Seed for the order and __RANDOM__ labels of each run (optional)
     """
     self.query_count = query_count
     self.run_count = run_count
     self.thread_count = thread_count
     self.nameservers = nameservers
     self.results = {}
+    # nameserver -> LatencyHistogram of every benchmark (not index) duration.
+    self.histograms = {}
     self.status_callback = status_callback
+    self.test_plan = test_plan
+    self.checkpoint = checkpoint
+    self.block_size = block_size
+    self.seed = seed
 
   def msg(self, msg, **kwargs):
     if self.status_callback:
@@ -106,7 +120,8 @@ class Benchmark(object):
       return None
 
     index_results, pending_tests = self._CheckForIndexHostsInResults(test_records)
-    run_results = self._SingleTestRun(pending_tests)
+    query_events.SetPhase('index')
+    run_results = self._SingleTestRun(pending_tests, run_name='index')
     for ns in run_results:
       index_results.setdefault(ns, []).extend(run_results[ns])
     return index_results
@@ -117,14 +132,57 @@ class Benchmark(object):
     # We don't want to keep stats on how many queries timed out from previous runs.
     for ns in self.nameservers.enabled_servers:
       ns.ResetErrorCounts()
+    if self.checkpoint:
+      self.checkpoint.RestoreErrorCounts(self.nameservers.enabled_servers)
 
-    for _ in range(self.run_count):
-      run_results = self._SingleTestRun(test_records)
+    query_events.SetPhase('benchmark')
+    for run_number in range(self.run_count):
+      run_results = self._SingleTestRun(test_records, run_name='run%s' % run_number)
       for ns in run_results:
         self.results.setdefault(ns, []).append(run_results[ns])
     return self.results
 
-  def _SingleTestRun(self, test_records):
+  def _GetTestOrder(self, run_name, ns, position, test_records, replaying=False):
+    """Decide which records to send to a nameserver, and in what order.
+
+    All randomness (the shuffle and __RANDOM__ labels) is resolved here, in
+    a single thread. With a seed, each run and nameserver gets a generator of
+    its own, so the order does not depend on what else used the random module.
+
+    Args:
+      run_name: name of this test run (used as a key in the test plan)
+      ns: NameServer object
+      position: index of the nameserver in this run
+      test_records: a list of tuples in the form of (request_type, hostname)
+      replaying: whether the test plan already had this run before it started
+
+    Returns:
+      A list of (request_type, hostname) tuples
+    """
+    if self.checkpoint and run_name in self.checkpoint.orders:
+      return dict(self.checkpoint.orders[run_name])[ns.ip]
+    if replaying:
+      planned = self.test_plan.GetRecords(run_name, ns.ip, position=position)
+      if planned:
+        return planned
+
+    if self.seed is None:
+      rng = random
+    else:
+      rng = random.Random('%s:%s:%s' % (self.seed, run_name, ns.ip))
+    test_records = list(test_records)
+    rng.shuffle(test_records)
+    records = []
+    for (request_type, hostname) in test_records:
+      if '__RANDOM__' in hostname:
+        hostname = hostname.replace('__RANDOM__', str(rng.random() * rng.randint(0, 99999)))
+      records.append((request_type, hostname))
+
+    if self.test_plan:
+      self.test_plan.SetRecords(run_name, ns.ip, records)
+    return records
+
+  def _SingleTestRun(self, test_records, run_name='run0'):
     """Manage and execute a single test-run on all nameservers.
 
     We used to run all tests for a nameserver, but the results proved to be
@@ -133,24 +191,73 @@ class Benchmark(object):
 
     Args:
       test_records: a list of tuples in the form of (request_type, hostname)
+      run_name: name of this test run (used as a key in the test plan)
 
     Returns:
       results: A dictionary of tuples, keyed by nameserver.
     """
-    input_queue = Queue.Queue()
     shuffled_records = {}
     results = {}
     # Pre-compute the shuffled test records per-nameserver to avoid thread
-    # contention.
-    for ns in self.nameservers.enabled_servers:
-      random.shuffle(test_records)
-      shuffled_records[ns.ip] = list(test_records)
+    # contention. A run that is being recorded must not hand the order of one
+    # server to the next, so only runs already in the plan are replayed.
+    replaying = bool(self.test_plan and self.test_plan.runs.get(run_name))
+    for (position, ns) in enumerate(self.nameservers.enabled_servers):
+      shuffled_records[ns.ip] = self._GetTestOrder(run_name, ns, position, test_records,
+                                                   replaying=replaying)
+
+    record_count = max([len(x) for x in shuffled_records.values()] or [0])
+    if self.checkpoint:
+      self.checkpoint.WriteOrder(run_name, [(ns.ip, shuffled_records[ns.ip])
+                                            for ns in self.nameservers.enabled_servers])
+      block_size = self.block_size
+    else:
+      block_size = record_count or 1
+
+    for (block_number, start) in enumerate(range(0, record_count, block_size)):
+      block_results = None
+      if self.checkpoint:
+        block_results = self.checkpoint.GetBlock(run_name, block_number,
+                                                 self.nameservers.enabled_servers)
+        if block_results is not None:
+          self.msg('Restored %s queries to %s servers from checkpoint' %
+                   (min(block_size, record_count - start), len(block_results)))
+      if block_results is None:
+        block_results = self._RunBlock(shuffled_records, start, start + block_size)
+        if self.checkpoint:
+          self.checkpoint.WriteBlock(run_name, block_number, block_results,
+                                     self.nameservers.enabled_servers)
+      for ns in block_results:
+        results.setdefault(ns, []).extend(block_results[ns])
+        if run_name != 'index':
+          self._AddToHistogram(ns, block_results[ns])
+    return results
+
+  def _AddToHistogram(self, ns, ns_results):
+    if ns not in self.histograms:
+      self.histograms[ns] = latency_histogram.LatencyHistogram()
+    for result in ns_results:
+      self.histograms[ns].Add(result[2])
+
+  def _RunBlock(self, shuffled_records, start, end):
+    """Send records start through end of each nameserver's test order.
+
+    Args:
+      shuffled_records: dictionary of nameserver IP -> list of test records
+      start: index of the first record to send
+      end: index after the last record to send
 
+    Returns:
+      results: A dictionary of tuples, keyed by nameserver.
+    """
+    input_queue = Queue.Queue()
+    results = {}
     # Feed the pre-computed records into the input queue.
-    for i in range(len(test_records)):
+    for i in range(start, end):
       for ns in self.nameservers.enabled_servers:
-        (request_type, hostname) = shuffled_records[ns.ip][i]
-        input_queue.put((ns, request_type, hostname))
+        if i < len(shuffled_records[ns.ip]):
+          (request_type, hostname) = shuffled_records[ns.ip][i]
+          input_queue.put((ns, request_type, hostname))
 
     results_queue = self._LaunchBenchmarkThreads(input_queue)
     errors = []
@@ -0,0 +1,164 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure how much of a measured duration is spent inside namebench itself.
+
+TimedRequest times query rendering, socket syscalls, response parsing and,
+with many benchmark threads, waiting for the GIL. Sending the same workload
+to a loopback responder with no configured latency tells us how large that
+client-side overhead is.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import os
+import Queue
+import tempfile
+
+# external dependencies (from nb_third_party)
+import simplejson
+
+import benchmark
+import dns_responder
+import nameserver
+import query_events
+import util
+
+DEFAULT_QUERY_COUNT = 250
+CALIBRATION_RECORD = ('A', 'a.root-servers.net.')
+
+
+def _Percentile(values, percent):
+  values = sorted(values)
+  index = int(round((len(values) - 1) * percent / 100.0))
+  return values[index]
+
+
+def _StartResponder(status_callback=None):
+  """Start a loopback responder, preferably in its own process.
+
+  A child process keeps the responder from competing with the benchmark
+  threads for the GIL, which would inflate the overhead we measure. If no
+  child process can be run at all, the responder runs in-process instead.
+
+  Args:
+    status_callback: Where to say that we had to fall back (optional)
+
+  Returns:
+    (port, function to call to stop the responder)
+
+  Raises:
+    dns_responder.ResponderError: if the child process died on startup.
+  """
+  (fd, config_path) = tempfile.mkstemp(suffix='.json')
+  os.write(fd, simplejson.dumps({'servers': {'127.0.0.1': {}}}))
+  os.close(fd)
+  try:
+    (child, port) = dns_responder.LaunchSubprocess(config_path)
+  except dns_responder.ResponderError:
+    os.unlink(config_path)
+    raise
+  except OSError, e:
+    os.unlink(config_path)
+    if status_callback:
+      status_callback('Unable to run a separate DNS responder (%s), so overhead is measured '
+                      'in-process and will read high' % e)
+    responder = dns_responder.DnsResponder()
+    responder.Start()
+    return (responder.port, responder.Stop)
+
+  def Stop():
+    child.terminate()
+    child.wait()
+    os.unlink(config_path)
+  return (port, Stop)
+
+
+def MeasureClientOverhead(thread_count=1, query_count=DEFAULT_QUERY_COUNT,
+                          status_callback=None):
+  """Benchmark a loopback responder at the given concurrency.
+
+  Args:
+    thread_count: How many benchmark threads to use (int)
+    query_count: How many queries to send (int)
+    status_callback: Where to send progress messages (optional)
+
+  Returns:
+    A dictionary with min, median and p90 overhead in milliseconds, as well as
+    the thread_count and count of answered queries, or None if nothing answered.
+  """
+  if status_callback:
+    status_callback('Measuring client overhead with %s threads' % thread_count)
+  query_events.SetPhase('calibration')
+  (port, stop_function) = _StartResponder(status_callback=status_callback)
+  try:
+    ns = nameserver.NameServer('127.0.0.1', name='calibration')
+    ns.port = port
+    ns.timeout = 2
+
+    input_queue = Queue.Queue()
+    for _ in range(query_count):
+      input_queue.put((ns, CALIBRATION_RECORD[0], CALIBRATION_RECORD[1]))
+    results_queue = Queue.Queue()
+    threads = []
+    for _ in range(thread_count):
+      thread = benchmark.BenchmarkThreads(input_queue, results_queue)
+      thread.start()
+      threads.append(thread)
+    for thread in threads:
+      thread.join()
+  finally:
+    stop_function()
+
+  durations = []
+  while results_queue.qsize():
+    (unused_ns, unused_type, unused_host, response, duration,
+     error_msg) = results_queue.get()
+    if response and not error_msg:
+      durations.append(duration)
+
+  if not durations:
+    return None
+  overhead = {'min': min(durations), 'median': _Percentile(durations, 50),
+              'p90': _Percentile(durations, 90), 'mean': util.CalculateListAverage(durations),
+              'thread_count': thread_count, 'count': len(durations)}
+  if status_callback:
+    status_callback('Client overhead: %.3fms median, %.3fms p90' % (overhead['median'],
+                                                                   overhead['p90']))
+  return overhead
+
+
+def SubtractOverhead(results, overhead_ms):
+  """Return a copy of benchmark results with overhead removed from durations.
+
+  Only answered queries are adjusted: failures are recorded as the timeout.
+
+  Args:
+    results: dictionary of results from Benchmark.Run()
+    overhead_ms: how many milliseconds to subtract (float)
+
+  Returns:
+    A dictionary in the same form as results.
+  """
+  adjusted = {}
+  for ns in results:
+    adjusted[ns] = []
+    for test_run in results[ns]:
+      run = []
+      for (hostname, request_type, duration, response, error_msg) in test_run:
+        if response and not error_msg:
+          duration = max(duration - overhead_ms, 0.0)
+        run.append((hostname, request_type, duration, response, error_msg))
+      adjusted[ns].append(run)
+  return adjusted
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the calibration module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import unittest
+
+import calibration
+import dns_responder
+import mocks
+
+
+def FailToLaunch(error):
+  def Launch(unused_config_path):
+    raise error
+  return Launch
+
+
+class CalibrationTest(unittest.TestCase):
+  def testMeasureClientOverhead(self):
+    overhead = calibration.MeasureClientOverhead(thread_count=2, query_count=40)
+    self.assertEquals(overhead['thread_count'], 2)
+    self.assertEquals(overhead['count'], 40)
+    self.assertTrue(0 < overhead['min'] <= overhead['median'] <= overhead['p90'])
+
+  def testFallBackInProcess(self):
+    messages = []
+    launch = dns_responder.LaunchSubprocess
+    dns_responder.LaunchSubprocess = FailToLaunch(OSError('no interpreter'))
+    try:
+      overhead = calibration.MeasureClientOverhead(query_count=10,
+                                                   status_callback=messages.append)
+      self.assertEquals(overhead['count'], 10)
+      self.assertTrue([x for x in messages if 'in-process' in x], messages)
+
+      # A child that dies on startup is an error, not a reason to fall back.
+      dns_responder.LaunchSubprocess = FailToLaunch(dns_responder.ResponderError('died'))
+      self.assertRaises(dns_responder.ResponderError, calibration.MeasureClientOverhead,
+                        query_count=10)
+    finally:
+      dns_responder.LaunchSubprocess = launch
+
+  def testSubtractOverhead(self):
+    ns = mocks.MockNameServer(mocks.GOOD_IP)
+    response = ns.FakeAnswer(None)
+    results = {ns: [[('www.google.com.', 'A', 3.5, response, None),
+                     ('www.paypal.com.', 'A', 0.2, response, None),
+                     ('www.yahoo.com.', 'A', 5000, None, 'Timeout')]]}
+    adjusted = calibration.SubtractOverhead(results, 0.5)
+    self.assertEquals([x[2] for x in adjusted[ns][0]], [3.0, 0.0, 5000])
+    self.assertEquals(results[ns][0][0][2], 3.5)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -163,36 +163,55 @@ def _MakeCumulativeDistribution(run_data, x_chunk=1.5, percent_chunk=3.5):
   We chunk the data together to intelligently minimize the number of points
   that need to be passed to the Google Chart API later (URL limitation!)
   """
-  # TODO(tstromberg): Use a more efficient algorithm. Pop values out each iter?
   dist = []
   for (ns, results) in run_data:
     if not results:
       continue
-    
-    host_dist = [(0, 0)]
-    max_result = max(results)
-    chunk_max = min(results)
-    # Why such a low value? To make sure the delta for the first coordinate is
-    # always >percent_chunk. We always want to store the first coordinate.
-    last_percent = -99
-
-    while chunk_max < max_result:
-      values = [x for x in results if x <= chunk_max]
-      percent = float(len(values)) / float(len(results)) * 100
-
-      if (percent - last_percent) > percent_chunk:
-        host_dist.append((percent, max(values)))
-        last_percent = percent
-
-      # TODO(tstromberg): Think about using multipliers to degrade precision.
-      chunk_max += x_chunk
-
-    # Make sure the final coordinate is exact.
-    host_dist.append((100, max_result))
-    dist.append((ns, host_dist))
+    dist.append((ns, _SortedCumulativeDistribution(sorted(results), x_chunk, percent_chunk)))
   return dist
 
 
+def _SortedCumulativeDistribution(ordered, x_chunk=1.5, percent_chunk=3.5):
+  """Generate the cumulative distribution for a single sorted list of durations.
+
+  Args:
+    ordered: a sorted, non-empty list of query durations
+    x_chunk: How much value should be chunked together on the x-axis
+    percent_chunk: How much percentage should be chunked together on y-axis.
+
+  Returns:
+    A list of (percentage, time) tuples.
+
+  The chunk boundary walks from the fastest to the slowest duration in steps
+  of x_chunk, while a single index sweeps forward over the sorted durations,
+  so each duration is only looked at once.
+  """
+  host_dist = [(0, 0)]
+  total = float(len(ordered))
+  max_result = ordered[-1]
+  chunk_max = ordered[0]
+  # Why such a low value? To make sure the delta for the first coordinate is
+  # always >percent_chunk. We always want to store the first coordinate.
+  last_percent = -99
+  below = 0
+
+  while chunk_max < max_result:
+    while ordered[below] <= chunk_max:
+      below += 1
+    percent = below / total * 100
+
+    if (percent - last_percent) > percent_chunk:
+      host_dist.append((percent, ordered[below - 1]))
+      last_percent = percent
+
+    # TODO(tstromberg): Think about using multipliers to degrade precision.
+    chunk_max += x_chunk
+
+  # Make sure the final coordinate is exact.
+  host_dist.append((100, max_result))
+  return host_dist
+
+
 def _MaximumRunDuration(run_data):
   """For a set of run data, return the longest duration.
 
@@ -219,13 +238,26 @@ def _SortDistribution(a, b):
   return cmp(a[0].name, b[0].name)
 
 
-def DistributionLineGraph(run_data, scale=None, sort_by=None):
-  """Return a Google Chart API URL showing duration distribution per ns."""
+def DistributionLineGraph(run_data, scale=None, sort_by=None, distribution=None):
+  """Return a Google Chart API URL showing duration distribution per ns.
+
+  Args:
+    run_data: a tuple of nameserver and query durations
+    scale: maximum duration (ms) to show
+    sort_by: cmp function for the distributions
+    distribution: output of _MakeCumulativeDistribution, if already known.
+      When given, run_data is not needed: the same distribution can then be
+      used for charts at several scales.
+
+  Returns:
+    A Google Chart API URL
+  """
 
   # TODO(tstromberg): Rewrite this method using graphy. Graphy does not
   # support setting explicit x values for line graphs, which makes things
   # difficult.
-  distribution = _MakeCumulativeDistribution(run_data)
+  if distribution is None:
+    distribution = _MakeCumulativeDistribution(run_data)
   datasets = []
   labels = []
   # TODO(tstromberg): Find a way to make colors consistent between runs.
@@ -234,7 +266,11 @@ def DistributionLineGraph(run_data, scale=None, sort_by=None):
   if not sort_by:
     sort_by = _SortDistribution
 
-  max_value = _MaximumRunDuration(run_data)
+  if run_data:
+    max_value = _MaximumRunDuration(run_data)
+  else:
+    # The last point of each distribution is its slowest duration.
+    max_value = max([xy_pairs[-1][1] for (unused_ns, xy_pairs) in distribution])
   if not scale:
     scale = max_value
   elif scale < max_value:
@@ -17,6 +17,7 @@
 
 __author__ = 'tstromberg@google.com (Thomas Stromberg)'
 
+import random
 import unittest
 import nameserver
 import charts
@@ -35,6 +36,22 @@ def _ExampleRunsData():
   return data
 
 
+def _SlowCumulativeDistribution(results, x_chunk=1.5, percent_chunk=3.5):
+  """The original quadratic algorithm, which the sweep must match exactly."""
+  host_dist = [(0, 0)]
+  chunk_max = min(results)
+  last_percent = -99
+  while chunk_max < max(results):
+    values = [x for x in results if x <= chunk_max]
+    percent = float(len(values)) / float(len(results)) * 100
+    if (percent - last_percent) > percent_chunk:
+      host_dist.append((percent, max(values)))
+      last_percent = percent
+    chunk_max += x_chunk
+  host_dist.append((100, max(results)))
+  return host_dist
+
+
 # TODO(tstromberg): Clean up long lines, cleanse IP/hostnames.
 class ChartFunctionsTest(unittest.TestCase):
   def testDarkenHexColorCode(self):
@@ -110,6 +127,22 @@ class DistributionChartTests(unittest.TestCase):
           (96.666666666666671, 594.0), (100, 773.0)])]
     self.assertEquals(charts._MakeCumulativeDistribution(runs_data), expected)
 
+  def testSweepMatchesQuadratic(self):
+    rng = random.Random(40)
+    results = [rng.uniform(0.1, 0.9) for _ in range(50)] + [rng.lognormvariate(3, 1) for _ in range(400)]
+    results += [3500.0, 3500.0, 0.31]
+    self.assertEquals(charts._MakeCumulativeDistribution([('ns', results)], percent_chunk=0.5),
+                      [('ns', _SlowCumulativeDistribution(results, percent_chunk=0.5))])
+    self.assertEquals(charts._MakeCumulativeDistribution([('ns', [12.0])]),
+                      [('ns', [(0, 0), (100, 12.0)])])
+
+  def testPrecomputedDistribution(self):
+    runs_data = _ExampleRunsData()
+    distribution = charts._MakeCumulativeDistribution(runs_data)
+    for scale in (200, 3500):
+      self.assertEquals(charts.DistributionLineGraph(None, scale=scale, distribution=distribution),
+                        charts.DistributionLineGraph(runs_data, scale=scale))
+
   def testDistributionLineGraph(self):
     runs_data = _ExampleRunsData()
     url = charts.DistributionLineGraph(runs_data, scale=350)
@@ -0,0 +1,239 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Checkpoint benchmark progress to disk, so that long runs can be resumed.
+
+A checkpoint is an append-only file with one JSON record per line:
+
+  header: the test records and the nameservers that passed health checks
+  order:  the queries planned for each nameserver in a benchmark run
+  block:  the results of one completed block of queries, and error counters
+
+Each record is flushed to disk as soon as it is written. If namebench dies
+half way through writing a line, that line is ignored when resuming, and
+the block it described is simply run again.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import base64
+import os
+
+# external dependencies (from nb_third_party)
+import dns.message
+import simplejson
+
+import nameserver
+import nameserver_list
+import test_plan
+
+CHECKPOINT_VERSION = 1
+
+# Constructor arguments and attributes restored for each nameserver.
+NAMESERVER_ARGS = ('ip', 'name', 'provider', 'instance', 'location', 'latitude', 'longitude',
+                   'asn', 'network_owner', 'dhcp_position', 'system_position')
+NAMESERVER_ATTRIBUTES = ('port', 'timeout', 'health_timeout', 'ping_timeout', 'is_slower_replica',
+                         'failed_test_count', 'share_check_count', 'disabled_msg', '_hostname',
+                         '_version')
+
+
+class CheckpointError(Exception):
+  pass
+
+
+def _EncodeResponse(response):
+  if response:
+    return base64.b64encode(response.to_wire())
+  return None
+
+
+def _DecodeResponse(data):
+  if data:
+    return dns.message.from_wire(base64.b64decode(data))
+  return None
+
+
+def _ToRecords(items):
+  return [(str(request_type), str(hostname)) for (request_type, hostname) in items]
+
+
+def _ToStr(value):
+  if isinstance(value, unicode):
+    return str(value)
+  return value
+
+
+class Checkpoint(object):
+  """Record benchmark progress, and the progress of a previous attempt."""
+
+  def __init__(self, path):
+    self.path = path
+    self.header = None
+    self.orders = {}
+    # Blocks completed by the previous attempt. Those we write are not kept,
+    # as Benchmark.results already holds them.
+    self.blocks = {}
+    self.counters = {}
+    self._file = None
+
+  @property
+  def is_resuming(self):
+    """Did a previous attempt get as far as benchmarking?"""
+    return bool(self.header)
+
+  @property
+  def seed(self):
+    """The random seed of the attempt, if any."""
+    return self.header and self.header['seed']
+
+  @property
+  def test_records(self):
+    """The (request_type, hostname) records the attempt was benchmarking."""
+    return _ToRecords(self.header['test_records'])
+
+  @property
+  def kernel_timestamps(self):
+    """Were queries timed with kernel receive timestamps?"""
+    return bool(self.header and self.header.get('kernel_timestamps'))
+
+  def _Write(self, record):
+    if not self._file:
+      self._file = open(self.path, 'a')
+    self._file.write(simplejson.dumps(record, separators=(',', ':')) + '\n')
+    self._file.flush()
+    os.fsync(self._file.fileno())
+
+  def Close(self):
+    if self._file:
+      self._file.close()
+      self._file = None
+
+  def Load(self):
+    """Read the records left behind by a previous attempt."""
+    complete_length = 0
+    for line in open(self.path, 'rb'):
+      if not line.endswith('\n'):
+        # A partially written line, from when we were interrupted.
+        break
+      complete_length += len(line)
+      try:
+        record = simplejson.loads(line)
+      except ValueError:
+        continue
+      if record['type'] == 'header':
+        if record.get('version') != CHECKPOINT_VERSION:
+          raise CheckpointError('%s is not a version %s checkpoint' % (self.path, CHECKPOINT_VERSION))
+        self.header = record
+      elif record['type'] == 'order':
+        self.orders[str(record['run'])] = [(str(ip), _ToRecords(records))
+                                           for (ip, records) in record['servers']]
+      elif record['type'] == 'block':
+        self.blocks.setdefault(str(record['run']), {})[record['block']] = record['results']
+        self.counters = record['counters']
+
+    # Drop any partial line, so that the records we append start on a line of their own.
+    if os.path.getsize(self.path) > complete_length:
+      f = open(self.path, 'r+b')
+      f.truncate(complete_length)
+      f.close()
+
+  def WriteHeader(self, nameservers, test_records, seed=None, kernel_timestamps=False):
+    """Record the state we need to skip straight to benchmarking."""
+    servers = []
+    for ns in nameservers:
+      data = {'tags': sorted(ns.tags), 'warnings': sorted(ns.warnings),
+              'checks': ns.checks, 'shared_with': sorted([x.ip for x in ns.shared_with]),
+              'node_ids': sorted(ns._node_ids)}
+      for key in NAMESERVER_ARGS + NAMESERVER_ATTRIBUTES:
+        data[key] = getattr(ns, key, None)
+      servers.append(data)
+    self.header = {'type': 'header', 'version': CHECKPOINT_VERSION, 'seed': seed,
+                   'kernel_timestamps': kernel_timestamps, 'test_records': test_records,
+                   'servers': servers}
+    self._Write(self.header)
+
+  def WriteOrder(self, run_name, orders):
+    """Record the (ip, [(request_type, hostname), ...]) list planned for a run."""
+    if run_name in self.orders:
+      return
+    self.orders[run_name] = orders
+    self._Write({'type': 'order', 'run': run_name, 'servers': orders})
+
+  def WriteBlock(self, run_name, block_number, results, nameservers):
+    """Record the results of a block of queries.
+
+    Args:
+      run_name: name of the benchmark run (str)
+      block_number: index of the block within the run (int)
+      results: dictionary of nameserver -> [(hostname, request_type, duration,
+        response, error_msg), ...]
+      nameservers: the nameservers being benchmarked, for their error counters
+    """
+    rows = []
+    for ns in results:
+      for (hostname, request_type, duration, response, error_msg) in results[ns]:
+        rows.append((ns.ip, hostname, request_type, duration, _EncodeResponse(response),
+                     error_msg))
+    self.counters = {}
+    for ns in nameservers:
+      self.counters[ns.ip] = (ns.request_count, ns.failure_count, ns.error_map)
+    self._Write({'type': 'block', 'run': run_name, 'block': block_number, 'results': rows,
+                 'counters': self.counters})
+
+  def GetBlock(self, run_name, block_number, nameservers):
+    """Return the results of a completed block, or None if it must be run.
+
+    Returns:
+      A dictionary in the same form as the results argument to WriteBlock.
+    """
+    # Once handed over, the results are kept by the benchmark instead.
+    rows = self.blocks.get(run_name, {}).pop(block_number, None)
+    if rows is None:
+      return None
+    by_ip = dict([(ns.ip, ns) for ns in nameservers])
+    results = {}
+    for (ip, hostname, request_type, duration, response, error_msg) in rows:
+      results.setdefault(by_ip[ip], []).append((str(hostname), str(request_type), duration,
+                                                _DecodeResponse(response), _ToStr(error_msg)))
+    return results
+
+  def RestoreErrorCounts(self, nameservers):
+    """Restore the error counters as of the last completed block."""
+    for ns in nameservers:
+      if ns.ip in self.counters:
+        (ns.request_count, ns.failure_count, error_map) = self.counters[ns.ip]
+        ns.error_map = dict([(str(x), y) for (x, y) in error_map.items()])
+
+  def CreateNameServers(self):
+    """Rebuild the nameservers, as they were after health checks."""
+    servers = nameserver_list.NameServers()
+    for data in self.header['servers']:
+      kwargs = dict([(key, _ToStr(data[key])) for key in NAMESERVER_ARGS])
+      ns = nameserver.NameServer(tags=[str(x) for x in data['tags']], **kwargs)
+      for key in NAMESERVER_ATTRIBUTES:
+        setattr(ns, key, _ToStr(data[key]))
+      ns.warnings = set([str(x) for x in data['warnings']])
+      ns.checks = [tuple([_ToStr(x) for x in check]) for check in data['checks']]
+      ns._node_ids = set([str(x) for x in data['node_ids']])
+      servers.append(ns)
+
+    for data in self.header['servers']:
+      ns = servers._GetObjectForIP(data['ip'])
+      ns.shared_with = set([servers._GetObjectForIP(ip) for ip in data['shared_with']])
+    return servers
+
+  def CreateTestPlan(self):
+    """Return a TestPlan that repeats the queries of the previous attempt."""
+    return test_plan.TestPlan(seed=self.seed, test_records=self.test_records,
+                              runs=dict(self.orders))
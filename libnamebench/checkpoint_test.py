@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the checkpoint module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import optparse
+import os
+import random
+import tempfile
+import unittest
+
+import base_ui
+import benchmark
+import checkpoint
+import kernel_timing
+import mocks
+import nameserver_list
+import query_events
+
+TEST_RECORDS = [('A', 'www.paypal.com.'), ('A', 'www.yahoo.com.'), ('MX', 'google.com.'),
+                ('A', 'cache-__RANDOM__.live.com.'), ('AAAA', 'ipv6.google.com.')]
+
+
+def CreateNameServers():
+  servers = nameserver_list.NameServers()
+  for ip in (mocks.GOOD_IP, mocks.PERFECT_IP):
+    ns = mocks.MockNameServer(ip, name='NS-%s' % ip)
+    ns.warnings.add('Slow')
+    ns.checks.append(('ping', False, None, 12.5))
+    servers.append(ns)
+  return servers
+
+
+def Summarize(results):
+  """Return sorted (ip, request_type, hostname, answered) tuples for each run."""
+  runs = []
+  for ns in results:
+    for (run_number, test_run) in enumerate(results[ns]):
+      while len(runs) <= run_number:
+        runs.append([])
+      runs[run_number].extend([(ns.ip, x[1], x[0], bool(x[3])) for x in test_run])
+  return [sorted(x) for x in runs]
+
+
+class CheckpointTest(unittest.TestCase):
+  def setUp(self):
+    (fd, self.path) = tempfile.mkstemp()
+    os.close(fd)
+    os.unlink(self.path)
+    self.sent = []
+    query_events.AddListener(self.RecordQuery)
+
+  def tearDown(self):
+    query_events.RemoveListener(self.RecordQuery)
+    if os.path.exists(self.path):
+      os.unlink(self.path)
+
+  def RecordQuery(self, phase, ip, *unused_args):
+    self.sent.append(ip)
+
+  def RunBenchmark(self, servers, ckpt):
+    bmark = benchmark.Benchmark(servers, run_count=2, thread_count=2, checkpoint=ckpt,
+                                block_size=2)
+    return bmark.Run(list(TEST_RECORDS))
+
+  def testResume(self):
+    servers = CreateNameServers()
+    ckpt = checkpoint.Checkpoint(self.path)
+    ckpt.WriteHeader(servers, TEST_RECORDS, seed=5)
+    original = self.RunBenchmark(servers, ckpt)
+    ckpt.Close()
+    self.assertEquals(len(self.sent), 20)
+    # What was written is on disk, not kept in memory as well.
+    self.assertEquals(ckpt.blocks, {})
+
+    # Pretend we were interrupted while writing the second block of run1:
+    # header, run0 (order + 3 blocks), run1 (order + 1 block), partial line.
+    lines = open(self.path).readlines()
+    self.assertEquals(len(lines), 9)
+    f = open(self.path, 'w')
+    f.write(''.join(lines[0:7]) + lines[7][0:20])
+    f.close()
+
+    self.sent = []
+    resumed = checkpoint.Checkpoint(self.path)
+    resumed.Load()
+    self.assertTrue(resumed.is_resuming)
+    self.assertEquals(sorted(resumed.blocks['run1'].keys()), [0])
+    results = self.RunBenchmark(CreateNameServers(), resumed)
+    resumed.Close()
+
+    # Only the last two blocks of run1 (3 records to 2 servers) are re-sent.
+    self.assertEquals(len(self.sent), 6)
+    self.assertEquals(Summarize(results), Summarize(original))
+    for ns in results:
+      self.assertEquals(ns.request_count, 10)
+
+  def testResumeTwice(self):
+    servers = CreateNameServers()
+    ckpt = checkpoint.Checkpoint(self.path)
+    ckpt.WriteHeader(servers, TEST_RECORDS, seed=5)
+    original = self.RunBenchmark(servers, ckpt)
+    ckpt.Close()
+
+    # Interrupted twice, each time while writing the last block of run1.
+    for unused_attempt in range(2):
+      data = open(self.path).read()
+      f = open(self.path, 'w')
+      f.write(data[:data.rindex('\n', 0, -1) + 20])
+      f.close()
+
+      self.sent = []
+      resumed = checkpoint.Checkpoint(self.path)
+      resumed.Load()
+      self.assertEquals(sorted(resumed.blocks['run1'].keys()), [0, 1])
+      results = self.RunBenchmark(CreateNameServers(), resumed)
+      resumed.Close()
+      # Only the last block of run1 (1 record to 2 servers) is re-sent.
+      self.assertEquals(len(self.sent), 2)
+      self.assertEquals(Summarize(results), Summarize(original))
+
+    loaded = checkpoint.Checkpoint(self.path)
+    loaded.Load()
+    self.assertEquals(sorted(loaded.blocks['run1'].keys()), [0, 1, 2])
+    self.assertEquals(len(open(self.path).readlines()), 9)
+
+  def ResumeUI(self, **options):
+    ui = base_ui.BaseUI()
+    ui.options = optparse.Values(dict(checkpoint_file=self.path, resume=True, **options))
+    ui.PrepareTestPlan()
+    ui.PrepareCheckpoint()
+    return ui
+
+  def testResumeSettings(self):
+    ckpt = checkpoint.Checkpoint(self.path)
+    ckpt.WriteHeader(CreateNameServers(), TEST_RECORDS, seed=5, kernel_timestamps=True)
+    ckpt.Close()
+
+    # Timings taken without kernel timestamps can not be mixed in.
+    ui = self.ResumeUI(kernel_timestamps=False)
+    self.assertTrue(ui.checkpoint.kernel_timestamps)
+    # No plan is recorded unless it is to be saved.
+    self.assertEquals((ui.test_plan, ui.seed), (None, 5))
+    ui.PrepareTestRecords()
+    self.assertEquals(ui.test_records, TEST_RECORDS)
+    ui = self.ResumeUI(save_plan=self.path + '.plan')
+    self.assertEquals((ui.test_plan.seed, ui.test_plan.test_records), (5, TEST_RECORDS))
+    self.assertRaises(checkpoint.CheckpointError, ui.PrepareNameServers)
+
+    if kernel_timing.IsAvailable():
+      ui = self.ResumeUI(kernel_timestamps=True)
+      ui.PrepareNameServers()
+      for ns in ui.nameservers:
+        self.assertTrue(ns.use_kernel_timestamps)
+        # The seed from the checkpoint applies to the restored servers too.
+        self.assertEquals(ns.rng.random(), random.Random('5/%s' % ns.ip).random())
+
+  def testCreateNameServers(self):
+    servers = CreateNameServers()
+    servers[0].shared_with.add(servers[1])
+    servers[1].DisableWithMessage('Too slow')
+    ckpt = checkpoint.Checkpoint(self.path)
+    ckpt.WriteHeader(servers, TEST_RECORDS, seed=5)
+    ckpt.Close()
+
+    loaded = checkpoint.Checkpoint(self.path)
+    loaded.Load()
+    restored = loaded.CreateNameServers()
+    self.assertEquals([x.ip for x in restored.enabled_servers], [mocks.GOOD_IP])
+    self.assertEquals(restored[0].name, 'NS-%s' % mocks.GOOD_IP)
+    self.assertEquals(restored[0].warnings, set(['Slow']))
+    self.assertEquals(restored[0].check_average, 12.5)
+    self.assertEquals([x.ip for x in restored[0].shared_with], [mocks.PERFECT_IP])
+    self.assertEquals(restored[1].disabled_msg, 'Too slow')
+    plan = loaded.CreateTestPlan()
+    self.assertEquals(plan.seed, 5)
+    self.assertEquals(plan.test_records, TEST_RECORDS)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -26,8 +26,12 @@ import math
 import sys
 
 import base_ui
+import checkpoint
 import conn_quality
+import dns_responder
 import nameserver_list
+import pcap_reader
+import replay
 
 
 class NameBenchCli(base_ui.BaseUI):
@@ -41,6 +45,7 @@ class NameBenchCli(base_ui.BaseUI):
 
   def UpdateStatus(self, msg, count=None, total=None, error=False, debug=False):
     """Status updates for the command-line. A lot of voodoo here."""
+    self.ReportProgress(msg, count, total)
     if self.last_msg == (msg, count, total, error):
       return None
 
@@ -107,8 +112,13 @@ class NameBenchCli(base_ui.BaseUI):
       print "For more assistance, get help via namebench.py -h"
       sys.exit(1)
 
-    self.PrepareNameServers()
+    self.StartQueryTrace()
+    self.StartMetricsServer()
+    self.StartProfiling()
+    self.PrepareTestPlan()
+    self.PrepareCheckpoint()
     try:
+      self.PrepareNameServers()
       self.LoadDataSources()
       self.PrepareTestRecords()
       print '-' * 78
@@ -122,13 +132,26 @@ class NameBenchCli(base_ui.BaseUI):
       print ''
 
       print ''
-      self.PrepareBenchmark()
-      self.RunAndOpenReports()
+      if self.options.monitor:
+        self.RunMonitor()
+      else:
+        self.PrepareBenchmark()
+        self.RunAndOpenReports()
     except (nameserver_list.OutgoingUdpInterception,
             nameserver_list.TooFewNameservers,
-            conn_quality.OfflineConnection):
+            conn_quality.OfflineConnection,
+            checkpoint.CheckpointError,
+            dns_responder.ResponderError,
+            replay.ReplayError,
+            pcap_reader.CaptureError):
       (exc_type, exception) = sys.exc_info()[0:2]
+      self.StopQueryTrace()
+      self.StopMetricsServer()
+      self.StopProfiling()
       self.UpdateStatus("%s - %s" % (exc_type, exception), error=True)
+    self.StopQueryTrace()
+    self.StopMetricsServer()
+    self.StopProfiling()
 
 
 
@@ -77,9 +77,15 @@ def ParseCommandLineArguments(default_config_file='config/namebench.cfg'):
   parser = optparse.OptionParser()
   parser.add_option('-6', '--ipv6_only', dest='ipv6_only', action='store_true', help='Only include IPv6 name servers')
   parser.add_option('-4', '--ipv4_only', dest='ipv4_only', action='store_true', help='Only include IPv4 name servers')
+  parser.add_option('-A', '--replay_speed', dest='replay_speed', default=1.0, type='float', help='How many times faster than real time to replay a capture (-X)')
+  parser.add_option('-B', '--metrics_address', dest='metrics_address', default=None, help='Serve live OpenMetrics on [host:]port (host defaults to 127.0.0.1)')
   parser.add_option('-b', '--censorship-checks', dest='enable_censorship_checks', action='store_true', help='Enable censorship checks')
+  parser.add_option('-C', '--calibrate', dest='calibrate_overhead', action='store_true', help='Measure client-side overhead against a loopback responder')
   parser.add_option('-c', '--country', dest='country', default=None, help='Set country (overrides GeoIP)')
+  parser.add_option('-D', '--profile_dir', dest='profile_dir', default=None, help='Save cProfile statistics for each phase of the run to this directory')
   parser.add_option('-H', '--skip-health-checks', dest='skip_health_checks', action='store_true', default=False, help='Skip health checks')
+  parser.add_option('-E', '--seed', dest='seed', type='int', default=None, help='Seed for the random number generator, for repeatable runs')
+  parser.add_option('-F', '--checkpoint_file', dest='checkpoint_file', default=None, help='Save benchmark progress to this file as it runs')
   parser.add_option('-G', '--hide_results', dest='hide_results', action='store_true',  help='Upload results, but keep them hidden from indexes.')
   parser.add_option('-i', '--input', dest='input_source', help=('Import hostnames from an filename or application (%s)' % ', '.join(import_types)))
   parser.add_option('-I', '--ips', dest='servers', default=[], help='A list of ips to test (can also be passed as arguments)')
@@ -87,24 +93,33 @@ def ParseCommandLineArguments(default_config_file='config/namebench.cfg'):
   parser.add_option('-J', '--benchmark_threads', dest='benchmark_thread_count', type='int', help='# of benchmark threads to use')
   parser.add_option('-k', '--distance_km', dest='distance', default=1250, help='Distance in km for determining if server is nearby')
   parser.add_option('-K', '--overload_distance_km', dest='overload_distance', default=250, help='Like -k, but used if the country already has >350 servers.')
-  parser.add_option('-m', '--select_mode', dest='select_mode', default='automatic', help='Selection algorithm to use (weighted, random, chunk)')
+  parser.add_option('-l', '--load_plan', dest='load_plan', default=None, help='Replay the queries from a saved test plan file')
+  parser.add_option('-L', '--kernel_timestamps', dest='kernel_timestamps', action='store_true', help='Time queries with kernel receive timestamps (Linux only)')
+  parser.add_option('-m', '--select_mode', dest='select_mode', default='automatic', help='Selection algorithm to use (weighted, popularity, random, chunk)')
   parser.add_option('-M', '--max_servers_to_check', dest='max_servers_to_check', default=350, help='Maximum number of servers to inspect')
   parser.add_option('-n', '--num_servers', dest='num_servers', type='int', help='Number of nameservers to include in test')
+  parser.add_option('-N', '--monitor_interval', dest='monitor_interval', default=60, type='float', help='Seconds between benchmark rounds in monitor mode')
   parser.add_option('-o', '--output', dest='output_file', default=None, help='Filename to write output to')
   parser.add_option('-O', '--csv_output', dest='csv_file', default=None, help='Filename to write query details to (CSV)')
   parser.add_option('-p', '--psn')   # Silly Mac OS X adding -psn_0_xxxx
   parser.add_option('-P', '--ping_timeout', dest='ping_timeout', type='float', help='# of seconds ping requests timeout in.')
   parser.add_option('-q', '--query_count', dest='query_count', type='int', help='Number of queries per run.')
   parser.add_option('-r', '--runs', dest='run_count', default=1, type='int', help='Number of test runs to perform on each nameserver.')
+  parser.add_option('-R', '--resume', dest='resume', action='store_true', help='Resume an interrupted benchmark from CHECKPOINT_FILE')
   parser.add_option('-s', '--sets', dest='server_sets', default=[], help='Comma-separated list of sets to test (%s)' % SETS_TO_TAGS_MAP.keys())
+  parser.add_option('-t', '--trace_file', dest='trace_file', default=None, help='Record every query sent to a binary trace file')
+  parser.add_option('-S', '--subtract_overhead', dest='subtract_overhead', action='store_true', help='Subtract measured client-side overhead from reported durations (implies -C)')
   parser.add_option('-T', '--template', dest='template', default='html', help='Template to use for output generation (ascii, html, resolv.conf)')
   parser.add_option('-U', '--site_url', dest='site_url', help='URL to upload results to (http://namebench.appspot.com/)')
   parser.add_option('-u', '--upload_results', dest='upload_results', action='store_true', help='Upload anonymized results to SITE_URL (False)')
   parser.add_option('-V', '--invalidate_cache', dest='invalidate_cache', action='store_true', help='Force health cache to be invalidated')
   parser.add_option('-w', '--open_webbrowser', dest='open_webbrowser', action='store_true', help='Opens the final report in your browser')
+  parser.add_option('-W', '--save_plan', dest='save_plan', default=None, help='Save the queries sent to each server to a test plan file')
   parser.add_option('-x', '--no_gui', dest='no_gui', action='store_true', help='Disable GUI')
+  parser.add_option('-X', '--replay', dest='replay_file', default=None, help='Replay every query in a pcap/pcapng capture, keeping its original timing')
   parser.add_option('-Y', '--health_timeout', dest='health_timeout', type='float', help='health check timeout (in seconds)')
   parser.add_option('-y', '--timeout', dest='timeout', type='float', help='# of seconds general requests timeout in.')
+  parser.add_option('-Z', '--monitor', dest='monitor', action='store_true', help='Keep benchmarking at a low rate, rewriting a resolv.conf ranking (-o) every round')
   parser.add_option('-z', '--config', dest='config', default=default_config_file, help='Config file to use.')
 
   options, args = parser.parse_args()
@@ -180,6 +195,10 @@ def _ParseNameServerListing(fp):
 def GetSanityChecks():
   return GetAutoUpdatingConfigFile('config/sanity_checks.cfg')
 
+def GetLocalSanityChecks():
+  """Like GetSanityChecks, but never looks for a newer version online."""
+  return _GetLocalConfig('config/sanity_checks.cfg')
+
 def _GetLocalConfig(conf_file):
   """Read a simple local config file."""
 
@@ -265,7 +284,8 @@ def MergeConfigurationFileOptions(options):
         value = general[option]
       setattr(options, option, value)
 
-  for key in ('input_file', 'output_file', 'csv_file', 'input_source'):
+  for key in ('input_file', 'output_file', 'csv_file', 'input_source', 'trace_file',
+              'profile_dir', 'load_plan', 'save_plan', 'checkpoint_file', 'replay_file'):
     value = getattr(options, key, None)
     if value:
       setattr(options, key, os.path.expanduser(value))
@@ -20,6 +20,7 @@ import time
 
 import nameserver
 import providers
+import query_events
 import sys_nameservers
 import util
 
@@ -67,6 +68,7 @@ class ConnectionQuality(object):
     """Look how healthy our DNS connection quality. Averages check durations."""
 
     is_connection_offline = True
+    query_events.SetPhase('connection')
     self.msg('Checking query interception status...')
     odns = providers.OpenDNS()
     (intercepted, i_duration) = odns.InterceptionStateWithDuration()
@@ -19,16 +19,23 @@ import ConfigParser
 import glob
 import os
 import os.path
+import Queue
 import random
 import re
-import subprocess
 import sys
+import threading
 import time
+import traceback
 
 # relative
 import addr_util
+import history_db
+import history_scanner
+import pcap_reader
 import selectors
+import source_cache
 import util
+import workload
 
 # Pick the most accurate timer for a platform. Stolen from timeit.py:
 if sys.platform[:3] == 'win':
@@ -37,6 +44,10 @@ else:
   DEFAULT_TIMER = time.time
 
 GLOBAL_DATA_CACHE = {}
+# source -> {hostname: popularity weight}, for sources that have them.
+GLOBAL_WEIGHT_CACHE = {}
+# source -> record count, for sources whose records have not been loaded.
+GLOBAL_COUNT_CACHE = {}
 
 DEFAULT_CONFIG_PATH = 'config/data_sources.cfg'
 MAX_NON_UNIQUE_RECORD_COUNT = 500000
@@ -44,13 +55,164 @@ MAX_FILE_MTIME_AGE_DAYS = 45
 MIN_FILE_SIZE = 10000
 MIN_RECOMMENDED_RECORD_COUNT = 200
 MAX_FQDN_SYNTHESIZE_PERCENT = 4
+# Whether a source holds domains or full hostnames is decided from at least this
+# many records, taken evenly from across the source.
+FQDN_SAMPLE_SIZE = 5000
+# Bump this whenever a change to parsing would alter the hosts found in a file.
+PARSER_VERSION = 1
+# Data source settings for generated workloads, and how to parse them.
+WORKLOAD_SETTINGS = {
+    'generator': str,
+    'zipf_exponent': float,
+    'hit_ratio': float,
+    'qtypes': workload.ParseQtypeMix,
+    'seed': int
+}
+# How many sources to look for and count at once when listing them.
+DISCOVERY_THREAD_COUNT = 4
+# Seconds a single source may take to be found and counted before it is left out.
+SOURCE_TIME_BUDGET = 15
+
+
+class RecordStats(object):
+  """Counts of what happened to the entries of a source on their way to records."""
+
+  def __init__(self):
+    self.entries = 0
+    self.repeats = 0
+    self.ips = 0
+    self.internal = 0
+    self.sampled = 0
+    self.sampled_fqdn = 0
+    self.has_duplicates = False
+
+
+def _ParseEntries(entries, stats, include_duplicates):
+  """Yield (record_type, host) for each entry, skipping back-to-back repeats."""
+  last_entry = None
+  for entry in entries:
+    stats.entries += 1
+    if entry == last_entry and not include_duplicates:
+      stats.repeats += 1
+      continue
+    last_entry = entry
+
+    if ' ' in entry:
+      yield tuple(entry.split(' '))
+    else:
+      yield ('A', entry)
+
+
+def _FilterRecords(records, stats):
+  """Drop records for IP addresses and internal hostnames."""
+  for (record_type, host) in records:
+    if addr_util.IP_RE.match(host):
+      stats.ips += 1
+    elif addr_util.INTERNAL_RE.search(host):
+      stats.internal += 1
+    else:
+      yield (record_type, host)
+
+
+def _NormalizeRecords(records):
+  """Make every host fully qualified (ending in a dot)."""
+  for (record_type, host) in records:
+    if not host.endswith('.'):
+      host += '.'
+    yield (record_type, host)
+
+
+def _SampleFqdns(records, stats, sample_size):
+  """Count how many of an evenly strided sample of hosts look like full hostnames.
+
+  The length of records is not known up front, so every record is sampled until
+  there are twice sample_size of them; the sample is then thinned to every other
+  entry and the stride doubled. The counts are filled in once records run out.
+  """
+  sample = []
+  stride = 1
+  for (index, record) in enumerate(records):
+    if not index % stride:
+      sample.append(bool(addr_util.FQDN_RE.match(record[1])))
+      if len(sample) == sample_size * 2:
+        sample = sample[::2]
+        stride *= 2
+    yield record
+  stats.sampled = len(sample)
+  stats.sampled_fqdn = sample.count(True)
+
+
+def _DetectDuplicates(records, stats):
+  """Note whether any record appears twice.
+
+  The set shares its tuples with the list of records built from this stream, so
+  it costs a hash table entry per record until the first duplicate turns up.
+  """
+  seen = set()
+  for record in records:
+    # Once a duplicate is found, there is no need to keep remembering records.
+    if seen is not None:
+      if record in seen:
+        stats.has_duplicates = True
+        seen = None
+      else:
+        seen.add(record)
+    yield record
+
+
+class SourceCountThreads(threading.Thread):
+  """Find and count the records in data sources, in parallel."""
+
+  def __init__(self, data_sources, input_queue, results_queue):
+    threading.Thread.__init__(self)
+    # A source stuck on a dead network mount must not keep namebench from exiting.
+    self.setDaemon(True)
+    self.data_sources = data_sources
+    self.input = input_queue
+    self.results = results_queue
+    # (source, start time) of the source being counted, replaced as a whole so
+    # that OverdueSource never sees one source with the start time of another.
+    self.counting = None
+    # Set once the thread has run over its time budget and been replaced.
+    self.abandoned = False
+
+  def run(self):
+    """Iterate over the queue, counting each source."""
+    while not self.abandoned:
+      try:
+        source = self.input.get_nowait()
+      except Queue.Empty:
+        return
+      self.counting = (source, time.time())
+      try:
+        count = self.data_sources.CountRecordsForSource(source)
+      except Exception:
+        self.data_sources.msg('Could not count records for %s: %s' %
+                              (source, traceback.format_exc().splitlines()[-1]))
+        count = None
+      self.counting = None
+      self.results.put((source, count))
+
+  def OverdueSource(self, time_budget):
+    """Return the source being counted if it has taken longer than time_budget."""
+    counting = self.counting
+    if counting and time.time() - counting[1] > time_budget:
+      return counting[0]
+    return None
 
 
 class DataSources(object):
   """A collection of methods related to available hostname data sources."""
 
-  def __init__(self, config_path=DEFAULT_CONFIG_PATH, status_callback=None):
+  def __init__(self, config_path=DEFAULT_CONFIG_PATH, status_callback=None,
+               cache_path=source_cache.DEFAULT_PATH):
     self.source_cache = GLOBAL_DATA_CACHE
+    self.weight_cache = GLOBAL_WEIGHT_CACHE
+    self.count_cache = GLOBAL_COUNT_CACHE
+    if cache_path:
+      self.disk_cache = source_cache.SourceCache(cache_path, version=PARSER_VERSION)
+    else:
+      self.disk_cache = None
     self.source_config = {}
     self.status_callback = status_callback
     self._LoadConfigFromPath(config_path)
@@ -58,7 +220,8 @@ class DataSources(object):
   def msg(self, msg, **kwargs):
     if self.status_callback:
       self.status_callback(msg, **kwargs)
-    else:
+    # Without a UI to draw progress bars, progress updates would only repeat themselves.
+    elif 'total' not in kwargs:
       print '- %s' % msg
 
   def _LoadConfigFromPath(self, path):
@@ -75,7 +238,9 @@ class DataSources(object):
             # Store whether or not this data source contains personal data
             'synthetic': False,
             'include_duplicates': False,
-            'max_mtime_days': MAX_FILE_MTIME_AGE_DAYS
+            'max_mtime_days': MAX_FILE_MTIME_AGE_DAYS,
+            # Settings for sources that generate a workload from their hosts.
+            'workload': None
         }
 
       for (key, value) in config.items(section):
@@ -89,6 +254,10 @@ class DataSources(object):
           self.source_config[section]['include_duplicates'] = bool(value)
         elif key == 'synthetic':
           self.source_config[section]['synthetic'] = bool(value)
+        elif key in WORKLOAD_SETTINGS:
+          settings = self.source_config[section]['workload'] or {}
+          settings[key] = WORKLOAD_SETTINGS[key](value)
+          self.source_config[section]['workload'] = settings
         else:
           self.source_config[section]['search_paths'].add(value)
 
@@ -96,31 +265,107 @@ class DataSources(object):
     """Get a list of all data sources we know about."""
     return sorted(self.source_config.keys())
 
-  def ListSourcesWithDetails(self):
+  def ListSourcesWithDetails(self, thread_count=DISCOVERY_THREAD_COUNT,
+                             time_budget=SOURCE_TIME_BUDGET, callback=None):
     """Get a list of all data sources found with total counts.
 
+    Sources are found and counted on thread_count threads. Any source that
+    takes longer than time_budget seconds (a huge history file, or one on a
+    network mount) is left out of the list rather than holding up the rest.
+
+    Args:
+      thread_count: how many sources to count at once (int). 1 counts them
+        one at a time in this thread, with no time budget.
+      time_budget: seconds each source may take to be counted (float)
+      callback: called with each detail tuple as soon as its source is counted.
+
     Returns:
       List of tuples in form of (short_name, full_name, full_hosts, # of entries)
     """
-    for source in self.ListSourceTypes():
-      max_mtime = self.source_config[source]['max_mtime_days']
-      self._GetHostsFromSource(source, min_file_size=MIN_FILE_SIZE,
-                               max_mtime_age_days=max_mtime)
+    sources = self.ListSourceTypes()
+    if thread_count > 1:
+      counts = self._CountSourcesInParallel(sources, thread_count, time_budget)
+    else:
+      counts = ((x, self.CountRecordsForSource(x)) for x in sources)
 
     details = []
-    for source in self.source_cache:
-      details.append((source,
-                      self.source_config[source]['name'],
-                      self.source_config[source]['synthetic'],
-                      len(self.source_cache[source])))
-    return sorted(details, key=lambda x: (x[2], x[3] * -1))
-
-  def ListSourceTitles(self):
-    """Return a list of sources in title + count format."""
+    for (source, count) in counts:
+      if count is not None:
+        detail = (source,
+                  self.source_config[source]['name'],
+                  self.source_config[source]['synthetic'],
+                  count)
+        details.append(detail)
+        if callback:
+          callback(detail)
+    # Sources are counted in no particular order: break ties by name.
+    return sorted(details, key=lambda x: (x[2], x[3] * -1, x[0]))
+
+  def _CountSourcesInParallel(self, sources, thread_count, time_budget):
+    """Yield (source, count) for each source as it is counted, in any order.
+
+    Sources that run over time_budget are yielded with a count of None. Their
+    thread is abandoned and replaced, so that a slow source only ever ties up
+    one thread; if it does finish later, its records are still cached.
+    """
+    input_queue = Queue.Queue()
+    for source in sources:
+      input_queue.put(source)
+    results_queue = Queue.Queue()
+    threads = []
+    for unused_thread_num in range(0, min(thread_count, len(sources))):
+      thread = SourceCountThreads(self, input_queue, results_queue)
+      thread.start()
+      threads.append(thread)
+
+    pending = set(sources)
+    status_message = 'Counting records in data sources'
+    last_done = None
+    while pending:
+      done = len(sources) - len(pending)
+      if done != last_done:
+        self.msg(status_message, count=done, total=len(sources))
+        last_done = done
+      try:
+        (source, count) = results_queue.get(timeout=0.25)
+        # Abandoned threads may still report in, after their source was skipped.
+        if source in pending:
+          pending.remove(source)
+          yield (source, count)
+      except Queue.Empty:
+        pass
+
+      for thread in list(threads):
+        source = thread.OverdueSource(time_budget)
+        if source in pending:
+          self.msg('Skipping %s (not counted within %ss)' % (self.GetNameForSource(source),
+                                                            time_budget))
+          pending.remove(source)
+          # It finishes its current source, but takes no more from the queue.
+          thread.abandoned = True
+          threads.remove(thread)
+          replacement = SourceCountThreads(self, input_queue, results_queue)
+          replacement.start()
+          threads.append(replacement)
+          yield (source, None)
+    self.msg(status_message, count=len(sources), total=len(sources))
+
+  def CountRecordsForSource(self, source):
+    """Count the records in a configured source, if a usable file is found for it."""
+    max_mtime = self.source_config[source]['max_mtime_days']
+    return self._GetRecordCountForSource(source, min_file_size=MIN_FILE_SIZE,
+                                         max_mtime_age_days=max_mtime)
+
+  def ListSourceTitles(self, callback=None):
+    """Return a list of sources in title + count format.
+
+    Args:
+      callback: passed on to ListSourcesWithDetails (optional)
+    """
     titles = []
     seen_synthetic = False
     seen_organic = False
-    for (unused_type, name, is_synthetic, count) in self.ListSourcesWithDetails():
+    for (unused_type, name, is_synthetic, count) in self.ListSourcesWithDetails(callback=callback):
       if not is_synthetic:
         seen_organic = True
 
@@ -136,8 +381,8 @@ class DataSources(object):
       if detail.startswith(self.source_config[source_type]['name']):
         return source_type
 
-  def GetBestSourceDetails(self):
-    return self.ListSourcesWithDetails()[0]
+  def GetBestSourceDetails(self, callback=None):
+    return self.ListSourcesWithDetails(callback=callback)[0]
 
   def GetNameForSource(self, source):
     if source in self.source_config:
@@ -147,14 +392,45 @@ class DataSources(object):
       return source
 
   def GetCachedRecordCountForSource(self, source):
-    return len(self.source_cache[source])
+    if source in self.source_cache:
+      return len(self.source_cache[source])
+    return self.count_cache[source]
+
+  def _GetRecordCountForSource(self, source, min_file_size=None, max_mtime_age_days=None):
+    """Count the hosts in a source, without loading them if they are cached on disk.
 
-  def _CreateRecordsFromHostEntries(self, entries, include_duplicates=False):
+    Returns:
+      A count of hosts (int), or None if the source is not available.
+    """
+    if source in self.source_cache:
+      return len(self.source_cache[source])
+    filename = self._FindBestFileForSource(source, min_file_size=min_file_size,
+                                           max_mtime_age_days=max_mtime_age_days)
+    if not filename:
+      return None
+    if self.disk_cache:
+      count = self.disk_cache.GetCount(filename)
+      if count is not None:
+        self.count_cache[source] = count
+        return count
+    hosts = self._GetHostsFromFile(source, filename)
+    if hosts is None:
+      return None
+    return len(hosts)
+
+  def _CreateRecordsFromHostEntries(self, entries, include_duplicates=False, stats=None):
     """Create records from hosts, removing duplicate entries and IP's.
 
+    Entries go through a single pass of generators (parse, filter, normalize,
+    sample, detect duplicates), so the only list built is the final one. That
+    list is not avoidable: the selectors pick records by index, so memory use
+    grows with the size of the source, as it already does for the cached
+    entries themselves.
+
     Args:
-      entries: A list of test-data entries.
+      entries: An iterable of test-data entries.
       include_duplicates: Whether or not to filter duplicates (optional: False)
+      stats: A RecordStats object to fill in (optional)
 
     Returns:
       A tuple of (filtered records, full_host_names (Boolean)
@@ -162,35 +438,21 @@ class DataSources(object):
     Raises:
       ValueError: If no records could be grokked from the input.
     """
-    last_entry = None
-
-    records = []
-    full_host_count = 0
-    for entry in entries:
-      if entry == last_entry and not include_duplicates:
-        continue
-      else:
-        last_entry = entry
-
-      if ' ' in entry:
-        (record_type, host) = entry.split(' ')
-      else:
-        record_type = 'A'
-        host = entry
-
-      if not addr_util.IP_RE.match(host) and not addr_util.INTERNAL_RE.search(host):
-        if not host.endswith('.'):
-          host += '.'
-        records.append((record_type, host))
-
-        if addr_util.FQDN_RE.match(host):
-          full_host_count += 1
+    if not stats:
+      stats = RecordStats()
+    records = _ParseEntries(entries, stats, include_duplicates)
+    records = _NormalizeRecords(_FilterRecords(records, stats))
+    records = _SampleFqdns(records, stats, FQDN_SAMPLE_SIZE)
+    if not include_duplicates:
+      records = _DetectDuplicates(records, stats)
+    records = list(records)
 
     if not records:
-      raise ValueError('No records could be created from: %s' % entries)
+      raise ValueError('No records could be created from %s entries (%s IPs, %s internal)' %
+                       (stats.entries, stats.ips, stats.internal))
 
     # Now that we've read everything, are we dealing with domains or full hostnames?
-    full_host_percent = full_host_count / float(len(records)) * 100
+    full_host_percent = stats.sampled_fqdn / float(stats.sampled) * 100
     if full_host_percent < MAX_FQDN_SYNTHESIZE_PERCENT:
       full_host_names = True
     else:
@@ -228,19 +490,35 @@ class DataSources(object):
     if not records:
       raise ValueError('Unable to generate records from %s (nothing found)' % source)
 
+    settings = self.source_config.get(source, {}).get('workload')
+    if settings:
+      return self._GenerateWorkload(source, records, count, settings)
+
     self.msg('Generating tests from %s (%s records, selecting %s %s)'
              % (self.GetNameForSource(source), len(records), count, select_mode))
-    (records, are_records_fqdn) = self._CreateRecordsFromHostEntries(records,
-                                                                     include_duplicates=include_duplicates)
+    stats = RecordStats()
+    (records, are_records_fqdn) = self._CreateRecordsFromHostEntries(
+        records, include_duplicates=include_duplicates, stats=stats)
+    if stats.ips or stats.internal:
+      self.msg('Skipped %s IP addresses and %s internal hostnames in %s' %
+               (stats.ips, stats.internal, self.GetNameForSource(source)))
+    weights = self.weight_cache.get(source)
+    if select_mode == 'popularity' and not weights:
+      self.msg('%s has no popularity data, switching select_mode to automatic' % source)
+      select_mode = 'automatic'
+
+    # Real visit counts beat any guess at how popular an entry is.
+    if weights and select_mode in ('weighted', 'automatic', None):
+      select_mode = 'popularity'
     # First try to resolve whether to use weighted or random.
-    if select_mode in ('weighted', 'automatic', None):
+    elif select_mode in ('weighted', 'automatic', None):
       # If we are in include_duplicates mode (cachemiss, cachehit, etc.), we have different rules.
       if include_duplicates:
         if count > len(records):
           select_mode = 'random'
         else:
           select_mode = 'chunk'
-      elif len(records) != len(set(records)):
+      elif stats.has_duplicates:
         if select_mode == 'weighted':
           self.msg('%s data contains duplicates, switching select_mode to random' % source)
         select_mode = 'random'
@@ -251,6 +529,8 @@ class DataSources(object):
              (count, len(records), select_mode))
     if select_mode == 'weighted':
       records = selectors.WeightedDistribution(records, count)
+    elif select_mode == 'popularity':
+      records = selectors.PopularitySelect(records, [weights.get(x[1], 0) for x in records], count)
     elif select_mode == 'chunk':
       records = selectors.ChunkSelect(records, count)
     elif select_mode == 'random':
@@ -274,6 +554,40 @@ class DataSources(object):
     else:
       return records
 
+  def _GenerateWorkload(self, source, entries, count, settings):
+    """Generate count requests for a source whose hosts seed a synthetic workload.
+
+    Args:
+      source: source name (str)
+      entries: the entries read from the source, most popular first
+      count: number of requests to generate (int)
+      settings: dictionary of WORKLOAD_SETTINGS for the source
+
+    Returns:
+      A list of record tuples in the form of (req_type, hostname)
+
+    Raises:
+      ValueError: If the generator is unknown or its settings are invalid.
+    """
+    if settings.get('generator', 'zipf') != 'zipf':
+      raise ValueError('%s: unknown workload generator: %s' % (source, settings['generator']))
+    hosts = [x.split(' ')[-1] for x in entries]
+    # Unless the source pins a seed, follow the (possibly seeded) random module.
+    seed = settings.get('seed', random.getrandbits(32))
+    try:
+      generator = workload.ZipfWorkload(
+          hosts,
+          exponent=settings.get('zipf_exponent', workload.DEFAULT_EXPONENT),
+          hit_ratio=settings.get('hit_ratio', workload.DEFAULT_HIT_RATIO),
+          qtype_mix=settings.get('qtypes'),
+          seed=seed)
+    except workload.WorkloadError, e:
+      raise ValueError('%s: %s' % (source, e))
+    self.msg('Generating %s requests from %s (%s hosts, %0.0f%% cache hits, seed %s)' %
+             (count, self.GetNameForSource(source), len(generator.hostnames),
+              generator.hit_ratio * 100, seed))
+    return list(generator.Generate(count))
+
   def _GenerateRandomHostname(self, domain):
     """Generate a random hostname f or a given domain."""
     oracle = random.randint(0, 100)
@@ -297,7 +611,7 @@ class DataSources(object):
     Returns:
       list of hostnames gathered from data source.
 
-    The results of this function are cached by source type.
+    The results of this function are cached by source type, and on disk by file.
     """
     if source in self.source_cache:
       return self.source_cache[source]
@@ -305,16 +619,37 @@ class DataSources(object):
                                            max_mtime_age_days=max_mtime_age_days)
     if not filename:
       return None
+    return self._GetHostsFromFile(source, filename)
+
+  def _GetHostsFromFile(self, source, filename):
+    """Get (and cache) the hostnames for a source from a particular file."""
+    if self.disk_cache:
+      cached = self.disk_cache.Get(filename)
+      if cached:
+        (hosts, popularity) = cached
+        if popularity:
+          self._SetPopularity(source, popularity)
+        self.source_cache[source] = hosts
+        return hosts
 
     size_mb = os.path.getsize(filename) / 1024.0 / 1024.0
     # Minimize our output
-    if not self.source_config[source]['synthetic']:
+    if not self.source_config.get(source, {}).get('synthetic'):
       self.msg('Reading %s: %s (%0.1fMB)' % (self.GetNameForSource(source), filename, size_mb))
     start_clock = DEFAULT_TIMER()
-    if filename.endswith('.pcap') or filename.endswith('.tcp'):
+    popularity = None
+    if pcap_reader.IsCaptureFile(filename):
       hosts = self._ExtractHostsFromPcapFile(filename)
+      if hosts is None:
+        return None
     else:
-      hosts = self._ExtractHostsFromHistoryFile(filename)
+      popularity = history_db.ReadHostPopularity(filename)
+      if popularity:
+        hosts = [x[0] for x in popularity]
+        popularity = dict(popularity)
+        self._SetPopularity(source, popularity)
+      else:
+        hosts = self._ExtractHostsFromHistoryFile(filename)
 
     if not hosts:
       hosts = self._ReadDataFile(filename)
@@ -322,28 +657,35 @@ class DataSources(object):
     if duration > 5:
       self.msg('%s data took %1.1fs to read!' % (self.GetNameForSource(source), duration))
     self.source_cache[source] = hosts
+    if self.disk_cache:
+      self.disk_cache.Set(filename, hosts, weights=popularity)
     return hosts
 
+  def _SetPopularity(self, source, popularity):
+    """Store host -> popularity weights, keyed the way records name hosts."""
+    self.weight_cache[source] = dict([(host + '.', weight) for (host, weight) in popularity.items()])
+
   def _ExtractHostsFromHistoryFile(self, path):
-    """Get a list of sanitized records from a history file containing URLs."""
-    # This regexp is fairly general (no ip filtering), since we need speed more
-    # than precision at this stage.
-    parse_re = re.compile('https*://([\-\w]+\.[\-\w\.]+)')
-    return parse_re.findall(open(path, 'rb').read())
+    """Get a list of sanitized records from a history file containing URLs.
+
+    The file is scanned through a memory map rather than read in. Past
+    MAX_NON_UNIQUE_RECORD_COUNT hostnames, a random sample of that many is
+    kept from across the whole file.
+    """
+    return history_scanner.ExtractHostnames(path, limit=MAX_NON_UNIQUE_RECORD_COUNT)
 
   def _ExtractHostsFromPcapFile(self, path):
-    """Get a list of requests out of a pcap file - requires tcpdump."""
-    self.msg('Extracting requests from pcap file using tcpdump')
-    cmd = 'tcpdump -r %s -n port 53' % path
-    pipe = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE).stdout
-    parse_re = re.compile(' ([A-Z]+)\? ([\-\w\.]+)')
+    """Get a list of requests out of a pcap or pcapng file (None if it is unreadable)."""
+    self.msg('Extracting requests from %s' % path)
     requests = []
-    for line in pipe:
-      if '?' not in line:
-        continue
-      match = parse_re.search(line)
-      if match:
-        requests.append(' '.join(match.groups()))
+    try:
+      for (qtype, qname, unused_timestamp) in pcap_reader.ReadQueries(path):
+        requests.append('%s %s' % (qtype, qname))
+        if len(requests) >= MAX_NON_UNIQUE_RECORD_COUNT:
+          break
+    except pcap_reader.CaptureError, e:
+      self.msg('Skipping %s (%s)' % (path, e))
+      return None
     return requests
 
   def _ReadDataFile(self, path):
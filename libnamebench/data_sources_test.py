@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the data_sources module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import data_sources
+import pcap_reader
+
+
+class SlowDataSources(data_sources.DataSources):
+  """Counts every source instantly, except for one that hangs."""
+
+  def __init__(self):
+    data_sources.DataSources.__init__(self, status_callback=lambda *args, **kwargs: None,
+                                      cache_path=None)
+    self.release = threading.Event()
+    self.unreadable = ['opera']
+
+  def CountRecordsForSource(self, source):
+    if source == 'chrome':
+      self.release.wait(5)
+    elif source in self.unreadable:
+      raise IOError('Permission denied')
+    return len(source)
+
+
+class DelayedDataSources(data_sources.DataSources):
+  """Sources that each take a set number of seconds to count."""
+
+  def __init__(self, delays):
+    data_sources.DataSources.__init__(self, status_callback=lambda *args, **kwargs: None,
+                                      cache_path=None)
+    self.delays = delays
+    for source in delays:
+      self.source_config[source] = {'name': source, 'synthetic': False}
+
+  def ListSourceTypes(self):
+    return sorted(self.delays)
+
+  def CountRecordsForSource(self, source):
+    time.sleep(self.delays[source])
+    return 1
+
+
+class DataSourcesTest(unittest.TestCase):
+  def testParallelListing(self):
+    ds = SlowDataSources()
+    found = []
+    start = time.time()
+    details = ds.ListSourcesWithDetails(thread_count=2, time_budget=0.5, callback=found.append)
+    ds.release.set()
+    self.assertTrue(time.time() - start < 3)
+
+    expected = [x for x in ds.ListSourceTypes() if x not in ('chrome', 'opera')]
+    self.assertEquals(sorted([x[0] for x in details]), expected)
+    self.assertEquals(sorted(found), sorted(details))
+    # Equal counts are listed in the same order, however the threads finish.
+    self.assertEquals([x[0] for x in details if x[3] == 5], ['flock', 'squid', 'alexa'])
+    self.assertEquals(details[0][1:], (ds.source_config[details[0][0]]['name'],
+                                       ds.source_config[details[0][0]]['synthetic'],
+                                       len(details[0][0])))
+
+    # Counting one at a time waits for every source.
+    ds.unreadable = []
+    start = time.time()
+    self.assertEquals(len(ds.ListSourcesWithDetails(thread_count=1)), len(expected) + 2)
+    self.assertTrue(time.time() - start < 1)
+
+  def testSlowSourceAfterAbandonedThread(self):
+    # The thread abandoned on 'a' must not go on to take 'e' out of the queue.
+    ds = DelayedDataSources({'a': 1.2, 'b': 0.9, 'c': 0.9, 'd': 0.9, 'e': 8})
+    start = time.time()
+    details = ds.ListSourcesWithDetails(thread_count=2, time_budget=1.0)
+    self.assertTrue(time.time() - start < 4, time.time() - start)
+    self.assertFalse('e' in [x[0] for x in details])
+
+  def testSourceTitlesAsCounted(self):
+    ds = DelayedDataSources({'a': 0, 'b': 0.2})
+    found = []
+    titles = ds.ListSourceTitles(callback=found.append)
+    self.assertEquals(sorted([x[0] for x in found]), ['a', 'b'])
+    self.assertEquals(len(titles), 2)
+    self.assertEquals(ds.GetBestSourceDetails(callback=found.append), found[0])
+    self.assertEquals(len(found), 4)
+
+    thread = data_sources.SourceCountThreads(ds, None, None)
+    self.assertEquals(thread.OverdueSource(1), None)
+    thread.counting = ('b', time.time() - 2)
+    self.assertEquals(thread.OverdueSource(1), 'b')
+    self.assertEquals(thread.OverdueSource(5), None)
+
+  def testCreateRecordsFromHostEntries(self):
+    ds = SlowDataSources()
+    entries = ['www.google.com', 'www.google.com', 'MX google.com.', '10.0.0.1',
+               'build.corp.example.com', 'www.yahoo.com', 'www.google.com']
+    stats = data_sources.RecordStats()
+    (records, full_host_names) = ds._CreateRecordsFromHostEntries(entries, stats=stats)
+    self.assertEquals(records, [('A', 'www.google.com.'), ('MX', 'google.com.'),
+                                ('A', 'www.yahoo.com.'), ('A', 'www.google.com.')])
+    self.assertEquals((stats.entries, stats.repeats, stats.ips, stats.internal), (7, 1, 1, 1))
+    self.assertTrue(stats.has_duplicates)
+    self.assertEquals(full_host_names, False)
+
+    # Lists of domains are recognized from a sample, and may come from a generator.
+    stats = data_sources.RecordStats()
+    domains = ('example%d.com' % x for x in xrange(data_sources.FQDN_SAMPLE_SIZE * 2))
+    (records, full_host_names) = ds._CreateRecordsFromHostEntries(domains, stats=stats)
+    self.assertEquals(len(records), data_sources.FQDN_SAMPLE_SIZE * 2)
+    self.assertEquals(stats.sampled, data_sources.FQDN_SAMPLE_SIZE)
+    self.assertEquals((full_host_names, stats.has_duplicates), (True, False))
+
+    # The sample is spread across the source, not taken from its head.
+    stats = data_sources.RecordStats()
+    hosts = ['www.example%d.com' % x for x in xrange(data_sources.FQDN_SAMPLE_SIZE)]
+    hosts += ['example%d.com' % x for x in xrange(data_sources.FQDN_SAMPLE_SIZE * 4)]
+    (records, full_host_names) = ds._CreateRecordsFromHostEntries(hosts, stats=stats)
+    self.assertTrue(data_sources.FQDN_SAMPLE_SIZE <= stats.sampled
+                    < data_sources.FQDN_SAMPLE_SIZE * 2, stats.sampled)
+    self.assertEquals(stats.sampled_fqdn * 5, stats.sampled)
+    self.assertRaises(ValueError, ds._CreateRecordsFromHostEntries, ['127.0.0.1'])
+
+
+  def testBrokenCapture(self):
+    ds = SlowDataSources()
+    (fd, path) = tempfile.mkstemp()
+    try:
+      os.write(fd, pcap_reader.PCAPNG_MAGIC + '\x00\x00\x00\x1c' + 'junk' * 8)
+      os.close(fd)
+      self.assertEquals(ds._GetHostsFromSource(path), None)
+      self.assertFalse(path in ds.source_cache)
+    finally:
+      os.unlink(path)
+
+
+if __name__ == '__main__':
+  unittest.main()
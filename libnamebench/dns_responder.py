@@ -0,0 +1,542 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A programmable DNS responder for testing namebench without the network.
+
+Each loopback IP address the responder listens on acts like a different
+nameserver, with its own latency distribution, packet loss, rcode injection,
+NXDOMAIN hijacking, CHAOS answers and rate limit. Servers may share a cache,
+in which case they hand out the same decrementing TTLs, just as a real
+anycast cluster would.
+
+It can be run in-process (DnsResponder.Start) or as a subprocess:
+
+  dns_responder.py <config.json> [port]
+
+A config file looks like:
+
+  {"servers": {"127.0.0.1": {"latency": ["gauss", 20, 5], "loss_rate": 0.01},
+               "127.0.0.2": {"hijack_ip": "10.0.0.99", "cache": "shared"},
+               "127.0.0.3": {"rate_limit": 50, "cache": "shared"}},
+   "records": {"www.example.com.": {"A": ["192.0.2.1"]}},
+   "sanity_checks": true}
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import errno
+import heapq
+import os.path
+import random
+import re
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+
+if __name__ == '__main__':
+  # The repository root, wherever we were started from.
+  sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+  import nb_third_party
+
+# external dependencies (from nb_third_party)
+import dns.exception
+import dns.flags
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.rrset
+import simplejson
+
+import health_checks
+import nameserver
+
+DEFAULT_TTL = 300
+MAX_PACKET_SIZE = 65535
+POLL_INTERVAL = 0.1
+READY_TEXT = 'READY'
+
+# Where to run the responder from: absolute, in case the cwd changes later.
+SCRIPT_PATH = os.path.abspath(__file__)
+if SCRIPT_PATH.endswith('.pyc'):
+  SCRIPT_PATH = SCRIPT_PATH[:-1]
+
+# Answers for these are always available, so that a NameServer pointed at
+# the responder can pass its health checks.
+DEFAULT_RECORDS = {
+    'a.root-servers.net.': {'A': ['198.41.0.4']},
+}
+
+
+class ResponderError(Exception):
+  """The responder subprocess did not start."""
+
+
+def _SynthesizeAnswer(expected):
+  """Turn an expected sanity check value into a record which satisfies it."""
+  if re.match(r'^[\d\.]+$', expected):
+    octets = [x for x in expected.split('.') if x]
+    while len(octets) < 4:
+      octets.append('1')
+    return ('A', '.'.join(octets[0:4]))
+  else:
+    return ('CNAME', expected.rstrip('.') + '.')
+
+
+class ServerProfile(object):
+  """How a single responder IP behaves."""
+
+  def __init__(self, latency=0, loss_rate=0, rcode=None, rcode_rate=0,
+               hijack_ip=None, version='namebench-responder', hostname=None,
+               cache=None, rate_limit=None, rate_limit_burst=None):
+    """Constructor.
+
+    Args:
+      latency: How long to wait before answering, in milliseconds. Either a
+        number, a callable taking a random.Random, or a list in the form of
+        ['uniform', low, high], ['gauss', mean, stddev], ['exponential', mean]
+        or ['choice', ms, ms, ...].
+      loss_rate: Fraction of queries to silently drop (0-1)
+      rcode: rcode text (SERVFAIL, REFUSED, etc.) to inject
+      rcode_rate: Fraction of queries to answer with rcode (0-1)
+      hijack_ip: If set, answer NXDOMAIN responses with this IP instead
+      version: answer for CHAOS TXT version.bind.
+      hostname: answer for CHAOS TXT hostname.bind./id.server.
+      cache: Name of the cache this server uses. Servers with the same cache
+        name share TTLs. Defaults to a private cache.
+      rate_limit: Maximum sustained queries per second before dropping
+      rate_limit_burst: How many queries may arrive at once (defaults to rate_limit)
+    """
+    self.latency = latency
+    self.loss_rate = loss_rate
+    self.rcode = rcode
+    self.rcode_rate = rcode_rate
+    self.hijack_ip = hijack_ip
+    self.version = version
+    self.hostname = hostname
+    self.cache = cache
+    self.rate_limit = rate_limit
+    self.rate_limit_burst = rate_limit_burst or rate_limit
+    self._tokens = self.rate_limit_burst
+    self._token_timestamp = None
+
+  def GetLatency(self, rng):
+    """Return how long to delay the next answer, in seconds."""
+    latency = self.latency
+    if callable(latency):
+      ms = latency(rng)
+    elif isinstance(latency, (list, tuple)):
+      distribution = latency[0]
+      if distribution == 'uniform':
+        ms = rng.uniform(latency[1], latency[2])
+      elif distribution == 'gauss':
+        ms = rng.gauss(latency[1], latency[2])
+      elif distribution == 'exponential':
+        ms = rng.expovariate(1.0 / latency[1])
+      elif distribution == 'choice':
+        ms = rng.choice(latency[1:])
+      else:
+        raise ValueError('Unknown latency distribution: %s' % distribution)
+    else:
+      ms = latency
+    return max(ms, 0) / 1000.0
+
+  def IsRateLimited(self, now):
+    """Token bucket: return True if a query arriving now should be dropped."""
+    if not self.rate_limit:
+      return False
+    if self._token_timestamp is not None:
+      elapsed = now - self._token_timestamp
+      self._tokens = min(self._tokens + elapsed * self.rate_limit, self.rate_limit_burst)
+    self._token_timestamp = now
+    if self._tokens < 1:
+      return True
+    self._tokens -= 1
+    return False
+
+
+class ResponderCache(object):
+  """Remembers when each answer was first given out, so TTLs count down."""
+
+  def __init__(self):
+    self.entries = {}
+
+  def GetTtl(self, key, ttl, now):
+    """Return the remaining TTL for a record, caching it if necessary."""
+    entry = self.entries.get(key)
+    if not entry or entry <= now:
+      entry = now + ttl
+      self.entries[key] = entry
+    return max(int(entry - now), 0)
+
+
+class Zone(object):
+  """Authoritative data the responder answers from."""
+
+  def __init__(self, records=None, wildcard_domains=health_checks.WILDCARD_DOMAINS,
+               default_ttl=DEFAULT_TTL):
+    """Constructor.
+
+    Args:
+      records: dictionary of name -> {type: [values], 'ttl': ttl}
+      wildcard_domains: domains where any hostname resolves
+      default_ttl: TTL to use for records that do not specify one
+    """
+    self.records = {}
+    self.wildcard_domains = [dns.name.from_text(x) for x in wildcard_domains]
+    self.default_ttl = default_ttl
+    for source in (DEFAULT_RECORDS, records or {}):
+      for name in source:
+        self.AddRecords(name, source[name])
+
+  def AddRecords(self, name, data):
+    name = str(name).lower()
+    if not name.endswith('.'):
+      name += '.'
+    entry = self.records.setdefault(name, {'ttl': self.default_ttl})
+    for key in data:
+      if key == 'ttl':
+        entry['ttl'] = data[key]
+      else:
+        entry[str(key).upper()] = [str(x) for x in data[key]]
+
+  def AddSanityChecks(self, checks):
+    """Add records which pass a list of (check, expected) config items."""
+    for (req_type, req_name, expected) in health_checks.ParseAnswerChecks(checks):
+      (answer_type, value) = _SynthesizeAnswer(expected[0])
+      self.AddRecords(req_name, {answer_type: [value]})
+
+  def Lookup(self, qname, rdtype):
+    """Look up a name.
+
+    Args:
+      qname: dns.name.Name
+      rdtype: rdatatype (int)
+
+    Returns:
+      (rcode, [(name, type text, ttl, [values])]). CNAME chains are not
+      followed, matching the single-hop records namebench checks for.
+    """
+    name = str(qname).lower()
+    type_text = dns.rdatatype.to_text(rdtype)
+    entry = self.records.get(name)
+    if entry:
+      if type_text in entry:
+        return (dns.rcode.NOERROR, [(name, type_text, entry['ttl'], entry[type_text])])
+      elif 'CNAME' in entry:
+        return (dns.rcode.NOERROR, [(name, 'CNAME', entry['ttl'], entry['CNAME'])])
+      return (dns.rcode.NOERROR, [])
+
+    for domain in self.wildcard_domains:
+      if qname.is_subdomain(domain) and qname != domain:
+        if type_text == 'A':
+          # Deterministic, so that every server hands out the same address.
+          address = '192.0.2.%d' % (hash(name) % 254 + 1)
+          return (dns.rcode.NOERROR, [(name, 'A', self.default_ttl, [address])])
+        return (dns.rcode.NOERROR, [])
+    return (dns.rcode.NXDOMAIN, [])
+
+
+class DnsResponder(object):
+  """Answer DNS queries on a set of loopback IP addresses."""
+
+  def __init__(self, profiles=None, zone=None, port=0, seed=None, timer=time.time):
+    """Constructor.
+
+    Args:
+      profiles: dictionary of ip -> ServerProfile (default: 127.0.0.1)
+      zone: A Zone to answer from
+      port: UDP/TCP port to listen on. 0 picks a free one.
+      seed: seed for the random number generator, for reproducible runs
+      timer: function which returns the current time in seconds
+    """
+    if not profiles:
+      profiles = {'127.0.0.1': ServerProfile()}
+    self.profiles = profiles
+    self.zone = zone or Zone()
+    self.port = port
+    self.timer = timer
+    self.rng = random.Random(seed)
+    self.caches = {}
+    self.query_count = 0
+    self._udp_sockets = {}
+    self._tcp_sockets = {}
+    self._outgoing = []
+    self._lock = threading.Lock()
+    self._thread = None
+    self._halt = False
+
+  def _CreateSocket(self, ip, sock_type):
+    if ':' in ip:
+      sock = socket.socket(socket.AF_INET6, sock_type)
+    else:
+      sock = socket.socket(socket.AF_INET, sock_type)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((ip, self.port))
+    if not self.port:
+      self.port = sock.getsockname()[1]
+    return sock
+
+  def Bind(self):
+    """Bind UDP and TCP sockets for every configured IP."""
+    for ip in sorted(self.profiles):
+      udp_sock = self._CreateSocket(ip, socket.SOCK_DGRAM)
+      udp_sock.setblocking(0)
+      self._udp_sockets[udp_sock] = ip
+      tcp_sock = self._CreateSocket(ip, socket.SOCK_STREAM)
+      tcp_sock.listen(16)
+      self._tcp_sockets[tcp_sock] = ip
+
+  def Start(self):
+    """Bind and answer queries from a background thread."""
+    if not self._udp_sockets:
+      self.Bind()
+    self._halt = False
+    self._thread = threading.Thread(target=self.ServeForever)
+    self._thread.setDaemon(True)
+    self._thread.start()
+
+  def Stop(self):
+    self._halt = True
+    if self._thread:
+      self._thread.join()
+      self._thread = None
+    for sock in self._udp_sockets.keys() + self._tcp_sockets.keys():
+      sock.close()
+    self._udp_sockets = {}
+    self._tcp_sockets = {}
+
+  def CreateNameServers(self):
+    """Return NameServer objects pointed at each responder IP."""
+    servers = []
+    for ip in sorted(self.profiles):
+      ns = nameserver.NameServer(ip, name='responder-%s' % ip)
+      ns.port = self.port
+      servers.append(ns)
+    return servers
+
+  def _GetCache(self, profile):
+    if profile.cache:
+      key = profile.cache
+    else:
+      key = id(profile)
+    if key not in self.caches:
+      self.caches[key] = ResponderCache()
+    return self.caches[key]
+
+  def _ChaosAnswer(self, profile, name):
+    if name == 'version.bind.':
+      return profile.version
+    elif name in ('hostname.bind.', 'id.server.'):
+      return profile.hostname
+    return None
+
+  def HandleQuery(self, ip, wire):
+    """Build the response for a query sent to ip.
+
+    Returns:
+      (response wire data, delay in seconds). The response is None if the
+      query should be dropped.
+    """
+    try:
+      request = dns.message.from_wire(wire)
+    except dns.exception.DNSException:
+      return (None, 0)
+    if not request.question:
+      return (None, 0)
+
+    profile = self.profiles[ip]
+    self._lock.acquire()
+    try:
+      now = self.timer()
+      self.query_count += 1
+      if profile.IsRateLimited(now):
+        return (None, 0)
+      if profile.loss_rate and self.rng.random() < profile.loss_rate:
+        return (None, 0)
+      delay = profile.GetLatency(self.rng)
+      inject_rcode = profile.rcode and self.rng.random() < profile.rcode_rate
+
+      question = request.question[0]
+      name = str(question.name).lower()
+      response = dns.message.make_response(request)
+      response.flags |= dns.flags.RA
+
+      if inject_rcode:
+        response.set_rcode(dns.rcode.from_text(str(profile.rcode)))
+      elif question.rdclass == dns.rdataclass.CH:
+        text = self._ChaosAnswer(profile, name)
+        if text and question.rdtype == dns.rdatatype.TXT:
+          response.answer.append(dns.rrset.from_text(question.name, 0, 'CH', 'TXT',
+                                                     '"%s"' % str(text)))
+        else:
+          response.set_rcode(dns.rcode.REFUSED)
+      else:
+        (rcode, answers) = self.zone.Lookup(question.name, question.rdtype)
+        if rcode == dns.rcode.NXDOMAIN and profile.hijack_ip:
+          if question.rdtype == dns.rdatatype.A:
+            answers = [(name, 'A', 0, [str(profile.hijack_ip)])]
+          rcode = dns.rcode.NOERROR
+        response.set_rcode(rcode)
+        cache = self._GetCache(profile)
+        for (answer_name, type_text, ttl, values) in answers:
+          ttl = cache.GetTtl((answer_name, type_text), ttl, now)
+          response.answer.append(dns.rrset.from_text(answer_name, ttl, 'IN', type_text,
+                                                     *values))
+    finally:
+      self._lock.release()
+    return (response.to_wire(), delay)
+
+  def _ReadUdp(self, sock):
+    ip = self._udp_sockets[sock]
+    while True:
+      try:
+        (wire, address) = sock.recvfrom(MAX_PACKET_SIZE)
+      except socket.error, e:
+        if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+          return
+        continue
+      (response, delay) = self.HandleQuery(ip, wire)
+      if response:
+        heapq.heappush(self._outgoing, (self.timer() + delay, sock, response, address))
+
+  def _SendDueResponses(self):
+    now = self.timer()
+    while self._outgoing and self._outgoing[0][0] <= now:
+      (unused_due, sock, response, address) = heapq.heappop(self._outgoing)
+      try:
+        sock.sendto(response, address)
+      except socket.error:
+        pass
+
+  def _ServeTcpConnection(self, conn, ip):
+    """Answer length-prefixed queries on a TCP connection until it closes."""
+    try:
+      while not self._halt:
+        header = self._RecvAll(conn, 2)
+        if not header:
+          break
+        wire = self._RecvAll(conn, struct.unpack('!H', header)[0])
+        if not wire:
+          break
+        (response, delay) = self.HandleQuery(ip, wire)
+        if not response:
+          break
+        if delay:
+          time.sleep(delay)
+        conn.sendall(struct.pack('!H', len(response)) + response)
+    finally:
+      conn.close()
+
+  def _RecvAll(self, conn, count):
+    data = ''
+    while len(data) < count:
+      try:
+        chunk = conn.recv(count - len(data))
+      except socket.error:
+        return None
+      if not chunk:
+        return None
+      data += chunk
+    return data
+
+  def _AcceptTcp(self, sock):
+    (conn, unused_address) = sock.accept()
+    thread = threading.Thread(target=self._ServeTcpConnection,
+                              args=(conn, self._tcp_sockets[sock]))
+    thread.setDaemon(True)
+    thread.start()
+
+  def ServeForever(self):
+    """Answer queries until Stop() is called."""
+    sockets = self._udp_sockets.keys() + self._tcp_sockets.keys()
+    while not self._halt:
+      if self._outgoing:
+        wait = min(max(self._outgoing[0][0] - self.timer(), 0), POLL_INTERVAL)
+      else:
+        wait = POLL_INTERVAL
+      try:
+        (readable, unused_w, unused_x) = select.select(sockets, [], [], wait)
+      except select.error, e:
+        if e.args[0] == errno.EINTR:
+          continue
+        raise
+      for sock in readable:
+        if sock in self._udp_sockets:
+          self._ReadUdp(sock)
+        else:
+          self._AcceptTcp(sock)
+      self._SendDueResponses()
+
+
+def CreateFromConfig(config, port=0, seed=None):
+  """Create a DnsResponder from a dictionary (as found in a JSON config file)."""
+  profiles = {}
+  for ip, settings in config.get('servers', {'127.0.0.1': {}}).items():
+    profiles[ip] = ServerProfile(**dict([(str(k), v) for (k, v) in settings.items()]))
+  zone = Zone(records=config.get('records'),
+              wildcard_domains=config.get('wildcard_domains',
+                                          health_checks.WILDCARD_DOMAINS),
+              default_ttl=config.get('default_ttl', DEFAULT_TTL))
+  if config.get('sanity_checks'):
+    import config as namebench_config
+    zone.AddSanityChecks(namebench_config.GetLocalSanityChecks()['primary'])
+  return DnsResponder(profiles, zone=zone, port=config.get('port', port),
+                      seed=config.get('seed', seed))
+
+
+def LaunchSubprocess(config_path, port=0):
+  """Run a responder in a child process.
+
+  Returns:
+    (subprocess.Popen object, port the responder is listening on)
+
+  Raises:
+    OSError: if the child process can not be run at all.
+    ResponderError: if the child did not get as far as answering queries.
+  """
+  import subprocess
+  child = subprocess.Popen([sys.executable, SCRIPT_PATH, config_path, str(port)],
+                           stdout=subprocess.PIPE)
+  line = child.stdout.readline().split()
+  if not line or line[0] != READY_TEXT:
+    if child.poll() is None:
+      child.kill()
+    child.wait()
+    raise ResponderError('DNS responder exited (status %s) before it was ready' %
+                         child.returncode)
+  return (child, int(line[1]))
+
+
+if __name__ == '__main__':
+  if len(sys.argv) < 2:
+    print 'Usage: %s <config.json> [port]' % sys.argv[0]
+    sys.exit(1)
+  if len(sys.argv) > 2:
+    listen_port = int(sys.argv[2])
+  else:
+    listen_port = 0
+  responder = CreateFromConfig(simplejson.load(open(sys.argv[1])), port=listen_port)
+  responder.Bind()
+  print '%s %s' % (READY_TEXT, responder.port)
+  sys.stdout.flush()
+  try:
+    responder.ServeForever()
+  except KeyboardInterrupt:
+    pass
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the dns_responder module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import os
+import tempfile
+import unittest
+
+# external dependencies (from nb_third_party)
+import dns.message
+import dns.query
+import dns.rcode
+import simplejson
+
+import dns_responder
+import health_checks
+
+
+class FakeTimer(object):
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+
+class DnsResponderTest(unittest.TestCase):
+  def setUp(self):
+    self.responder = None
+
+  def tearDown(self):
+    if self.responder:
+      self.responder.Stop()
+
+  def StartResponder(self, profiles, **kwargs):
+    self.responder = dns_responder.DnsResponder(profiles, **kwargs)
+    self.responder.Start()
+    return self.responder.CreateNameServers()
+
+  def testAnswers(self):
+    zone = dns_responder.Zone(records={'www.example.com.': {'A': ['192.0.2.7']}})
+    ns = self.StartResponder({'127.0.0.1': dns_responder.ServerProfile(latency=30)},
+                             zone=zone)[0]
+    (response, duration, error_msg) = ns.TimedRequest('A', 'www.example.com.')
+    self.assertEquals(error_msg, None)
+    self.assertEquals(response.answer[0].items[0].address, '192.0.2.7')
+    self.assertTrue(duration >= 30)
+    self.assertEquals(ns.TestARootServerResponse()[0:2], (False, None))
+    self.assertEquals(ns.TestNegativeResponse()[0:2], (False, None))
+    response = ns.TimedRequest('A', 'namebench1.blogspot.com.')[0]
+    self.assertTrue(response.answer)
+
+  def testHijackAndChaos(self):
+    profile = dns_responder.ServerProfile(hijack_ip='10.1.1.1', version='9.7.1-P2',
+                                          hostname='node7')
+    ns = self.StartResponder({'127.0.0.1': profile})[0]
+    self.assertEquals(ns.TestNegativeResponse()[1], 'NXDOMAIN Hijacking')
+    self.assertEquals(ns.GetVersion()[0], '9.7.1-P2')
+    self.assertEquals(ns.GetNodeIdWithDuration()[0], 'node7')
+
+  def testRcodeAndLoss(self):
+    profiles = {'127.0.0.1': dns_responder.ServerProfile(rcode='SERVFAIL', rcode_rate=1),
+                '127.0.0.2': dns_responder.ServerProfile(loss_rate=1)}
+    (failing, lossy) = self.StartResponder(profiles)
+    response = failing.TimedRequest('A', 'a.root-servers.net.')[0]
+    self.assertEquals(response.rcode(), dns.rcode.SERVFAIL)
+    (response, unused_duration, error_msg) = lossy.TimedRequest('A', 'a.root-servers.net.',
+                                                                timeout=0.2)
+    self.assertEquals(response, None)
+
+  def testSharedCache(self):
+    timer = FakeTimer()
+    profiles = {'127.0.0.1': dns_responder.ServerProfile(cache='anycast'),
+                '127.0.0.2': dns_responder.ServerProfile(cache='anycast'),
+                '127.0.0.3': dns_responder.ServerProfile()}
+    (first, second, private) = self.StartResponder(profiles, timer=timer)
+    first.timer = timer
+    second.timer = timer
+    private.timer = timer
+    hostname = 'namebench42.wordpress.com.'
+    first.cache_checks = [(hostname, first.TimedRequest('A', hostname)[0], timer())]
+    timer.now += 10
+    self.assertEquals(second.TimedRequest('A', hostname)[0].answer[0].ttl,
+                      dns_responder.DEFAULT_TTL - 10)
+    self.assertEquals(second.TestSharedCache(first), first)
+    self.assertEquals(private.TestSharedCache(first), False)
+
+  def testRateLimit(self):
+    timer = FakeTimer()
+    profile = dns_responder.ServerProfile(rate_limit=2)
+    self.assertEquals([profile.IsRateLimited(timer()) for x in range(3)],
+                      [False, False, True])
+    timer.now += 0.5
+    self.assertEquals(profile.IsRateLimited(timer()), False)
+    self.assertEquals(profile.IsRateLimited(timer()), True)
+
+  def testTcp(self):
+    ns = self.StartResponder({'127.0.0.1': dns_responder.ServerProfile()})[0]
+    request = dns.message.make_query('a.root-servers.net.', 'A')
+    response = dns.query.tcp(request, '127.0.0.1', timeout=2, port=ns.port)
+    self.assertEquals(response.answer[0].items[0].address, '198.41.0.4')
+
+  def testSanityChecks(self):
+    zone = dns_responder.Zone()
+    zone.AddSanityChecks([('A google.com.', '74.125.,66.102.9.'),
+                          ('A www.google.com.', 'www.l.google.com.')])
+    ns = self.StartResponder({'127.0.0.1': dns_responder.ServerProfile()}, zone=zone)[0]
+    checks = health_checks.RunCensorshipChecks([ns], [('A google.com.', '74.125.'),
+                                                      ('A www.google.com.', 'www.l.google.com.')],
+                                               timeout=2)
+    self.assertEquals(checks[ns]['google.com.'], (False, None, health_checks.ANSWER_OK))
+    self.assertEquals(checks[ns]['www.google.com.'], (False, None, health_checks.ANSWER_OK))
+
+  def testCensorshipChecksPerType(self):
+    zone = dns_responder.Zone(records={
+        'www.example.com.': {'A': ['192.0.2.1'], 'AAAA': ['2001:db8::66']},
+        'example.org.': {'A': ['192.0.2.2'], 'AAAA': ['2001:db8::2']}})
+    ns = self.StartResponder({'127.0.0.1': dns_responder.ServerProfile()}, zone=zone)[0]
+    checks = health_checks.RunCensorshipChecks([ns], [('A www.example.com.', '192.0.2.1'),
+                                                      ('AAAA www.example.com.', '2001:db8::1'),
+                                                      ('A example.org.', '192.0.2.2'),
+                                                      ('AAAA example.org.', '2001:db8::2')],
+                                               timeout=2)
+    # A wrong AAAA answer is not hidden by a correct A answer for the same name.
+    self.assertEquals(checks[ns]['www.example.com.'],
+                      (False, 'www.example.com appears incorrect: 2001:db8::66',
+                       health_checks.ANSWER_INCORRECT))
+    self.assertEquals(checks[ns]['example.org.'], (False, None, health_checks.ANSWER_OK))
+
+  def testSubprocess(self):
+    (fd, path) = tempfile.mkstemp()
+    os.write(fd, simplejson.dumps({'servers': {'127.0.0.1': {'version': 'child'}}}))
+    os.close(fd)
+    try:
+      (child, port) = dns_responder.LaunchSubprocess(path)
+      try:
+        request = dns.message.make_query('version.bind.', 'TXT', 'CHAOS')
+        response = dns.query.udp(request, '127.0.0.1', timeout=2, port=port)
+        self.assertEquals(response.answer[0].items[0].strings, ['child'])
+      finally:
+        child.terminate()
+        child.wait()
+    finally:
+      os.unlink(path)
+
+  def testSubprocessFromAnywhere(self):
+    # The child finds its libraries without help from PYTHONPATH or the cwd.
+    (fd, path) = tempfile.mkstemp()
+    os.write(fd, simplejson.dumps({'servers': {'127.0.0.1': {}}}))
+    os.close(fd)
+    saved_cwd = os.getcwd()
+    saved_path = os.environ.pop('PYTHONPATH', None)
+    os.chdir('/')
+    try:
+      (child, port) = dns_responder.LaunchSubprocess(path)
+      child.terminate()
+      child.wait()
+    finally:
+      os.chdir(saved_cwd)
+      if saved_path is not None:
+        os.environ['PYTHONPATH'] = saved_path
+      os.unlink(path)
+
+  def testSubprocessFailure(self):
+    (fd, path) = tempfile.mkstemp()
+    os.write(fd, 'not json')
+    os.close(fd)
+    try:
+      self.assertRaises(dns_responder.ResponderError, dns_responder.LaunchSubprocess, path)
+    finally:
+      os.unlink(path)
+
+
+if __name__ == '__main__':
+  unittest.main()
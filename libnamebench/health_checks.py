@@ -17,13 +17,18 @@
 
 __author__ = 'tstromberg@google.com (Thomas Stromberg)'
 
-import random
 import sys
 import time
-import util
 
+# external dependencies (from nb_third_party)
+import dns.name
+import dns.rdataclass
+import dns.rdatatype
 from dns import rcode
 
+import query_multiplexer
+import util
+
 WILDCARD_DOMAINS = ('live.com.', 'blogspot.com.', 'wordpress.com.')
 LIKELY_HIJACKS = ['www.google.com.', 'windowsupdate.microsoft.com.', 'www.paypal.com.']
 
@@ -36,6 +41,161 @@ TOTAL_WILDCARDS_TO_STORE = 3
 
 FATAL_RCODES = ['REFUSED', 'NOTAUTH']
 
+# Possible outcomes of EvaluateAnswerResponse()
+ANSWER_OK = 'ok'
+ANSWER_REFUSED = 'refused'
+NO_ANSWER = 'no answer'
+ANSWER_INCORRECT = 'incorrect'
+ANSWER_HIJACKED = 'hijacked'
+NO_RESPONSE = 'timeout'
+
+# The outcomes above, from least to most worrying.
+STATUS_SEVERITY = (ANSWER_OK, NO_ANSWER, NO_RESPONSE, ANSWER_REFUSED, ANSWER_INCORRECT,
+                   ANSWER_HIJACKED)
+
+
+def EvaluateAnswerResponse(response, record, expected, critical=False):
+  """Compare the answers in a DNS response to what we expect to see.
+
+  Args:
+    response: A dns.message.Message response
+    record: string that was queried for
+    expected: tuple of strings expected in all answers
+    critical: If this query fails, should it count against the server.
+
+  Returns:
+    (is_broken, error_msg, status)
+  """
+  is_broken = False
+  error_msg = None
+  status = ANSWER_OK
+  unmatched_answers = []
+  response_code = rcode.to_text(response.rcode())
+  if response_code in FATAL_RCODES:
+    error_msg = 'Responded with: %s' % response_code
+    status = ANSWER_REFUSED
+    if critical:
+      is_broken = True
+  elif not response.answer:
+    error_msg = 'No answer (%s): %s' % (response_code, record)
+    status = NO_ANSWER
+    is_broken = True
+  else:
+    found_usable_record = False
+    for answer in response.answer:
+      if found_usable_record:
+        break
+
+      # Process the first sane rdata object available in the answers
+      for rdata in answer:
+        # CNAME
+        if rdata.rdtype == 5:
+          reply = str(rdata.target)
+        # A or AAAA Record
+        elif rdata.rdtype in (1, 28):
+          reply = str(rdata.address)
+        else:
+          continue
+
+        found_usable_record = True
+        found_match = False
+        for string in expected:
+          if reply.startswith(string) or reply.endswith(string):
+            found_match = True
+            break
+        if not found_match:
+          unmatched_answers.append(reply)
+
+    if unmatched_answers:
+      hijack_text = ', '.join(unmatched_answers).rstrip('.')
+      if record in LIKELY_HIJACKS:
+        error_msg = '%s is hijacked: %s' % (record.rstrip('.'), hijack_text)
+        status = ANSWER_HIJACKED
+      else:
+        error_msg = '%s appears incorrect: %s' % (record.rstrip('.'), hijack_text)
+        status = ANSWER_INCORRECT
+  return (is_broken, error_msg, status)
+
+
+def ParseAnswerChecks(checks):
+  """Turn sanity check config items into (type, record, expected values) tuples."""
+  parsed = []
+  for (check, expected_value) in checks:
+    (req_type, req_name) = check.split(' ')
+    parsed.append((req_type.upper(), req_name, expected_value.split(',')))
+  return parsed
+
+
+def _CombineResults(results):
+  """Merge the (is_broken, warning, status) results of checks for the same name."""
+  if len(results) == 1:
+    return results[0]
+  is_broken = bool([x for x in results if x[0]])
+  warnings = [x[1] for x in results if x[1]]
+  status = max([x[2] for x in results], key=STATUS_SEVERITY.index)
+  return (is_broken, '; '.join(warnings) or None, status)
+
+
+def RunCensorshipChecks(nameservers, checks, timeout=CENSORSHIP_TIMEOUT):
+  """Run every censorship check against every nameserver at the same time.
+
+  Args:
+    nameservers: A list of NameServer objects
+    checks: A list of (check, expected) config items
+    timeout: Deadline for the whole batch (seconds)
+
+  Returns:
+    A dictionary of nameserver -> {record: (is_broken, warning, status)}.
+    When a record is checked for more than one type (A and AAAA, say), its
+    result is the worst of them.
+
+  All queries are sent at once over a single socket. Anything unanswered
+  halfway to the deadline is sent a second time, so the whole phase takes
+  at most one timeout no matter how many servers or domains are checked.
+  """
+  parsed_checks = ParseAnswerChecks(checks)
+  pending = {}
+  for ns in nameservers:
+    for (req_type, req_name, expected) in parsed_checks:
+      pending[(ns, req_type, req_name)] = expected
+
+  # (ns, req_type, req_name) -> (is_broken, warning, status)
+  results = {}
+  expiration = time.time() + timeout
+  for deadline in (time.time() + (timeout / 2.0), expiration):
+    if not pending:
+      break
+    requests = []
+    for (ns, req_type, req_name) in pending:
+      request = ns.CreateRequest(dns.name.from_text(req_name, None),
+                                 dns.rdatatype.from_text(req_type),
+                                 dns.rdataclass.IN)
+      requests.append(((ns, req_type, req_name), ns.ip, request, ns.port))
+
+    multiplexer = query_multiplexer.QueryMultiplexer(phase='censorship')
+    try:
+      answers = multiplexer.Query(requests, max(deadline - time.time(), 0))
+    finally:
+      multiplexer.Close()
+
+    for key in answers:
+      response = answers[key][0]
+      if response:
+        expected = pending.pop(key)
+        results[key] = EvaluateAnswerResponse(response, key[2], expected)
+
+  for key in pending:
+    results[key] = (True, 'No response', NO_RESPONSE)
+
+  by_name = {}
+  for (ns, req_type, req_name) in sorted(results, key=lambda x: x[1]):
+    by_name.setdefault((ns, req_name), []).append(results[(ns, req_type, req_name)])
+  matrix = dict([(ns, {}) for ns in nameservers])
+  for (ns, req_name) in by_name:
+    matrix[ns][req_name] = _CombineResults(by_name[(ns, req_name)])
+  return matrix
+
+
 class NameServerHealthChecks(object):
   """Health checks for a nameserver."""
 
@@ -52,54 +212,15 @@ class NameServerHealthChecks(object):
     Returns:
       (is_broken, error_msg, duration)
     """
-    is_broken = False
-    unmatched_answers = []
     if not timeout:
       timeout = self.health_timeout
     (response, duration, error_msg) = self.TimedRequest(record_type, record, timeout)
     if response:
-      response_code = rcode.to_text(response.rcode())
-      if response_code in FATAL_RCODES:
-        error_msg = 'Responded with: %s' % response_code
-        if critical:
-          is_broken = True
-      elif not response.answer:
-        # Avoid preferring broken DNS servers that respond quickly
+      (is_broken, error_msg, status) = EvaluateAnswerResponse(response, record, expected,
+                                                             critical=critical)
+      # Avoid preferring broken DNS servers that respond quickly
+      if status == NO_ANSWER:
         duration = util.SecondsToMilliseconds(self.health_timeout)
-        error_msg = 'No answer (%s): %s' % (response_code, record)
-        is_broken = True
-      else:
-        found_usable_record = False
-        for answer in response.answer:
-          if found_usable_record:
-            break
-
-          # Process the first sane rdata object available in the answers
-          for rdata in answer:
-            # CNAME
-            if rdata.rdtype == 5:
-              reply = str(rdata.target)
-            # A Record
-            elif rdata.rdtype == 1:
-              reply = str(rdata.address)
-            else:
-              continue
-
-            found_usable_record = True
-            found_match = False
-            for string in expected:
-              if reply.startswith(string) or reply.endswith(string):
-                found_match = True
-                break
-            if not found_match:
-              unmatched_answers.append(reply)
-
-        if unmatched_answers:
-          hijack_text = ', '.join(unmatched_answers).rstrip('.')
-          if record in LIKELY_HIJACKS:
-            error_msg = '%s is hijacked: %s' % (record.rstrip('.'), hijack_text)
-          else:
-            error_msg = '%s appears incorrect: %s' % (record.rstrip('.'), hijack_text)
     else:
       if not error_msg:
         error_msg = 'No response'
@@ -126,7 +247,7 @@ class NameServerHealthChecks(object):
     else:
       hostname = 'test'
       warning_suffix = ''
-    poison_test = '%s.nb%s.google.com.' % (hostname, random.random())
+    poison_test = '%s.nb%s.google.com.' % (hostname, self.rng.random())
     (response, duration, error_msg) = self.TimedRequest('A', poison_test,
                                                         timeout=self.health_timeout*2)
     if not response:
@@ -155,8 +276,8 @@ class NameServerHealthChecks(object):
       if len(attempted) == MAX_STORE_ATTEMPTS:
         self.DisableWithMessage('Unable to get uncached results for: %s' % ', '.join(attempted))
         return False
-      domain = random.choice(WILDCARD_DOMAINS)
-      hostname = 'namebench%s.%s' % (random.randint(1, 2**32), domain)
+      domain = self.rng.choice(WILDCARD_DOMAINS)
+      hostname = 'namebench%s.%s' % (self.rng.randint(1, 2**32), domain)
       attempted.append(hostname)
       response = self.TimedRequest('A', hostname, timeout=timeout)[0]
       if response and response.answer:
@@ -214,16 +335,12 @@ class NameServerHealthChecks(object):
 
   def CheckCensorship(self, tests):
     """Check to see if results from a nameserver are being censored."""
-    for (check, expected) in tests:
-      (req_type, req_name) = check.split(' ')
-      expected_values = expected.split(',')
-      is_broken, warning = self.TestAnswers(req_type.upper(), req_name, expected_values,
-                                            timeout=CENSORSHIP_TIMEOUT)[0:2]
-      if is_broken:
-        is_broken, warning = self.TestAnswers(req_type.upper(), req_name, expected_values,
-                                              timeout=CENSORSHIP_TIMEOUT)[0:2]
+    results = RunCensorshipChecks([self], tests)[self]
+    for req_name in results:
+      warning = results[req_name][1]
       if warning:
         self.AddWarning(warning, penalty=False)
+    return results
 
   def CheckHealth(self, sanity_checks=None, fast_check=False, final_check=False, port_check=False):
     """Qualify a nameserver to see if it is any good."""
@@ -242,10 +359,8 @@ class NameServerHealthChecks(object):
       tests = [(self.TestNegativeResponse, []), (self.TestBindVersion, [])]
 
     if sanity_checks:
-      for (check, expected_value) in sanity_checks:
-        (req_type, req_name) = check.split(' ')
-        expected_values = expected_value.split(',')
-        tests.append((self.TestAnswers, [req_type.upper(), req_name, expected_values]))
+      for (req_type, req_name, expected_values) in ParseAnswerChecks(sanity_checks):
+        tests.append((self.TestAnswers, [req_type, req_name, expected_values]))
 
     for test in tests:
       (function, args) = test
@@ -0,0 +1,150 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Read host popularity out of Chrome and Firefox SQLite history databases.
+
+Rather than scanning the raw bytes for URLs (which finds freed pages, and
+knows nothing about how often a site is visited), the database is copied
+aside and asked for the visit count and most recent visit of every host in
+a single aggregate query. Each host is weighted by its visit count, decayed
+by how long ago it was last visited.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import os
+import os.path
+import re
+import shutil
+import tempfile
+import time
+
+try:
+  import sqlite3
+except ImportError:
+  sqlite3 = None
+
+SQLITE_MAGIC = 'SQLite format 3\x00'
+
+# A visit this many days ago counts half as much as one today.
+RECENCY_HALF_LIFE_DAYS = 30.0
+
+# Chrome counts microseconds since 1601-01-01, Firefox since 1970-01-01.
+CHROME_EPOCH_OFFSET = 11644473600
+
+URL_HOST_RE = re.compile('^https?://(?:[^/@]*@)?([\-\w]+\.[\-\w\.]+)')
+
+CHROME_QUERY = """
+    SELECT url_host(url) AS host, SUM(visit_count), MAX(last_visit_time)
+    FROM urls WHERE visit_count > 0 GROUP BY host"""
+
+FIREFOX_QUERY = """
+    SELECT rev_host, SUM(visit_count), MAX(last_visit_date)
+    FROM moz_places WHERE visit_count > 0 AND rev_host IS NOT NULL
+    GROUP BY rev_host"""
+
+
+def IsSqliteFile(path):
+  """Whether or not a file is an SQLite 3 database."""
+  fp = open(path, 'rb')
+  try:
+    return fp.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+  finally:
+    fp.close()
+
+
+def _UrlHost(url):
+  if url:
+    match = URL_HOST_RE.match(url)
+    if match:
+      return match.group(1).lower()
+  return None
+
+
+def _RecencyWeight(last_visit, now):
+  if not last_visit:
+    return 1.0
+  age_days = max(now - last_visit, 0) / 86400.0
+  return 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+
+
+def _CopyDatabase(path):
+  """Copy a database (and its journal) aside, as the browser may hold a lock on it."""
+  tmp_dir = tempfile.mkdtemp(prefix='namebench-history.')
+  copy_path = os.path.join(tmp_dir, 'history.sqlite')
+  shutil.copyfile(path, copy_path)
+  for suffix in ('-wal', '-journal'):
+    if os.path.exists(path + suffix):
+      shutil.copyfile(path + suffix, copy_path + suffix)
+  return (tmp_dir, copy_path)
+
+
+def _ChromeHosts(conn):
+  conn.create_function('url_host', 1, _UrlHost)
+  for (host, visits, last_visit) in conn.execute(CHROME_QUERY):
+    if host:
+      if last_visit:
+        last_visit = last_visit / 1000000.0 - CHROME_EPOCH_OFFSET
+      yield (host, visits, last_visit)
+
+
+def _FirefoxHosts(conn):
+  for (rev_host, visits, last_visit) in conn.execute(FIREFOX_QUERY):
+    # rev_host is stored backwards, with a trailing dot: moc.elgoog.www.
+    host = rev_host[::-1].lstrip('.').lower()
+    if '.' in host:
+      if last_visit:
+        last_visit = last_visit / 1000000.0
+      yield (host, visits, last_visit)
+
+
+def ReadHostPopularity(path, now=None):
+  """Return hosts from a browser history database, most popular first.
+
+  Args:
+    path: path to a Chrome History or Firefox places.sqlite file
+    now: current time, in seconds since the epoch (optional)
+
+  Returns:
+    A list of (hostname, weight) tuples, or None if the file is not a
+    history database we know how to read.
+  """
+  if not sqlite3 or not IsSqliteFile(path):
+    return None
+  if not now:
+    now = time.time()
+
+  (tmp_dir, copy_path) = _CopyDatabase(path)
+  try:
+    conn = sqlite3.connect(copy_path)
+    try:
+      tables = set([x[0] for x in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")])
+      if 'urls' in tables:
+        hosts = _ChromeHosts(conn)
+      elif 'moz_places' in tables:
+        hosts = _FirefoxHosts(conn)
+      else:
+        return None
+
+      weights = {}
+      for (host, visits, last_visit) in hosts:
+        weights[host] = weights.get(host, 0) + visits * _RecencyWeight(last_visit, now)
+    finally:
+      conn.close()
+  except sqlite3.DatabaseError:
+    return None
+  finally:
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+  return sorted(weights.items(), key=lambda x: (-x[1], x[0]))
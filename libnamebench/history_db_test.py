@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the history_db module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import data_sources
+import history_db
+
+NOW = 1287446400.0
+DAY = 86400
+
+
+class HistoryDbTest(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def _CreateDatabase(self, name, schema, rows):
+    path = os.path.join(self.tmp_dir, name)
+    conn = sqlite3.connect(path)
+    conn.execute(schema)
+    conn.executemany('INSERT INTO %s VALUES (?, ?, ?, ?)' % schema.split()[2], rows)
+    conn.commit()
+    conn.close()
+    return path
+
+  def _CreateChromeHistory(self):
+    chrome_time = lambda days_ago: int((NOW - days_ago * DAY + history_db.CHROME_EPOCH_OFFSET) * 1000000)
+    return self._CreateDatabase(
+        'History', 'CREATE TABLE urls (id INTEGER, url TEXT, visit_count INTEGER, last_visit_time INTEGER)',
+        [(1, 'http://www.google.com/search?q=1', 40, chrome_time(0)),
+         (2, 'https://www.google.com/mail', 20, chrome_time(1)),
+         (3, 'http://news.example.org/', 100, chrome_time(60)),
+         (4, 'http://rare.example.net/', 2, chrome_time(0)),
+         (5, 'http://never.example.net/', 0, chrome_time(0)),
+         (6, 'file:///etc/passwd', 9, chrome_time(0))])
+
+  def testChrome(self):
+    path = self._CreateChromeHistory()
+    popularity = history_db.ReadHostPopularity(path, now=NOW)
+    self.assertEquals([x[0] for x in popularity],
+                      ['www.google.com', 'news.example.org', 'rare.example.net'])
+    # 100 visits, last seen two half-lives ago.
+    self.assertAlmostEquals(popularity[1][1], 25.0)
+    # Visits are summed per host, and decayed from the most recent one.
+    self.assertEquals(popularity[0][1], 60.0)
+
+  def testFirefox(self):
+    path = self._CreateDatabase(
+        'places.sqlite', 'CREATE TABLE moz_places (id INTEGER, rev_host TEXT, visit_count INTEGER, last_visit_date INTEGER)',
+        [(1, 'moc.elgoog.www.', 3, int(NOW * 1000000)),
+         (2, 'moc.elgoog.www.', 4, None),
+         (3, 'gro.elpmaxe.', 5, int((NOW - 30 * DAY) * 1000000)),
+         (4, None, 8, None),
+         (5, '.', 8, None)])
+    self.assertEquals(history_db.ReadHostPopularity(path, now=NOW),
+                      [('www.google.com', 7.0), ('example.org', 2.5)])
+
+  def testNotADatabase(self):
+    path = os.path.join(self.tmp_dir, 'history.dat')
+    open(path, 'w').write('http://www.google.com/\n' * 10)
+    self.assertEquals(history_db.ReadHostPopularity(path), None)
+
+  def testPopularitySource(self):
+    path = self._CreateChromeHistory()
+    ds = data_sources.DataSources(status_callback=lambda *args, **kwargs: None, cache_path=None)
+    records = ds.GetTestsFromSource(path, count=20, select_mode='automatic')
+    self.assertEquals(len(records), 20)
+    hosts = set([x[1] for x in records])
+    self.assertTrue(hosts.issubset(set(['www.google.com.', 'news.example.org.',
+                                        'rare.example.net.'])))
+    self.assertTrue('www.google.com.' in hosts)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,107 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Stream hostnames out of browser history files without reading them in.
+
+The file is memory-mapped, and the URL regexp is run over one window at a
+time. Each window is scanned a little past its end, so that a URL which
+straddles the boundary is still seen whole. A match belongs to the window
+it starts in, and the next window resumes where the last match ended.
+
+The regexp bounds how much it may match (or look at) to less than the
+overlap, so the hostnames are exactly those that a findall over the whole
+file returns. Hostnames longer than that bound are not valid anyway, and are
+cut short in the same place wherever they are found.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import mmap
+import random
+import re
+
+# This regexp is fairly general (no ip filtering), since we need speed more
+# than precision at this stage. Each part of the hostname is bounded by the
+# longest valid hostname (253 characters).
+URL_HOST_RE = re.compile('https?://([\-\w]{1,253}\.[\-\w\.]{1,253})')
+
+WINDOW_SIZE = 4 * 1024 * 1024
+
+# Longer than the longest match of URL_HOST_RE: 8 + 253 + 1 + 253 characters.
+WINDOW_OVERLAP = 1024
+
+
+def ScanHostnames(path, window_size=WINDOW_SIZE, overlap=WINDOW_OVERLAP):
+  """Yield each hostname found in a URL within a file, in file order.
+
+  Args:
+    path: filename to scan
+    window_size: how many bytes to scan at a time (int)
+    overlap: how far past a window a URL starting within it may extend (int)
+
+  Yields:
+    hostnames (str)
+  """
+  fp = open(path, 'rb')
+  try:
+    try:
+      data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, mmap.error):
+      # Empty files can not be mapped.
+      return
+    try:
+      size = len(data)
+      position = 0
+      for window_start in xrange(0, size, window_size):
+        window_end = window_start + window_size
+        for match in URL_HOST_RE.finditer(data, max(position, window_start),
+                                          min(window_end + overlap, size)):
+          if match.start() >= window_end:
+            break
+          position = match.end()
+          yield match.group(1)
+    finally:
+      data.close()
+  finally:
+    fp.close()
+
+
+def ExtractHostnames(path, limit=None):
+  """Return a list of the hostnames found within a file, in file order.
+
+  Once more than limit hostnames have been found, the rest of the file is
+  reservoir-sampled: the list keeps a uniformly random limit of them, still in
+  the order they appear, rather than only those from the start of the file.
+
+  Args:
+    path: filename to scan
+    limit: the most hostnames to return (int, optional)
+
+  Returns:
+    list of hostnames (str)
+  """
+  hostnames = []
+  positions = []
+  for (index, hostname) in enumerate(ScanHostnames(path)):
+    if limit is None or index < limit:
+      hostnames.append(hostname)
+      positions.append(index)
+    else:
+      slot = random.randint(0, index)
+      if slot < limit:
+        hostnames[slot] = hostname
+        positions[slot] = index
+  if limit is not None and len(positions) == limit:
+    hostnames = [x[1] for x in sorted(zip(positions, hostnames))]
+  return hostnames
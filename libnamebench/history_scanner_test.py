@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the history_scanner module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import os
+import random
+import tempfile
+import unittest
+
+import history_scanner
+
+
+class HistoryScannerTest(unittest.TestCase):
+  def setUp(self):
+    (fd, self.path) = tempfile.mkstemp()
+    os.close(fd)
+
+  def tearDown(self):
+    os.unlink(self.path)
+
+  def testMatchesFindall(self):
+    rng = random.Random(41)
+    chunks = []
+    for _ in range(3000):
+      if rng.random() < 0.3:
+        chunks.append('%s://%s.example%d.com/path?q=%d' % (
+            rng.choice(['http', 'https']), 'www' * rng.randint(1, 30),
+            rng.randint(0, 99), rng.randint(0, 9)))
+      else:
+        chunks.append(''.join([chr(rng.randint(0, 255)) for _ in range(rng.randint(1, 40))]))
+    content = ''.join(chunks)
+    open(self.path, 'wb').write(content)
+
+    expected = history_scanner.URL_HOST_RE.findall(content)
+    self.assertTrue(len(expected) > 800)
+    # Small windows, so that many URLs straddle a boundary.
+    for window_size in (97, 1000, 4096, len(content) * 2):
+      self.assertEquals(list(history_scanner.ScanHostnames(self.path, window_size=window_size)),
+                        expected)
+    self.assertEquals(history_scanner.ExtractHostnames(self.path), expected)
+
+  def testSampledHostnames(self):
+    hostnames = ['host%d.example.com' % x for x in range(1000)]
+    open(self.path, 'wb').write(''.join(['http://%s/ ' % x for x in hostnames]))
+    self.assertEquals(history_scanner.ExtractHostnames(self.path, limit=1000), hostnames)
+
+    # Past the limit, hosts are sampled from the whole file and kept in order.
+    random.seed(41)
+    sample = history_scanner.ExtractHostnames(self.path, limit=100)
+    self.assertEquals(len(sample), 100)
+    indexes = [hostnames.index(x) for x in sample]
+    self.assertEquals(indexes, sorted(set(indexes)))
+    self.assertTrue(indexes[-1] >= 500, indexes)
+
+  def testLongHostnames(self):
+    # Hostnames longer than the window overlap, straddling window boundaries.
+    hostname = '.'.join(['%s%d' % ('a' * 58, x) for x in range(20)])
+    content = ''.join(['%sxhttp://%s/ ' % ('-' * x, hostname) for x in range(0, 1400, 14)])
+    open(self.path, 'wb').write(content)
+
+    expected = history_scanner.URL_HOST_RE.findall(content)
+    self.assertEquals(len(expected), 100)
+    self.assertTrue(len(hostname) > history_scanner.WINDOW_OVERLAP)
+    self.assertEquals(expected[0], hostname[:59 + 1 + 253])
+    for window_size in (97, 600, 1000, 2500):
+      self.assertEquals(list(history_scanner.ScanHostnames(self.path, window_size=window_size)),
+                        expected)
+
+  def testEmptyFile(self):
+    self.assertEquals(history_scanner.ExtractHostnames(self.path), [])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,176 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""UDP queries timed using the kernel's packet receive timestamp (Linux).
+
+Timing a query in user space includes however long the thread waited to be
+scheduled after the answer arrived, which adds up under heavy thread load.
+Here the send time is taken immediately before sendto(), and the receive
+time is the moment the kernel queued the packet: read from SCM_TIMESTAMPNS
+ancillary data where recvmsg() exists, or the SIOCGSTAMPNS ioctl otherwise.
+
+Kernel timestamps use the wall clock, so every sample is checked against a
+user-space reading taken right after the packet is read. A receive stamp
+outside of [send time, read time] means the clock was stepped, and the
+user-space duration is used instead.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import errno
+import select
+import socket
+import struct
+import sys
+import time
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+# external dependencies (from nb_third_party)
+import dns.exception
+import dns.inet
+import dns.message
+import dns.query
+
+# From <asm-generic/sockios.h> and <asm-generic/socket.h>
+SIOCGSTAMPNS = 0x8907
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35)
+SCM_TIMESTAMPNS = SO_TIMESTAMPNS
+TIMESPEC_FORMAT = 'll'
+TIMESPEC_SIZE = struct.calcsize(TIMESPEC_FORMAT)
+MAX_PACKET_SIZE = 65535
+
+# Linux switches packet timestamping on globally, from a deferred work queue,
+# while any socket has asked for it. Holding one such socket open for the
+# life of the process keeps it from flapping off and on between queries,
+# which would leave some packets stamped when they are read, not received.
+_ANCHOR_SOCKET = None
+
+
+def IsAvailable():
+  """Can we get kernel receive timestamps on this platform?"""
+  return sys.platform.startswith('linux') and (fcntl or hasattr(socket.socket, 'recvmsg'))
+
+
+def _UnpackTimespec(data):
+  (seconds, nanoseconds) = struct.unpack(TIMESPEC_FORMAT, data[0:TIMESPEC_SIZE])
+  return seconds + nanoseconds / 1000000000.0
+
+
+def Prepare():
+  """Turn on kernel timestamping ahead of the first query."""
+  global _ANCHOR_SOCKET
+  if not _ANCHOR_SOCKET:
+    _ANCHOR_SOCKET = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    _EnableTimestamps(_ANCHOR_SOCKET)
+
+
+def _EnableTimestamps(sock):
+  if hasattr(sock, 'recvmsg'):
+    sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+  else:
+    # The first SIOCGSTAMPNS call turns timestamping on for the socket, and
+    # fails with ENOENT as nothing has been received yet.
+    try:
+      fcntl.ioctl(sock, SIOCGSTAMPNS, '\0' * TIMESPEC_SIZE)
+    except IOError:
+      pass
+
+
+def _ReceiveWithTimestamp(sock):
+  """Returns (wire data, source address, kernel receive time or None)."""
+  if hasattr(sock, 'recvmsg'):
+    (wire, ancillary, unused_flags, address) = sock.recvmsg(
+        MAX_PACKET_SIZE, socket.CMSG_SPACE(TIMESPEC_SIZE))
+    for (level, cmsg_type, cmsg_data) in ancillary:
+      if level == socket.SOL_SOCKET and cmsg_type == SCM_TIMESTAMPNS:
+        return (wire, address, _UnpackTimespec(cmsg_data))
+    return (wire, address, None)
+
+  (wire, address) = sock.recvfrom(MAX_PACKET_SIZE)
+  try:
+    stamp = _UnpackTimespec(fcntl.ioctl(sock, SIOCGSTAMPNS, '\0' * TIMESPEC_SIZE))
+  except IOError:
+    stamp = None
+  return (wire, address, stamp)
+
+
+def UdpQuery(request, ip, port, timeout):
+  """Send a query over UDP, as dns.query.udp does, timing it precisely.
+
+  Args:
+    request: dns.message.Message
+    ip: destination IP address (str)
+    port: destination port (int)
+    timeout: how long to wait for a response (seconds)
+
+  Returns:
+    (response, duration in seconds)
+
+  Raises:
+    dns.exception.Timeout, dns.query.UnexpectedSource, dns.query.BadResponse
+  """
+  af = dns.inet.af_for_address(ip)
+  if af == dns.inet.AF_INET6:
+    destination = (ip, port, 0, 0)
+  else:
+    destination = (ip, port)
+
+  Prepare()
+  wire = request.to_wire()
+  sock = socket.socket(af, socket.SOCK_DGRAM, 0)
+  try:
+    sock.setblocking(0)
+    _EnableTimestamps(sock)
+    send_time = time.time()
+    sock.sendto(wire, destination)
+    expiration = send_time + timeout
+
+    while True:
+      remaining = expiration - time.time()
+      if remaining <= 0:
+        raise dns.exception.Timeout
+      try:
+        (readable, unused_w, unused_x) = select.select([sock], [], [], remaining)
+      except select.error, e:
+        if e.args[0] == errno.EINTR:
+          continue
+        raise
+      if not readable:
+        raise dns.exception.Timeout
+      try:
+        (response_wire, address, receive_time) = _ReceiveWithTimestamp(sock)
+      except socket.error, e:
+        if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+          continue
+        raise
+      read_time = time.time()
+      if address[0:2] == destination[0:2]:
+        break
+      raise dns.query.UnexpectedSource('got a response from %s instead of %s' %
+                                       (address, destination))
+  finally:
+    sock.close()
+
+  response = dns.message.from_wire(response_wire, keyring=request.keyring,
+                                   request_mac=request.mac)
+  if not request.is_response(response):
+    raise dns.query.BadResponse
+
+  if receive_time is not None and send_time <= receive_time <= read_time:
+    return (response, receive_time - send_time)
+  return (response, read_time - send_time)
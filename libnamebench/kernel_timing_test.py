@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the kernel_timing module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import socket
+import time
+import unittest
+
+import dns_responder
+import kernel_timing
+
+
+class KernelTimingTest(unittest.TestCase):
+  def setUp(self):
+    if not kernel_timing.IsAvailable():
+      self.skipTest('kernel timestamps are not available')
+    kernel_timing.Prepare()
+
+  def testReceiveTimestamp(self):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+      receiver.bind(('127.0.0.1', 0))
+      kernel_timing._EnableTimestamps(receiver)
+      send_time = time.time()
+      sender.sendto('namebench', receiver.getsockname())
+      # Pretend that our thread was not scheduled for a while.
+      time.sleep(0.1)
+      (data, unused_address, stamp) = kernel_timing._ReceiveWithTimestamp(receiver)
+      self.assertEquals(data, 'namebench')
+      self.assertTrue(send_time <= stamp < send_time + 0.05)
+    finally:
+      receiver.close()
+      sender.close()
+
+  def testNameServerQuery(self):
+    profile = dns_responder.ServerProfile(latency=20)
+    responder = dns_responder.DnsResponder({'127.0.0.1': profile})
+    responder.Start()
+    try:
+      ns = responder.CreateNameServers()[0]
+      ns.use_kernel_timestamps = True
+      (response, duration, error_msg) = ns.TimedRequest('A', 'a.root-servers.net.')
+      self.assertEquals(error_msg, None)
+      self.assertEquals(response.answer[0].items[0].address, '198.41.0.4')
+      self.assertTrue(20 <= duration < 200)
+      (response, duration, error_msg) = ns.TimedRequest('A', 'a.root-servers.net.',
+                                                        timeout=0.001)
+      self.assertEquals(response, None)
+    finally:
+      responder.Stop()
+
+
+if __name__ == '__main__':
+  unittest.main()
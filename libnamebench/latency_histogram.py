@@ -0,0 +1,176 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A log-bucketed latency histogram with bounded relative error.
+
+Bucket i holds values in (gamma^(i-1), gamma^i], where
+gamma = (1 + e) / (1 - e). Reporting the midpoint of a bucket is then
+never more than e (1% by default) away from the true value. The number of
+buckets depends only on the range of values, not on how many are added.
+Histograms with the same relative error can be merged by adding bucket
+counts, so results from different runs, threads, processes or machines
+combine without any loss.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import math
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+DEFAULT_RELATIVE_ERROR = 0.01
+
+# Values at or below this (ms) are counted, but not bucketed.
+MIN_VALUE = 0.001
+
+
+class LatencyHistogram(object):
+  """Count latencies (in milliseconds), and report percentiles."""
+
+  def __init__(self, relative_error=DEFAULT_RELATIVE_ERROR):
+    self.relative_error = relative_error
+    self.gamma = (1 + relative_error) / (1 - relative_error)
+    self._log_gamma = math.log(self.gamma)
+    self.buckets = {}
+    self.zero_count = 0
+    self.count = 0
+    self.total = 0.0
+    self.min = None
+    self.max = None
+
+  def _Index(self, value):
+    return int(math.ceil(math.log(value) / self._log_gamma))
+
+  def _Indexes(self, values):
+    """_Index for every value in a NumPy array."""
+    return numpy.ceil(numpy.log(values) / self._log_gamma).astype(numpy.int64)
+
+  def _Value(self, index):
+    return 2 * self.gamma ** index / (self.gamma + 1)
+
+  def Add(self, value, count=1):
+    """Record count occurrences of a value (ms)."""
+    if value <= MIN_VALUE:
+      self.zero_count += count
+    else:
+      index = self._Index(value)
+      self.buckets[index] = self.buckets.get(index, 0) + count
+    self.count += count
+    self.total += value * count
+    if self.min is None or value < self.min:
+      self.min = value
+    if self.max is None or value > self.max:
+      self.max = value
+
+  def AddArray(self, values):
+    """Record every value in a NumPy array (ms), without a Python loop over them."""
+    if not len(values):
+      return
+    positive = values[values > MIN_VALUE]
+    (indexes, counts) = numpy.unique(self._Indexes(positive), return_counts=True)
+    for (index, count) in zip(indexes.tolist(), counts.tolist()):
+      self.buckets[index] = self.buckets.get(index, 0) + count
+    self.zero_count += int(len(values) - len(positive))
+    self.count += int(len(values))
+    self.total += float(values.sum())
+    for value in (float(values.min()), float(values.max())):
+      if self.min is None or value < self.min:
+        self.min = value
+      if self.max is None or value > self.max:
+        self.max = value
+
+  def Merge(self, other):
+    """Add the counts from another histogram to this one."""
+    if other.relative_error != self.relative_error:
+      raise ValueError('Can not merge histograms with a relative error of %s and %s' %
+                       (self.relative_error, other.relative_error))
+    for (index, count) in other.buckets.items():
+      self.buckets[index] = self.buckets.get(index, 0) + count
+    self.zero_count += other.zero_count
+    self.count += other.count
+    self.total += other.total
+    for value in (other.min, other.max):
+      if value is not None:
+        if self.min is None or value < self.min:
+          self.min = value
+        if self.max is None or value > self.max:
+          self.max = value
+    return self
+
+  @property
+  def mean(self):
+    if self.count:
+      return self.total / self.count
+    return None
+
+  def Percentile(self, percent):
+    """Return the value below which the given percent of values fall.
+
+    Args:
+      percent: 0 through 100 (float)
+
+    Returns:
+      A value in ms (within relative_error of the exact answer), or None if
+      the histogram is empty.
+    """
+    if not self.count:
+      return None
+    rank = max(int(math.ceil(percent / 100.0 * self.count)), 1)
+    if rank <= self.zero_count:
+      return self.min
+    seen = self.zero_count
+    for index in sorted(self.buckets):
+      seen += self.buckets[index]
+      if seen >= rank:
+        # The bucket midpoint may lie outside of the values actually seen.
+        return min(max(self._Value(index), self.min), self.max)
+    return self.max
+
+  def Percentiles(self, percents=(50, 90, 99)):
+    return [self.Percentile(x) for x in percents]
+
+  def ToDict(self):
+    """Return a JSON-friendly representation, to merge elsewhere."""
+    return {'relative_error': self.relative_error, 'zero_count': self.zero_count,
+            'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max,
+            'buckets': [[index, self.buckets[index]] for index in sorted(self.buckets)]}
+
+
+def FromDict(data):
+  """Rebuild a LatencyHistogram from the output of ToDict."""
+  histogram = LatencyHistogram(relative_error=data['relative_error'])
+  histogram.buckets = dict([(int(index), count) for (index, count) in data['buckets']])
+  histogram.zero_count = data['zero_count']
+  histogram.count = data['count']
+  histogram.total = data['total']
+  histogram.min = data['min']
+  histogram.max = data['max']
+  return histogram
+
+
+def FromDurations(durations, relative_error=DEFAULT_RELATIVE_ERROR):
+  histogram = LatencyHistogram(relative_error=relative_error)
+  for duration in durations:
+    histogram.Add(duration)
+  return histogram
+
+
+def FromArray(durations, relative_error=DEFAULT_RELATIVE_ERROR):
+  """FromDurations, for a NumPy array of durations."""
+  histogram = LatencyHistogram(relative_error=relative_error)
+  histogram.AddArray(durations)
+  return histogram
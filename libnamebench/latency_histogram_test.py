@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the latency_histogram module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import math
+import random
+import unittest
+
+# external dependencies (from nb_third_party)
+import simplejson
+
+import latency_histogram
+
+
+def ExactPercentile(values, percent):
+  values = sorted(values)
+  return values[max(int(math.ceil(percent / 100.0 * len(values))), 1) - 1]
+
+
+class LatencyHistogramTest(unittest.TestCase):
+  def testRelativeError(self):
+    rng = random.Random(38)
+    values = [rng.lognormvariate(3, 1.5) for _ in range(5000)] + [0.0] * 10
+    histogram = latency_histogram.FromDurations(values)
+    for percent in (1, 10, 50, 90, 99, 99.9, 100):
+      exact = ExactPercentile(values, percent)
+      self.assertTrue(abs(histogram.Percentile(percent) - exact) <= exact * 0.01,
+                      (percent, exact, histogram.Percentile(percent)))
+    self.assertEquals(histogram.Percentile(0), 0.0)
+    self.assertEquals(histogram.count, 5010)
+    self.assertAlmostEquals(histogram.mean, sum(values) / len(values))
+    # Bucket count depends on the range of values, not how many there are.
+    self.assertTrue(len(histogram.buckets) < 1200)
+
+  def testMerge(self):
+    rng = random.Random(380)
+    first = [rng.expovariate(0.05) for _ in range(1000)]
+    second = [rng.uniform(100, 3000) for _ in range(500)]
+    merged = latency_histogram.FromDurations(first)
+    merged.Merge(latency_histogram.FromDurations(second))
+    combined = latency_histogram.FromDurations(first + second)
+    self.assertEquals(merged.buckets, combined.buckets)
+    self.assertEquals((merged.count, merged.min, merged.max),
+                      (combined.count, combined.min, combined.max))
+    self.assertEquals(merged.Percentiles(), combined.Percentiles())
+    self.assertEquals(latency_histogram.LatencyHistogram().Percentile(50), None)
+    self.assertRaises(ValueError, merged.Merge,
+                      latency_histogram.LatencyHistogram(relative_error=0.02))
+
+  def testFromArray(self):
+    if not latency_histogram.numpy:
+      return
+    rng = random.Random(39)
+    values = [rng.lognormvariate(3, 1.5) for _ in range(2000)] + [0.0] * 5
+    expected = latency_histogram.FromDurations(values)
+    histogram = latency_histogram.FromArray(latency_histogram.numpy.array(values))
+    self.assertEquals(histogram.buckets, expected.buckets)
+    self.assertEquals((histogram.zero_count, histogram.count, histogram.min, histogram.max),
+                      (expected.zero_count, expected.count, expected.min, expected.max))
+    self.assertAlmostEquals(histogram.total, expected.total)
+    histogram.AddArray(latency_histogram.numpy.array([]))
+    self.assertEquals(histogram.count, 2005)
+
+  def testSerialize(self):
+    histogram = latency_histogram.FromDurations([0.0, 1.5, 20.25, 300.0, 300.0])
+    data = simplejson.loads(simplejson.dumps(histogram.ToDict()))
+    restored = latency_histogram.FromDict(data)
+    self.assertEquals(restored.buckets, histogram.buckets)
+    self.assertEquals(restored.Percentiles(), histogram.Percentiles())
+    self.assertEquals(restored.Percentile(100), 300.0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,219 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Serve live query metrics over HTTP, in the OpenMetrics text format.
+
+Querying threads only append each completed query to a deque, which needs no
+lock. The HTTP server thread folds those events into counters and
+histograms between requests and when scraped, so a slow scraper never holds
+up a query.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import BaseHTTPServer
+import bisect
+import collections
+import re
+import threading
+
+import query_events
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+DEFAULT_HOST = '127.0.0.1'
+
+# How often (seconds) the server thread folds in pending events, if idle.
+DRAIN_INTERVAL = 1.0
+
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.015, 0.02, 0.03, 0.04, 0.05, 0.075, 0.1,
+                   0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0)
+
+ERROR_NAME_RE = re.compile(r'\b((?:[A-Za-z][\w.]*)?(?:Error|Exception|Response|Timeout|Source|Junk))\b')
+
+
+def ErrorCategory(response, error_msg):
+  """Turn an error message into a short label value (such as 'Timeout')."""
+  if not error_msg:
+    if response:
+      return None
+    return 'Timeout'
+  match = ERROR_NAME_RE.search(error_msg)
+  if match:
+    return match.group(1).split('.')[-1]
+  return 'other'
+
+
+def _Labels(**labels):
+  pairs = []
+  for key in sorted(labels):
+    value = str(labels[key]).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    pairs.append('%s="%s"' % (key, value))
+  return '{%s}' % ','.join(pairs)
+
+
+def _FormatBound(bound):
+  return repr(float(bound))
+
+
+class MetricsCollector(object):
+  """Aggregate query events into counters and histograms."""
+
+  def __init__(self):
+    self.pending = collections.deque()
+    self.lock = threading.Lock()
+    self.queries = {}
+    self.failures = {}
+    self.histograms = {}
+    self.progress = (None, None, None)
+
+  def Start(self):
+    query_events.AddListener(self.RecordQuery)
+
+  def Stop(self):
+    query_events.RemoveListener(self.RecordQuery)
+
+  def RecordQuery(self, phase, ip, unused_type, unused_record, start_time, end_time,
+                  response, error_msg):
+    """query_events listener: called from every querying thread."""
+    if end_time is not None:
+      duration = end_time - start_time
+    else:
+      duration = None
+    self.pending.append((phase, ip, duration, ErrorCategory(response, error_msg)))
+
+  def UpdateProgress(self, message, count, total):
+    """Record progress of the current phase (a single tuple: atomic)."""
+    self.progress = (message, count, total)
+
+  def Drain(self):
+    """Fold pending query events into the counters."""
+    self.lock.acquire()
+    try:
+      while True:
+        try:
+          (phase, ip, duration, error) = self.pending.popleft()
+        except IndexError:
+          break
+        key = (ip, phase)
+        self.queries[key] = self.queries.get(key, 0) + 1
+        if error:
+          key = (ip, phase, error)
+          self.failures[key] = self.failures.get(key, 0) + 1
+        elif duration is not None:
+          if ip not in self.histograms:
+            self.histograms[ip] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0]
+          histogram = self.histograms[ip]
+          histogram[0][bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+          histogram[1] += duration
+    finally:
+      self.lock.release()
+
+  def Render(self):
+    """Return all metrics in the OpenMetrics text format."""
+    self.Drain()
+    lines = []
+    self.lock.acquire()
+    try:
+      lines.append('# TYPE namebench_queries counter')
+      lines.append('# HELP namebench_queries DNS queries sent, by server and phase.')
+      for (ip, phase) in sorted(self.queries):
+        lines.append('namebench_queries_total%s %s' % (_Labels(server=ip, phase=phase),
+                                                       self.queries[(ip, phase)]))
+
+      lines.append('# TYPE namebench_query_failures counter')
+      lines.append('# HELP namebench_query_failures Queries without a usable answer, by error.')
+      for (ip, phase, error) in sorted(self.failures):
+        lines.append('namebench_query_failures_total%s %s' % (
+            _Labels(server=ip, phase=phase, error=error), self.failures[(ip, phase, error)]))
+
+      lines.append('# TYPE namebench_query_duration_seconds histogram')
+      lines.append('# HELP namebench_query_duration_seconds Time to receive an answer.')
+      for ip in sorted(self.histograms):
+        (buckets, total) = self.histograms[ip]
+        cumulative = 0
+        for (index, bound) in enumerate(LATENCY_BUCKETS):
+          cumulative += buckets[index]
+          lines.append('namebench_query_duration_seconds_bucket%s %s' % (
+              _Labels(server=ip, le=_FormatBound(bound)), cumulative))
+        cumulative += buckets[-1]
+        lines.append('namebench_query_duration_seconds_bucket%s %s' % (
+            _Labels(server=ip, le='+Inf'), cumulative))
+        lines.append('namebench_query_duration_seconds_count%s %s' % (_Labels(server=ip),
+                                                                     cumulative))
+        lines.append('namebench_query_duration_seconds_sum%s %r' % (_Labels(server=ip), total))
+    finally:
+      self.lock.release()
+
+    lines.append('# TYPE namebench_phase stateset')
+    lines.append('# HELP namebench_phase The phase namebench is currently in.')
+    lines.append('namebench_phase%s 1' % _Labels(namebench_phase=query_events.GetPhase()))
+    (message, count, total) = self.progress
+    if total:
+      lines.append('# TYPE namebench_phase_progress_ratio gauge')
+      lines.append('# HELP namebench_phase_progress_ratio How much of the current step is done.')
+      lines.append('namebench_phase_progress_ratio%s %r' % (_Labels(step=message),
+                                                            float(count) / total))
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  def do_GET(self):
+    if self.path.split('?')[0] not in ('/', '/metrics'):
+      self.send_error(404)
+      return
+    body = self.server.collector.Render()
+    self.send_response(200)
+    self.send_header('Content-Type', CONTENT_TYPE)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *unused_args):
+    pass
+
+
+class MetricsServer(threading.Thread):
+  """An HTTP server for the metrics, running in its own thread."""
+
+  def __init__(self, port, host=DEFAULT_HOST):
+    threading.Thread.__init__(self)
+    self.setDaemon(True)
+    self.collector = MetricsCollector()
+    self.httpd = BaseHTTPServer.HTTPServer((host, port), _MetricsHandler)
+    self.httpd.collector = self.collector
+    self.httpd.timeout = DRAIN_INTERVAL
+    self.port = self.httpd.server_address[1]
+    self.halt = False
+    self.collector.Start()
+
+  def run(self):
+    while not self.halt:
+      self.httpd.handle_request()
+      self.collector.Drain()
+
+  def Stop(self):
+    self.halt = True
+    self.collector.Stop()
+    self.join()
+    self.httpd.server_close()
+
+
+def ParseAddress(address):
+  """Parse a [host:]port string into (host, port)."""
+  if ':' in str(address):
+    (host, port) = str(address).rsplit(':', 1)
+    return (host.strip('[]') or DEFAULT_HOST, int(port))
+  return (DEFAULT_HOST, int(address))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the metrics_server module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import unittest
+import urllib2
+
+import metrics_server
+import mocks
+import query_events
+
+
+class MetricsServerTest(unittest.TestCase):
+  def testErrorCategory(self):
+    self.assertEquals(metrics_server.ErrorCategory('response', None), None)
+    self.assertEquals(metrics_server.ErrorCategory(None, None), 'Timeout')
+    self.assertEquals(metrics_server.ErrorCategory(
+        None, 'www.google.com.: Timeout The DNS operation timed out after 3.0 seconds'), 'Timeout')
+    self.assertEquals(metrics_server.ErrorCategory(None, 'dns.query.BadResponse This sucks.'),
+                      'BadResponse')
+    self.assertEquals(metrics_server.ErrorCategory(None, 'no idea'), 'other')
+
+  def testRender(self):
+    collector = metrics_server.MetricsCollector()
+    collector.RecordQuery('benchmark', '10.0.0.1', 'A', 'x.', 100.0, 100.004, 'response', None)
+    collector.RecordQuery('benchmark', '10.0.0.1', 'A', 'y.', 100.0, 100.25, 'response', None)
+    collector.RecordQuery('health', '10.0.0.1', 'A', 'z.', 100.0, None, None,
+                          'z.: Timeout The DNS operation timed out')
+    collector.UpdateProgress('Sending 2 queries to 1 servers', 1, 4)
+    lines = collector.Render().splitlines()
+    self.assertEquals(len(collector.pending), 0)
+    for expected in (
+        'namebench_queries_total{phase="benchmark",server="10.0.0.1"} 2',
+        'namebench_queries_total{phase="health",server="10.0.0.1"} 1',
+        'namebench_query_failures_total{error="Timeout",phase="health",server="10.0.0.1"} 1',
+        'namebench_query_duration_seconds_bucket{le="0.002",server="10.0.0.1"} 0',
+        'namebench_query_duration_seconds_bucket{le="0.005",server="10.0.0.1"} 1',
+        'namebench_query_duration_seconds_bucket{le="0.3",server="10.0.0.1"} 2',
+        'namebench_query_duration_seconds_bucket{le="+Inf",server="10.0.0.1"} 2',
+        'namebench_query_duration_seconds_count{server="10.0.0.1"} 2',
+        'namebench_phase_progress_ratio{step="Sending 2 queries to 1 servers"} 0.25'):
+      self.assertTrue(expected in lines, expected)
+    self.assertEquals(lines[-1], '# EOF')
+
+  def testServer(self):
+    server = metrics_server.MetricsServer(0)
+    server.start()
+    try:
+      ns = mocks.MockNameServer(mocks.GOOD_IP)
+      query_events.SetPhase('benchmark')
+      ns.TimedRequest('A', 'www.paypal.com.')
+      response = urllib2.urlopen('http://127.0.0.1:%s/metrics' % server.port)
+      self.assertEquals(response.info()['Content-Type'], metrics_server.CONTENT_TYPE)
+      body = response.read()
+    finally:
+      server.Stop()
+    self.assertTrue('namebench_queries_total{phase="benchmark",server="127.0.0.1"} 1' in body)
+    self.assertTrue('namebench_phase{namebench_phase="benchmark"} 1' in body)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,271 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Keep benchmarking a set of healthy nameservers, and keep rankings current.
+
+Rather than a one-shot run, the monitor sends a handful of queries to every
+server each round, and keeps a rolling window of latency histograms and
+failure counts per server. Servers whose failure rate or latency degrade
+are health checked again, and the resolv.conf rendering of the current
+ranking is rewritten every round.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import collections
+import operator
+import os
+import random
+import time
+
+# external dependencies (from nb_third_party)
+import jinja2
+
+import benchmark
+import latency_histogram
+import nameserver_list
+import util
+
+DEFAULT_INTERVAL = 60
+DEFAULT_QUERIES_PER_ROUND = 5
+DEFAULT_WINDOW = 3600
+DEFAULT_SLOT_SIZE = 60
+DEFAULT_RECHECK_INTERVAL = 600
+
+# A server is health checked again if, with at least MIN_SAMPLES in its
+# window, more than MAX_FAILURE_RATE of queries fail, or its median latency
+# exceeds MAX_LATENCY_MULTIPLIER times its health check average.
+MIN_SAMPLES = 10
+MAX_FAILURE_RATE = 0.25
+MAX_LATENCY_MULTIPLIER = 4
+RECOMMENDED_COUNT = 3
+
+
+class RollingStats(object):
+  """Latency histogram and failure counts over a sliding window of time.
+
+  The window is divided into slots of slot_size seconds. Each slot holds a
+  LatencyHistogram, and slots older than the window are dropped, so memory
+  use does not depend on how many queries are recorded.
+  """
+
+  def __init__(self, window=DEFAULT_WINDOW, slot_size=DEFAULT_SLOT_SIZE):
+    self.window = window
+    self.slot_size = slot_size
+    # Each slot is [start time, query count, failure count, total ms, histogram]
+    self.slots = collections.deque()
+
+  def _Expire(self, now):
+    while self.slots and self.slots[0][0] + self.slot_size <= now - self.window:
+      self.slots.popleft()
+
+  def Add(self, duration, failed, now):
+    """Record a query.
+
+    Args:
+      duration: how long the query took (ms)
+      failed: did the query fail? (bool)
+      now: the current time (seconds)
+    """
+    self._Expire(now)
+    slot_start = now - (now % self.slot_size)
+    if not self.slots or self.slots[-1][0] != slot_start:
+      self.slots.append([slot_start, 0, 0, 0.0, latency_histogram.LatencyHistogram()])
+    slot = self.slots[-1]
+    slot[1] += 1
+    slot[3] += duration
+    if failed:
+      slot[2] += 1
+    else:
+      slot[4].Add(duration)
+
+  def Summary(self, now):
+    """Return (query count, failure rate, mean ms, median ms) for the window."""
+    self._Expire(now)
+    count = sum([x[1] for x in self.slots])
+    if not count:
+      return (0, 0.0, None, None)
+    failures = sum([x[2] for x in self.slots])
+    total = sum([x[3] for x in self.slots])
+    return (count, float(failures) / count, total / count, self.Percentile(50, now))
+
+  def Percentile(self, percent, now):
+    """Return the given percentile of answered queries (ms), or None."""
+    self._Expire(now)
+    histogram = latency_histogram.LatencyHistogram()
+    for slot in self.slots:
+      histogram.Merge(slot[4])
+    return histogram.Percentile(percent)
+
+
+class Monitor(object):
+  """Benchmark nameservers at a low rate, forever."""
+
+  def __init__(self, nameservers, test_records, output_path=None, sanity_checks=None,
+               interval=DEFAULT_INTERVAL, queries_per_round=DEFAULT_QUERIES_PER_ROUND,
+               window=DEFAULT_WINDOW, slot_size=DEFAULT_SLOT_SIZE,
+               recheck_interval=DEFAULT_RECHECK_INTERVAL, thread_count=1,
+               status_callback=None, timer=time.time, sleep=time.sleep):
+    """Constructor.
+
+    Args:
+      nameservers: a NameServers object, after health checks
+      test_records: list of (request_type, hostname) tuples to sample from
+      output_path: where to write the resolv.conf rendering (optional)
+      sanity_checks: dictionary of sanity checks to re-check servers with
+      interval: seconds between rounds
+      queries_per_round: how many queries to send each server per round
+      window: how many seconds of results to rank servers by
+      slot_size: granularity of the window (seconds)
+      recheck_interval: minimum seconds between health checks of a server
+      thread_count: how many benchmark threads to use
+      status_callback: where to send msg() updates to.
+      timer: function returning the current time (seconds)
+      sleep: function to wait between rounds with
+    """
+    # Servers hidden or disabled before monitoring started are never used.
+    self.servers = list(nameservers.enabled_servers)
+    self.test_records = test_records
+    self.output_path = output_path
+    self.sanity_checks = sanity_checks
+    self.interval = interval
+    self.queries_per_round = queries_per_round
+    self.recheck_interval = recheck_interval
+    self.thread_count = thread_count
+    self.status_callback = status_callback
+    self.timer = timer
+    self.sleep = sleep
+    self.stats = {}
+    self.last_checked = {}
+    for ns in self.servers:
+      self.stats[ns.ip] = RollingStats(window=window, slot_size=slot_size)
+      self.last_checked[ns.ip] = timer()
+
+  def msg(self, msg, **kwargs):
+    if self.status_callback:
+      self.status_callback(msg, **kwargs)
+
+  @property
+  def healthy_servers(self):
+    return [x for x in self.servers if not x.is_disabled]
+
+  def RunRound(self):
+    """Benchmark all healthy servers once, re-check any that degraded.
+
+    Returns:
+      A list of (nameserver, query count, failure rate, mean ms, median ms),
+      best first.
+    """
+    servers = nameserver_list.NameServers()
+    for ns in self.healthy_servers:
+      servers.append(ns)
+
+    if servers:
+      records = random.sample(self.test_records, min(self.queries_per_round,
+                                                     len(self.test_records)))
+      bmark = benchmark.Benchmark(servers, run_count=1, query_count=len(records),
+                                  thread_count=min(self.thread_count, len(servers)))
+      results = bmark.Run(records)
+      now = self.timer()
+      for ns in results:
+        for (unused_host, unused_type, duration, response, error_msg) in results[ns][0]:
+          self.stats[ns.ip].Add(duration, bool(error_msg or not response), now)
+
+    self.RecheckServers()
+    ranking = self.Ranking()
+    if self.output_path:
+      self.WriteResolvConf(ranking)
+    return ranking
+
+  def IsDegraded(self, ns):
+    """Has this server's performance degraded since its health checks?"""
+    (count, failure_rate, unused_mean, median) = self.stats[ns.ip].Summary(self.timer())
+    if count < MIN_SAMPLES:
+      return False
+    if failure_rate > MAX_FAILURE_RATE:
+      return True
+    if median and ns.checks and median > ns.check_average * MAX_LATENCY_MULTIPLIER:
+      return True
+    return False
+
+  def RecheckServers(self):
+    """Health check degraded servers, and give disabled servers another chance."""
+    now = self.timer()
+    for ns in self.servers:
+      if now - self.last_checked[ns.ip] < self.recheck_interval:
+        continue
+      if not ns.is_disabled and not self.IsDegraded(ns):
+        continue
+
+      was_disabled = ns.is_disabled
+      self.last_checked[ns.ip] = now
+      ns.ResetTestStatus()
+      # The same order as NameServers.CheckHealth: a fatal ping, then the rest.
+      ns.CheckHealth(fast_check=True)
+      if not ns.is_disabled:
+        ns.CheckHealth(sanity_checks=self.sanity_checks)
+      if ns.is_disabled:
+        self.msg('%s [%s] failed health checks: %s' % (ns.name, ns.ip, ns.disabled_msg))
+      elif was_disabled:
+        ns.tags.discard('hidden')
+        self.msg('%s [%s] is healthy again' % (ns.name, ns.ip))
+      # Start over, rather than judging the server on what it did before.
+      self.stats[ns.ip] = RollingStats(window=self.stats[ns.ip].window,
+                                       slot_size=self.stats[ns.ip].slot_size)
+
+  def Ranking(self):
+    """Return healthy servers with window stats, ordered by mean duration."""
+    now = self.timer()
+    ranking = []
+    for ns in self.healthy_servers:
+      (count, failure_rate, mean, median) = self.stats[ns.ip].Summary(now)
+      if count:
+        ranking.append((ns, count, failure_rate, mean, median))
+    return sorted(ranking, key=operator.itemgetter(3))
+
+  def WriteResolvConf(self, ranking):
+    """Render resolv.conf.tmpl for the best servers, replacing output_path."""
+    template_path = util.FindDataFile(os.path.join('templates', 'resolv.conf.tmpl'))
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(os.path.dirname(template_path)))
+    template = env.get_template('resolv.conf.tmpl')
+    recommended = [x[0] for x in ranking[0:RECOMMENDED_COUNT]]
+    rendered = template.render(recommended=recommended)
+
+    # Write and rename, so that readers never see a half-written file.
+    temp_path = '%s.tmp' % self.output_path
+    f = open(temp_path, 'w')
+    f.write(rendered)
+    f.close()
+    try:
+      os.rename(temp_path, self.output_path)
+    except OSError:
+      # Windows will not rename over an existing file.
+      os.unlink(self.output_path)
+      os.rename(temp_path, self.output_path)
+
+  def Run(self, rounds=None):
+    """Run rounds until interrupted (or the given number of rounds)."""
+    completed = 0
+    while rounds is None or completed < rounds:
+      start = self.timer()
+      ranking = self.RunRound()
+      completed += 1
+      if ranking:
+        (best, count, failure_rate, mean, median) = ranking[0]
+        self.msg('Round %s: %s [%s] is the best (%.1fms mean, %.1f%% failures, %s queries)' %
+                 (completed, best.name, best.ip, mean, failure_rate * 100, count))
+      else:
+        self.msg('Round %s: no healthy nameservers' % completed)
+      if rounds is None or completed < rounds:
+        self.sleep(max(self.interval - (self.timer() - start), 0))
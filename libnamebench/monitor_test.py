@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the monitor module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import os
+import tempfile
+import unittest
+
+import mocks
+import monitor
+import nameserver_list
+
+TEST_RECORDS = [('A', 'www.paypal.com.'), ('A', 'www.yahoo.com.'), ('MX', 'google.com.'),
+                ('A', 'www.example.com.')]
+
+
+class FakeClock(object):
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+  def Sleep(self, seconds):
+    self.now += seconds
+
+
+class RollingStatsTest(unittest.TestCase):
+  def testWindow(self):
+    stats = monitor.RollingStats(window=120, slot_size=60)
+    stats.Add(4, False, 1000)
+    stats.Add(12, False, 1010)
+    stats.Add(5000, True, 1070)
+    (count, failure_rate, mean, median) = stats.Summary(1070)
+    self.assertEquals((count, failure_rate, mean), (3, 1 / 3.0, 5016 / 3.0))
+    self.assertAlmostEquals(median, 4, delta=0.04)
+    self.assertEquals(stats.Percentile(100, 1070), 12)
+    # The slot holding the first two queries has left the window.
+    self.assertEquals(stats.Summary(1140), (1, 1.0, 5000.0, None))
+    self.assertEquals(len(stats.slots), 1)
+    self.assertEquals(stats.Summary(1200), (0, 0.0, None, None))
+
+
+class MonitorTest(unittest.TestCase):
+  def setUp(self):
+    (fd, self.path) = tempfile.mkstemp()
+    os.close(fd)
+
+  def tearDown(self):
+    os.unlink(self.path)
+
+  def testRounds(self):
+    clock = FakeClock()
+    servers = nameserver_list.NameServers()
+    for ip in (mocks.GOOD_IP, mocks.PERFECT_IP, mocks.BROKEN_IP):
+      ns = mocks.MockNameServer(ip, name='NS-%s' % ip)
+      ns.timer = clock
+      servers.append(ns)
+
+    daemon = monitor.Monitor(servers, TEST_RECORDS, output_path=self.path, interval=60,
+                             queries_per_round=4, recheck_interval=120,
+                             timer=clock, sleep=clock.Sleep)
+    daemon.Run(rounds=4)
+    self.assertEquals(clock.now, 1180.0)
+    # The broken server failed every query, so was checked again and disabled.
+    self.assertEquals([x.ip for x in daemon.healthy_servers], [mocks.GOOD_IP, mocks.PERFECT_IP])
+    ranking = daemon.Ranking()
+    self.assertEquals(sorted([x[0].ip for x in ranking]), [mocks.GOOD_IP, mocks.PERFECT_IP])
+    self.assertEquals([x[1] for x in ranking], [16, 16])
+
+    resolv_conf = open(self.path).readlines()
+    self.assertEquals(len(resolv_conf), 2)
+    self.assertTrue(resolv_conf[0].startswith('nameserver %s' % ranking[0][0].ip))
+
+
+if __name__ == '__main__':
+  unittest.main()
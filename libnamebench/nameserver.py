@@ -31,13 +31,14 @@ import dns.query
 import dns.rcode
 import dns.rdataclass
 import dns.rdatatype
-import dns.resolver
-import dns.reversename
 import dns.version
 
 import health_checks
+import kernel_timing
 import provider_extensions
 import addr_util
+import query_events
+import reverse_dns
 import util
 
 # Look for buggy system versions of namebench
@@ -110,6 +111,7 @@ class NameServer(health_checks.NameServerHealthChecks, provider_extensions.NameS
     self.network_owner = network_owner
     self._hostname = hostname
 
+    self.port = 53
     self.timeout = 5
     self.health_timeout = 5
     self.ping_timeout = 1
@@ -118,6 +120,10 @@ class NameServer(health_checks.NameServerHealthChecks, provider_extensions.NameS
     self._node_ids = set()
 
     self.timer = BEST_TIMER_FUNCTION
+    # Health checks run in parallel threads, so each server gets its own
+    # random number generator to keep seeded runs reproducible.
+    self.rng = random.Random()
+    self.use_kernel_timestamps = False
 
     if ':' in self.ip:
       self.tags.add('ipv6')
@@ -398,7 +404,15 @@ class NameServer(health_checks.NameServerHealthChecks, provider_extensions.NameS
 
   def Query(self, request, timeout):
 #    print "%s -> %s" % (request, self)
-    return dns.query.udp(request, self.ip, timeout, 53)
+    return dns.query.udp(request, self.ip, timeout, self.port)
+
+  def TimedQuery(self, request, timeout):
+    """Send a request, returning the response and duration (in seconds)."""
+    if self.use_kernel_timestamps:
+      return kernel_timing.UdpQuery(request, self.ip, self.port, timeout)
+    start_time = self.timer()
+    response = self.Query(request, timeout)
+    return (response, self.timer() - start_time)
 
   def TimedRequest(self, type_string, record_string, timeout=None, rdataclass=None):
     """Make a DNS Get, returning the reply and duration it took.
@@ -438,8 +452,7 @@ class NameServer(health_checks.NameServerHealthChecks, provider_extensions.NameS
     duration = None
     try:
       start_time = self.timer()
-      response = self.Query(request, timeout)
-      duration = self.timer() - start_time
+      (response, duration) = self.TimedQuery(request, timeout)
     except (dns.exception.Timeout), exc:
       response = None
     except (dns.query.BadResponse, dns.message.TrailingJunk,
@@ -474,6 +487,14 @@ class NameServer(health_checks.NameServerHealthChecks, provider_extensions.NameS
       key = util.GetLastExceptionString()
       self.error_map[key] = self.error_map.setdefault(key, 0) + 1
 
+    if query_events.LISTENERS:
+      if response:
+        end_time = start_time + duration
+      else:
+        end_time = None
+      query_events.Notify(self.ip, type_string, record_string, start_time, end_time,
+                          response, error_msg)
+
     if duration < 0:
       raise BrokenSystemClock('The time on your machine appears to be going backwards. '
                               'We cannot accurately benchmark due to this error. '
@@ -491,24 +512,9 @@ class NameServer(health_checks.NameServerHealthChecks, provider_extensions.NameS
     self._version = version
     return (self._version, duration)
 
-  def GetReverseIp(self, ip, retries_left=2):
-    """Request a hostname for a given IP address."""
-    try:
-      print "reverse: %s -> %s" % (ip, self)
-      answer = dns.resolver.query(dns.reversename.from_address(ip), 'PTR')
-    except dns.resolver.NXDOMAIN:
-      return ip
-    except:
-      if retries_left:
-        print "* Failed to get hostname for %s (retries left: %s): %s" % (ip, retries_left, util.GetLastExceptionString())
-        return self.GetReverseIp(ip, retries_left=retries_left-1)
-      else:
-        return ip
-
-    if answer:
-      return answer[0].to_text().rstrip('.')
-    else:
-      return ip
+  def GetReverseIp(self, ip):
+    """Request a hostname for a given IP address (via the shared reverse cache)."""
+    return reverse_dns.GetReverseIp(ip)
 
   def GetTxtRecordWithDuration(self, record, retries_left=2):
     (response, duration, _) = self.TimedRequest('TXT', record, timeout=self.health_timeout)
@@ -28,7 +28,10 @@ import time
 import dns.resolver
 import conn_quality
 import addr_util
+import health_checks
 import nameserver
+import query_events
+import reverse_dns
 import util
 
 NS_CACHE_SLACK = 2
@@ -121,8 +124,6 @@ class QueryThreads(threading.Thread):
           self.results.put(ns.CheckHealth(sanity_checks=self.checks, final_check=True))
         elif self.action_type == 'port_behavior':
           self.results.put(ns.CheckHealth(sanity_checks=self.checks, port_check=True))
-        elif self.action_type == 'censorship':
-          self.results.put(ns.CheckCensorship(self.checks))
         elif self.action_type == 'store_wildcards':
           self.results.put(ns.StoreWildcardCache())
         elif self.action_type == 'node_id':
@@ -146,6 +147,10 @@ class NameServers(list):
     self.client_domain = None
     self.client_asn = None
     self.max_servers_to_check = max_servers_to_check
+    self.status_callback = None
+    # Shuffles the work handed to query threads; seeded by SetRandomSeed().
+    self.shuffle_rng = random.Random()
+    self.censorship_results = {}
 
   @property
   def visible_servers(self):
@@ -241,6 +246,12 @@ class NameServers(list):
       ns.ping_timeout = ping_timeout
       ns.health_timeout = health_timeout
 
+  def SetRandomSeed(self, seed):
+    """Seed the random number generator of each nameserver, for repeatable runs."""
+    self.shuffle_rng.seed('%s/shuffle' % seed)
+    for ns in self:
+      ns.rng.seed('%s/%s' % (seed, ns.ip))
+
   def SetClientLocation(self, latitude, longitude, client_country):
     self.client_latitude = latitude
     self.client_longitude = longitude
@@ -287,6 +298,8 @@ class NameServers(list):
     else:
       provider = None
 
+    # Prefetch any missing hostnames in one batch rather than one query per server.
+    self.UpdateHostnames(self, only_missing=True)
     for ns in self:
       ns.AddNetworkTags(self.client_domain, provider, self.client_asn, self.client_country)
 
@@ -419,7 +432,28 @@ class NameServers(list):
       raise TooFewNameservers('None of the nameservers tested are healthy')
 
   def CheckCensorship(self, sanity_checks):
-    pass
+    """Check every enabled server against every censorship check at once.
+
+    Args:
+      sanity_checks: A dictionary of sanity check sections (needs 'censorship')
+
+    Returns:
+      A dictionary of nameserver -> {record: (is_broken, warning, status)}
+    """
+    checks = sanity_checks.get('censorship')
+    test_servers = self.enabled_servers
+    if not checks or not test_servers:
+      return {}
+
+    self.msg('Running %s censorship checks on %s servers' % (len(checks), len(test_servers)))
+    start = datetime.datetime.now()
+    self.censorship_results = health_checks.RunCensorshipChecks(test_servers, checks)
+    for ns in self.censorship_results:
+      for (unused_broken, warning, unused_status) in self.censorship_results[ns].values():
+        if warning:
+          ns.AddWarning(warning, penalty=False)
+    self.msg('Censorship checks complete (duration: %s)' % (datetime.datetime.now() - start))
+    return self.censorship_results
 
   def _RemoveGlobalWarnings(self):
     """If all nameservers have the same warning, remove it. It's likely false."""
@@ -522,7 +556,7 @@ class NameServers(list):
     results_queue = Queue.Queue()
 
     # items are usually nameservers
-    random.shuffle(items)
+    self.shuffle_rng.shuffle(items)
     for item in items:
       input_queue.put(item)
 
@@ -532,6 +566,7 @@ class NameServers(list):
       thread_count = len(items)
 
     status_message += ' (%s threads)' % thread_count
+    query_events.SetPhase(action_type)
 
     self.msg(status_message, count=0, total=len(items))
     for _ in range(0, thread_count):
@@ -632,20 +667,36 @@ class NameServers(list):
     return self._LaunchQueryThreads('node_id', status_msg, list(self.enabled_servers))
 
   def RunHostnameThreads(self):
-    """Update node id status on all servers."""
-    status_msg = 'Updating hostnames on %s servers' % len(self.enabled_servers)
-    return self._LaunchQueryThreads('update_hostname', status_msg, list(self.enabled_servers))
+    """Update hostnames on all servers (batched, no threads required)."""
+    return self.UpdateHostnames(self.enabled_servers)
+
+  def UpdateHostnames(self, servers, only_missing=False):
+    """Resolve hostnames for many servers in a single batch of PTR queries.
+
+    Args:
+      servers: A list of NameServer objects
+      only_missing: Only look up servers without a known hostname (bool)
+
+    Returns:
+      A dictionary of ip -> hostname.
+    """
+    servers = [x for x in servers if not x.is_disabled]
+    if only_missing:
+      servers = [x for x in servers if x._hostname is None]
+    if not servers:
+      return {}
+
+    self.msg('Updating hostnames on %s servers' % len(servers))
+    hostnames = reverse_dns.ResolveMany([x.ip for x in servers])
+    for ns in servers:
+      ns._hostname = hostnames[ns.ip]
+    return hostnames
 
   def RunFinalHealthCheckThreads(self, checks):
     """Quickly ping nameservers to see which are healthy."""
     status_msg = 'Running final health checks on %s servers' % len(self.enabled_servers)
     return self._LaunchQueryThreads('final', status_msg, list(self.enabled_servers), checks=checks)
 
-  def RunCensorshipCheckThreads(self, checks):
-    """Quickly ping nameservers to see which are healthy."""
-    status_msg = 'Running censorship checks on %s servers' % len(self.enabled_servers)
-    return self._LaunchQueryThreads('censorship', status_msg, list(self.enabled_servers), checks=checks)
-
   def RunPortBehaviorThreads(self):
     """Get port behavior data."""
     status_msg = 'Running port behavior checks on %s servers' % len(self.enabled_servers)
@@ -0,0 +1,353 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Read DNS queries straight out of pcap and pcapng capture files.
+
+Packets are read one at a time, so memory use does not depend on the size
+of the capture. Ethernet (with VLAN tags), Linux cooked, BSD loopback and
+raw IP link layers are decoded, followed by IPv4 or IPv6, then UDP or TCP
+on port 53. TCP streams are not reassembled: a DNS message is only read
+from a segment which starts with its length prefix, as nearly all queries
+do.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import re
+import struct
+
+# external dependencies (from nb_third_party)
+import dns.rdatatype
+
+DNS_PORT = 53
+
+PCAP_MAGIC = {
+    '\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    '\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    '\xa1\xb2\x3c\x4d': ('>', 1e-9),
+    '\x4d\x3c\xb2\xa1': ('<', 1e-9),
+}
+PCAPNG_MAGIC = '\x0a\x0d\x0d\x0a'
+
+# pcapng block types
+SECTION_HEADER_BLOCK = 0x0A0D0D0A
+INTERFACE_DESCRIPTION_BLOCK = 1
+OBSOLETE_PACKET_BLOCK = 2
+SIMPLE_PACKET_BLOCK = 3
+ENHANCED_PACKET_BLOCK = 6
+IF_TSRESOL_OPTION = 9
+
+# Link layer types
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+# Raw IP has other numbers on some platforms.
+RAW_LINKTYPES = (12, 14, LINKTYPE_RAW)
+
+ETHERTYPE_IP = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+VLAN_ETHERTYPES = (0x8100, 0x88A8, 0x9100)
+BSD_AF_INET6 = (24, 28, 30)
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPV6_EXTENSION_HEADERS = (0, 43, 60)
+IPV6_FRAGMENT_HEADER = 44
+
+_ETHERTYPE = struct.Struct('!H')
+_UDP_PORTS = struct.Struct('!HH')
+_DNS_HEADER = struct.Struct('!HHHHHH')
+_QUESTION = struct.Struct('!HH')
+
+# Names we can write out (and read back in) as a test record.
+USABLE_NAME_RE = re.compile('^[!-~]+$')
+
+
+class CaptureError(Exception):
+  """The file is not a capture we know how to read."""
+
+
+def IsCaptureFile(path):
+  """Whether or not a file starts like a pcap or pcapng capture."""
+  fp = open(path, 'rb')
+  try:
+    magic = fp.read(4)
+  finally:
+    fp.close()
+  return magic in PCAP_MAGIC or magic == PCAPNG_MAGIC
+
+
+def ReadQueries(path):
+  """Yield every DNS query found in a capture file.
+
+  Args:
+    path: path to a pcap or pcapng file
+
+  Yields:
+    (qtype, qname, timestamp) tuples, such as ('A', 'www.google.com.', 1287446400.25).
+    The timestamp is in seconds since the epoch, or None if the capture has none.
+
+  Raises:
+    CaptureError: if the file is not a capture.
+  """
+  fp = open(path, 'rb')
+  try:
+    magic = fp.read(4)
+    if magic in PCAP_MAGIC:
+      packets = _ReadPcapPackets(fp, magic)
+    elif magic == PCAPNG_MAGIC:
+      packets = _ReadPcapngPackets(fp)
+    else:
+      raise CaptureError('%s is not a pcap or pcapng file' % path)
+    for (linktype, timestamp, data) in packets:
+      payload = _DnsPayload(linktype, data)
+      if payload:
+        for (qtype, qname) in _DecodeQuestions(payload):
+          yield (qtype, qname, timestamp)
+  finally:
+    fp.close()
+
+
+def _ReadPcapPackets(fp, magic):
+  (endian, resolution) = PCAP_MAGIC[magic]
+  header = fp.read(20)
+  if len(header) < 20:
+    return
+  linktype = struct.unpack(endian + 'HHiIII', header)[-1] & 0x0FFFFFFF
+  record = struct.Struct(endian + 'IIII')
+  while True:
+    record_header = fp.read(record.size)
+    if len(record_header) < record.size:
+      return
+    (seconds, fraction, captured_length, unused_length) = record.unpack(record_header)
+    data = fp.read(captured_length)
+    if len(data) < captured_length:
+      return
+    yield (linktype, seconds + fraction * resolution, data)
+
+
+def _ReadPcapngPackets(fp):
+  """Yield packets from a pcapng file, which begins with a section header block."""
+  block_type = SECTION_HEADER_BLOCK
+  head = PCAPNG_MAGIC + fp.read(4)
+  if len(head) < 8:
+    return
+  endian = '<'
+  interfaces = []
+  while True:
+    if block_type == SECTION_HEADER_BLOCK:
+      # A new section (captures may be concatenated) can change the byte
+      # order, which its byte-order magic gives before the length is read.
+      byte_order = fp.read(4)
+      if len(byte_order) < 4:
+        return
+      if byte_order == '\x1a\x2b\x3c\x4d':
+        endian = '>'
+      elif byte_order == '\x4d\x3c\x2b\x1a':
+        endian = '<'
+      else:
+        raise CaptureError('Bad pcapng byte-order magic')
+      interfaces = []
+    block_length = struct.unpack(endian + 'I', head[4:8])[0]
+    if block_length < 12:
+      raise CaptureError('Bad pcapng block length: %s' % block_length)
+    if block_type == SECTION_HEADER_BLOCK:
+      body = byte_order + fp.read(block_length - 12)
+    else:
+      body = fp.read(block_length - 8)
+    if len(body) < block_length - 8:
+      return
+    body = body[:block_length - 12]
+
+    if block_type == INTERFACE_DESCRIPTION_BLOCK:
+      linktype = struct.unpack(endian + 'H', body[0:2])[0]
+      interfaces.append((linktype, _InterfaceResolution(body[8:], endian)))
+    elif block_type == ENHANCED_PACKET_BLOCK:
+      (interface, high, low, captured_length) = struct.unpack(endian + 'IIII', body[0:16])
+      if interface < len(interfaces):
+        (linktype, resolution) = interfaces[interface]
+        yield (linktype, ((high << 32) + low) * resolution, body[20:20 + captured_length])
+    elif block_type == OBSOLETE_PACKET_BLOCK:
+      (interface, unused_drops, high, low, captured_length) = struct.unpack(endian + 'HHIII',
+                                                                            body[0:16])
+      if interface < len(interfaces):
+        (linktype, resolution) = interfaces[interface]
+        yield (linktype, ((high << 32) + low) * resolution, body[20:20 + captured_length])
+    elif block_type == SIMPLE_PACKET_BLOCK and interfaces:
+      yield (interfaces[0][0], None, body[4:])
+
+    head = fp.read(8)
+    if len(head) < 8:
+      return
+    block_type = struct.unpack(endian + 'I', head[0:4])[0]
+
+
+def _InterfaceResolution(options, endian):
+  """Return the timestamp resolution (seconds) from interface description options."""
+  offset = 0
+  while offset + 4 <= len(options):
+    (code, length) = struct.unpack(endian + 'HH', options[offset:offset + 4])
+    if code == 0:
+      break
+    if code == IF_TSRESOL_OPTION and length >= 1:
+      value = ord(options[offset + 4])
+      if value & 0x80:
+        return 2 ** -(value & 0x7F)
+      return 10 ** -value
+    offset += 4 + ((length + 3) & ~3)
+  return 1e-6
+
+
+def _DnsPayload(linktype, data):
+  """Return the DNS message within a link layer frame, if it is DNS."""
+  try:
+    if linktype == LINKTYPE_ETHERNET:
+      ethertype = _ETHERTYPE.unpack(data[12:14])[0]
+      offset = 14
+      while ethertype in VLAN_ETHERTYPES:
+        ethertype = _ETHERTYPE.unpack(data[offset + 2:offset + 4])[0]
+        offset += 4
+    elif linktype == LINKTYPE_LINUX_SLL:
+      ethertype = _ETHERTYPE.unpack(data[14:16])[0]
+      offset = 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+      ethertype = _ETHERTYPE.unpack(data[0:2])[0]
+      offset = 20
+    elif linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+      # The address family is in the byte order of the capturing host.
+      family = struct.unpack('<I', data[0:4])[0]
+      if family > 0xFFFF:
+        family = struct.unpack('>I', data[0:4])[0]
+      if family in BSD_AF_INET6:
+        ethertype = ETHERTYPE_IPV6
+      else:
+        ethertype = ETHERTYPE_IP
+      offset = 4
+    elif linktype in RAW_LINKTYPES:
+      if ord(data[0]) >> 4 == 6:
+        ethertype = ETHERTYPE_IPV6
+      else:
+        ethertype = ETHERTYPE_IP
+      offset = 0
+    else:
+      return None
+
+    if ethertype == ETHERTYPE_IP:
+      (protocol, segment) = _IPv4Payload(data, offset)
+    elif ethertype == ETHERTYPE_IPV6:
+      (protocol, segment) = _IPv6Payload(data, offset)
+    else:
+      return None
+
+    if protocol == IPPROTO_UDP:
+      if DNS_PORT in _UDP_PORTS.unpack(segment[0:4]):
+        return segment[8:]
+    elif protocol == IPPROTO_TCP:
+      if DNS_PORT in _UDP_PORTS.unpack(segment[0:4]):
+        payload = segment[(ord(segment[12]) >> 4) * 4:]
+        if len(payload) > 2:
+          return payload[2:2 + _ETHERTYPE.unpack(payload[0:2])[0]]
+  except (struct.error, IndexError):
+    pass
+  return None
+
+
+def _IPv4Payload(data, offset):
+  header_length = (ord(data[offset]) & 0x0F) * 4
+  total_length = _ETHERTYPE.unpack(data[offset + 2:offset + 4])[0]
+  fragment = _ETHERTYPE.unpack(data[offset + 6:offset + 8])[0]
+  # Later fragments do not carry a UDP/TCP header.
+  if fragment & 0x1FFF:
+    return (None, None)
+  protocol = ord(data[offset + 9])
+  end = offset + total_length
+  if total_length < header_length:
+    end = len(data)
+  return (protocol, data[offset + header_length:end])
+
+
+def _IPv6Payload(data, offset):
+  next_header = ord(data[offset + 6])
+  payload_length = _ETHERTYPE.unpack(data[offset + 4:offset + 6])[0]
+  end = offset + 40 + payload_length
+  if not payload_length:
+    end = len(data)
+  offset += 40
+  while next_header in IPV6_EXTENSION_HEADERS or next_header == IPV6_FRAGMENT_HEADER:
+    if next_header == IPV6_FRAGMENT_HEADER:
+      if _ETHERTYPE.unpack(data[offset + 2:offset + 4])[0] & 0xFFF8:
+        return (None, None)
+      length = 8
+    else:
+      length = (ord(data[offset + 1]) + 1) * 8
+    next_header = ord(data[offset])
+    offset += length
+  return (next_header, data[offset:end])
+
+
+def _DecodeQuestions(message):
+  """Return (qtype, qname) for each question in a DNS query message."""
+  questions = []
+  offset = 12
+  try:
+    (unused_id, flags, question_count) = _DNS_HEADER.unpack(message[0:12])[0:3]
+    # Only queries (QR bit clear) with a standard opcode.
+    if flags & 0xF800:
+      return []
+    for _ in range(question_count):
+      (qname, offset) = _DecodeName(message, offset)
+      (qtype, unused_qclass) = _QUESTION.unpack(message[offset:offset + 4])
+      offset += 4
+      if qname:
+        questions.append((dns.rdatatype.to_text(qtype), qname))
+  except (struct.error, IndexError, ValueError):
+    pass
+  return questions
+
+
+def _DecodeName(message, offset):
+  """Decode a (possibly compressed) name, returning (name, offset after it)."""
+  labels = []
+  end = None
+  jumps = 0
+  while True:
+    length = ord(message[offset])
+    if length & 0xC0 == 0xC0:
+      if end is None:
+        end = offset + 2
+      jumps += 1
+      if jumps > 16:
+        raise ValueError('Compression loop')
+      offset = ((length & 0x3F) << 8) + ord(message[offset + 1])
+      continue
+    if length & 0xC0:
+      raise ValueError('Unknown label type')
+    offset += 1
+    if not length:
+      break
+    label = message[offset:offset + length]
+    if len(label) < length:
+      raise IndexError('Truncated label')
+    labels.append(label)
+    offset += length
+  if end is None:
+    end = offset
+
+  name = '.'.join(labels) + '.'
+  if name == '.' or not USABLE_NAME_RE.match(name):
+    return (None, end)
+  return (name, end)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the pcap_reader module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import os
+import struct
+import tempfile
+import unittest
+
+# external dependencies (from nb_third_party)
+import dns.message
+
+import pcap_reader
+
+
+def Query(name, rdtype='A'):
+  return dns.message.make_query(name, rdtype).to_wire()
+
+
+def Response(name):
+  request = dns.message.make_query(name, 'A')
+  return dns.message.make_response(request).to_wire()
+
+
+def Udp(payload, sport=4000, dport=53):
+  return struct.pack('!HHHH', sport, dport, len(payload) + 8, 0) + payload
+
+
+def Tcp(payload, sport=4000, dport=53):
+  return (struct.pack('!HHIIBBHHH', sport, dport, 1, 0, 5 << 4, 0x18, 8192, 0, 0) +
+          struct.pack('!H', len(payload)) + payload)
+
+
+def IPv4(protocol, segment, fragment=0):
+  return struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(segment), 1, fragment, 64, protocol, 0,
+                     '\x0a\x00\x00\x01', '\x08\x08\x08\x08') + segment
+
+
+def IPv6(protocol, segment):
+  return struct.pack('!IHBB16s16s', 6 << 28, len(segment), protocol, 64, '\x00' * 15 + '\x01',
+                     '\x00' * 15 + '\x02') + segment
+
+
+def Ethernet(packet, ethertype=0x0800, vlan=False):
+  header = '\xff' * 12
+  if vlan:
+    header += struct.pack('!HH', 0x8100, 7)
+  return header + struct.pack('!H', ethertype) + packet
+
+
+def Pcap(linktype, packets):
+  data = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, linktype)
+  for (timestamp, frame) in packets:
+    data += struct.pack('<IIII', int(timestamp), int(round(timestamp % 1 * 1e6)),
+                        len(frame), len(frame)) + frame
+  return data
+
+
+def PcapngBlock(block_type, body, endian='>'):
+  body += '\x00' * (-len(body) % 4)
+  length = struct.pack(endian + 'I', len(body) + 12)
+  return struct.pack(endian + 'I', block_type) + length + body + length
+
+
+class PcapReaderTest(unittest.TestCase):
+  def setUp(self):
+    (fd, self.path) = tempfile.mkstemp()
+    os.close(fd)
+
+  def tearDown(self):
+    os.unlink(self.path)
+
+  def _Read(self, data):
+    open(self.path, 'wb').write(data)
+    return list(pcap_reader.ReadQueries(self.path))
+
+  def testPcap(self):
+    udp = pcap_reader.IPPROTO_UDP
+    packets = [
+        (1287446400.5, Ethernet(IPv4(udp, Udp(Query('www.google.com'))))),
+        (1287446400.75, Ethernet(IPv4(udp, Udp(Query('example.org', 'AAAA'))), vlan=True)),
+        # Responses, other ports, and later fragments are not queries.
+        (1287446401.0, Ethernet(IPv4(udp, Udp(Response('www.google.com'), sport=53, dport=4000)))),
+        (1287446401.0, Ethernet(IPv4(udp, Udp(Query('www.yahoo.com'), dport=5353)))),
+        (1287446401.0, Ethernet(IPv4(udp, Udp(Query('www.yahoo.com')), fragment=10))),
+        (1287446401.0, Ethernet('\x00' * 10)),
+        (1287446401.25, Ethernet(IPv6(pcap_reader.IPPROTO_TCP, Tcp(Query('ipv6.example.com', 'TXT'))),
+                                 ethertype=0x86DD)),
+        (1287446401.5, Ethernet(IPv4(udp, Udp(Query('odd.example.com', 65))))),
+    ]
+    queries = self._Read(Pcap(pcap_reader.LINKTYPE_ETHERNET, packets))
+    self.assertEquals([x[0:2] for x in queries],
+                      [('A', 'www.google.com.'), ('AAAA', 'example.org.'),
+                       ('TXT', 'ipv6.example.com.'), ('TYPE65', 'odd.example.com.')])
+    self.assertEquals(queries[0][2], 1287446400.5)
+    self.assertTrue(pcap_reader.IsCaptureFile(self.path))
+
+    # Truncated captures stop at the last whole packet.
+    data = Pcap(pcap_reader.LINKTYPE_RAW, [(1.0, IPv4(udp, Udp(Query('raw.example.com'))))])
+    self.assertEquals(self._Read(data + data[24:-10]), [('A', 'raw.example.com.', 1.0)])
+
+  def testPcapng(self):
+    section = PcapngBlock(pcap_reader.SECTION_HEADER_BLOCK,
+                          struct.pack('>IHHq', 0x1a2b3c4d, 1, 0, -1))
+    # Nanosecond timestamps on a Linux cooked capture.
+    interface = PcapngBlock(pcap_reader.INTERFACE_DESCRIPTION_BLOCK,
+                            struct.pack('>HHIHHB3xHH', pcap_reader.LINKTYPE_LINUX_SLL, 0, 65535,
+                                        pcap_reader.IF_TSRESOL_OPTION, 1, 9, 0, 0))
+    frame = '\x00' * 14 + '\x08\x00' + IPv4(pcap_reader.IPPROTO_UDP, Udp(Query('www.google.com')))
+    nanoseconds = 1287446400250000000
+    packet = PcapngBlock(pcap_reader.ENHANCED_PACKET_BLOCK,
+                         struct.pack('>IIIII', 0, nanoseconds >> 32, nanoseconds & 0xFFFFFFFF,
+                                     len(frame), len(frame)) + frame)
+    unknown = PcapngBlock(0x0BAD, 'junk')
+    queries = self._Read(section + interface + unknown + packet + packet[:-3])
+    self.assertEquals(queries, [('A', 'www.google.com.', 1287446400.25)])
+
+  def testConcatenatedSections(self):
+    sections = ''
+    for (endian, name) in (('>', 'www.google.com'), ('<', 'example.org')):
+      frame = IPv4(pcap_reader.IPPROTO_UDP, Udp(Query(name)))
+      sections += (PcapngBlock(pcap_reader.SECTION_HEADER_BLOCK,
+                               struct.pack(endian + 'IHHq', 0x1a2b3c4d, 1, 0, -1), endian) +
+                   PcapngBlock(pcap_reader.INTERFACE_DESCRIPTION_BLOCK,
+                               struct.pack(endian + 'HHI', pcap_reader.LINKTYPE_RAW, 0, 65535),
+                               endian) +
+                   PcapngBlock(pcap_reader.ENHANCED_PACKET_BLOCK,
+                               struct.pack(endian + 'IIIII', 0, 0, 1000000, len(frame),
+                                           len(frame)) + frame, endian))
+    self.assertEquals(self._Read(sections), [('A', 'www.google.com.', 1.0),
+                                             ('A', 'example.org.', 1.0)])
+
+  def testNotACapture(self):
+    open(self.path, 'wb').write('http://www.google.com/\n')
+    self.assertFalse(pcap_reader.IsCaptureFile(self.path))
+    self.assertRaises(pcap_reader.CaptureError, list, pcap_reader.ReadQueries(self.path))
+
+
+if __name__ == '__main__':
+  unittest.main()
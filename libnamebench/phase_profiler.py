@@ -0,0 +1,181 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure where the wall clock and CPU time go in each phase of a run."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import gc
+import os
+import os.path
+import sys
+import threading
+import time
+
+# external dependencies (from nb_third_party)
+import simplejson
+
+import query_events
+
+try:
+  import cProfile
+except ImportError:
+  cProfile = None
+
+# Phases worth instrumenting, by the class that implements them.
+NAMESERVERS_PHASES = ('SetTimeouts', 'PingNameServers', 'RunHealthCheckThreads',
+                      'CheckCacheCollusion', 'RunNodeIdThreads',
+                      'RunFinalHealthCheckThreads', 'RunHostnameThreads',
+                      'CheckCensorship')
+DATA_SOURCES_PHASES = ('GetTestsFromSource',)
+BENCHMARK_PHASES = ('Run', 'RunIndex')
+REPORTER_PHASES = ('CreateReport', 'GenerateChartUrls', 'SaveResultsToCsv')
+
+
+def _CpuTime():
+  """Process-wide CPU time (user + system), including all threads."""
+  times = os.times()
+  return times[0] + times[1]
+
+
+def _LiveObjectCount():
+  """How many objects (or where Python can tell, memory blocks) are alive.
+
+  This walks every tracked object on older Pythons, so it is slow.
+  """
+  if hasattr(sys, 'getallocatedblocks'):
+    return sys.getallocatedblocks()
+  return len(gc.get_objects())
+
+
+class PhaseProfiler(object):
+  """Record wall time, CPU time, query count and live objects per phase."""
+
+  def __init__(self, profile_dir=None, count_objects=False):
+    """Constructor.
+
+    Args:
+      profile_dir: If set, save cProfile stats for each top-level phase here.
+      count_objects: record the change in live objects over each phase.
+    """
+    self.profile_dir = profile_dir
+    self.count_objects = count_objects
+    self.phases = {}
+    self.phase_order = []
+    self.query_count = 0
+    self._depth = 0
+    self._lock = threading.Lock()
+    query_events.AddListener(self._CountQuery)
+
+  def _CountQuery(self, *unused_args):
+    self._lock.acquire()
+    try:
+      self.query_count += 1
+    finally:
+      self._lock.release()
+
+  def Close(self):
+    query_events.RemoveListener(self._CountQuery)
+
+  def Instrument(self, obj, method_names, prefix=None):
+    """Replace methods on an object instance with profiled versions.
+
+    Args:
+      obj: The object to instrument (a NameServers, Benchmark, etc.)
+      method_names: A list of method names to wrap.
+      prefix: What to prefix the phase names with (defaults to the class name)
+    """
+    if not prefix:
+      prefix = obj.__class__.__name__
+    for name in method_names:
+      method = getattr(obj, name, None)
+      if not method or getattr(method, 'is_profiled', False):
+        continue
+      setattr(obj, name, self._Wrap('%s.%s' % (prefix, name), method))
+
+  def _Wrap(self, phase, function):
+    def Wrapper(*args, **kwargs):
+      return self.Run(phase, function, *args, **kwargs)
+    Wrapper.is_profiled = True
+    Wrapper.__name__ = function.__name__
+    Wrapper.__doc__ = function.__doc__
+    return Wrapper
+
+  def Run(self, phase, function, *args, **kwargs):
+    """Call a function, recording its cost under the given phase name.
+
+    Phases may be nested, in which case the outer phase includes the cost of
+    the inner ones. cProfile captures are only taken for top-level phases,
+    and only cover the calling thread.
+    """
+    profiler = None
+    if self.profile_dir and cProfile and not self._depth:
+      profiler = cProfile.Profile()
+
+    self._depth += 1
+    start_queries = self.query_count
+    if self.count_objects:
+      start_objects = _LiveObjectCount()
+    start_cpu = _CpuTime()
+    start_wall = time.time()
+    try:
+      if profiler:
+        return profiler.runcall(function, *args, **kwargs)
+      else:
+        return function(*args, **kwargs)
+    finally:
+      wall = time.time() - start_wall
+      cpu = _CpuTime() - start_cpu
+      if self.count_objects:
+        live_objects = _LiveObjectCount() - start_objects
+      else:
+        live_objects = None
+      self._depth -= 1
+      self._Record(phase, self._depth, wall, cpu, self.query_count - start_queries,
+                   live_objects)
+      if profiler:
+        self._SaveProfile(phase, profiler)
+
+  def _Record(self, phase, depth, wall, cpu, queries, live_objects):
+    """Add a call to the totals for a phase. live_objects is None if not counted."""
+    if phase not in self.phases:
+      self.phases[phase] = {'name': phase, 'depth': depth, 'calls': 0, 'wall': 0.0,
+                            'cpu': 0.0, 'queries': 0, 'live_objects': None}
+      self.phase_order.append(phase)
+    record = self.phases[phase]
+    record['calls'] += 1
+    record['wall'] += wall
+    record['cpu'] += cpu
+    record['queries'] += queries
+    if live_objects is not None:
+      record['live_objects'] = (record['live_objects'] or 0) + live_objects
+
+  def _SaveProfile(self, phase, profiler):
+    if not os.path.exists(self.profile_dir):
+      os.makedirs(self.profile_dir)
+    path = os.path.join(self.profile_dir, '%s.pstats' % phase)
+    profiler.dump_stats(path)
+    self.phases[phase]['profile_path'] = path
+
+  def Summary(self):
+    """Return a list of phase records, in the order they first ran."""
+    return [self.phases[x] for x in self.phase_order]
+
+  def CreateJsonData(self):
+    return simplejson.dumps({'phases': self.Summary(), 'total_queries': self.query_count})
+
+  def SaveJson(self, path):
+    f = open(path, 'w')
+    f.write(self.CreateJsonData())
+    f.close()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the phase_profiler module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import gc
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+import mocks
+import phase_profiler
+import query_events
+
+
+class FakePhases(object):
+  def Outer(self):
+    mocks.MockNameServer(mocks.GOOD_IP).TimedRequest('A', 'www.paypal.com.')
+    return self.Inner()
+
+  def Inner(self):
+    mocks.MockNameServer(mocks.GOOD_IP).TimedRequest('A', 'www.google.com.')
+    return 'done'
+
+
+class PhaseProfilerTest(unittest.TestCase):
+  def testNestedPhases(self):
+    profiler = phase_profiler.PhaseProfiler()
+    phases = FakePhases()
+    profiler.Instrument(phases, ('Outer', 'Inner', 'Missing'))
+    self.assertEquals(phases.Outer(), 'done')
+    phases.Inner()
+    profiler.Close()
+
+    summary = profiler.Summary()
+    self.assertEquals([x['name'] for x in summary],
+                      ['FakePhases.Inner', 'FakePhases.Outer'])
+    (inner, outer) = summary
+    self.assertEquals(inner['calls'], 2)
+    self.assertEquals(inner['queries'], 2)
+    self.assertEquals(inner['depth'], 1)
+    self.assertEquals(outer['calls'], 1)
+    self.assertEquals(outer['queries'], 2)
+    self.assertEquals(outer['depth'], 0)
+    self.assertTrue(outer['wall'] >= 0)
+    # Live objects are only counted on request.
+    self.assertEquals(outer['live_objects'], None)
+    self.assertTrue(profiler._CountQuery not in query_events.LISTENERS)
+
+  def testCountObjects(self):
+    profiler = phase_profiler.PhaseProfiler(count_objects=True)
+    # Otherwise a collection during the phase may free more than it creates.
+    gc.collect()
+    kept = profiler.Run('Allocate', lambda: [[] for unused in range(1000)])
+    profiler.Close()
+    self.assertTrue(profiler.Summary()[0]['live_objects'] >= len(kept))
+
+  def testInstrumentTwice(self):
+    profiler = phase_profiler.PhaseProfiler()
+    phases = FakePhases()
+    profiler.Instrument(phases, ('Inner',))
+    profiler.Instrument(phases, ('Inner',))
+    phases.Inner()
+    profiler.Close()
+    self.assertEquals(profiler.Summary()[0]['calls'], 1)
+
+  def testProfileDir(self):
+    profile_dir = os.path.join(tempfile.mkdtemp(), 'profiles')
+    try:
+      profiler = phase_profiler.PhaseProfiler(profile_dir=profile_dir)
+      profiler.Run('Inner', FakePhases().Inner)
+      profiler.Close()
+      path = profiler.Summary()[0]['profile_path']
+      self.assertEquals(path, os.path.join(profile_dir, 'Inner.pstats'))
+      self.assertTrue(os.path.exists(path))
+    finally:
+      shutil.rmtree(os.path.dirname(profile_dir))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,62 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Notify interested parties about every DNS query namebench sends.
+
+Listeners are called with:
+
+  (phase, ip, type_string, record_string, start_time, end_time, response, error_msg)
+
+end_time is None if no response was received. Listeners are called from the
+querying thread, so they must be cheap and thread-safe.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+UNKNOWN_PHASE = 'unknown'
+
+_current_phase = UNKNOWN_PHASE
+LISTENERS = []
+
+
+def SetPhase(phase):
+  """Set the name of the phase that subsequent queries belong to."""
+  global _current_phase
+  _current_phase = phase
+
+
+def GetPhase():
+  return _current_phase
+
+
+def AddListener(listener):
+  if listener not in LISTENERS:
+    LISTENERS.append(listener)
+
+
+def RemoveListener(listener):
+  if listener in LISTENERS:
+    LISTENERS.remove(listener)
+
+
+def Notify(ip, type_string, record_string, start_time, end_time, response, error_msg,
+           phase=None):
+  """Pass the details of a completed query to all listeners."""
+  if not LISTENERS:
+    return
+  if not phase:
+    phase = _current_phase
+  for listener in list(LISTENERS):
+    listener(phase, ip, type_string, record_string, start_time, end_time, response,
+             error_msg)
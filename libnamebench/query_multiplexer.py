@@ -0,0 +1,270 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Send many DNS queries at once over a single non-blocking UDP socket."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import collections
+import errno
+import random
+import select
+import socket
+import time
+
+# external dependencies (from nb_third_party)
+import dns.exception
+import dns.inet
+import dns.message
+import dns.rdatatype
+
+import query_events
+import util
+
+DEFAULT_PORT = 53
+MAX_PACKET_SIZE = 65535
+
+
+class QueryMultiplexer(object):
+  """Fire off a batch of DNS requests and collect the answers as they arrive.
+
+  Requests are matched back to their answers by (server ip, message id), so
+  hundreds of queries can be outstanding against any number of servers while
+  only one socket per address family is used.
+  """
+
+  def __init__(self, port=DEFAULT_PORT, timer=time.time, phase=None):
+    self.port = port
+    self.timer = timer
+    self.phase = phase
+    self._sockets = {}
+
+  def _GetSocket(self, ip):
+    try:
+      af = dns.inet.af_for_address(ip)
+    except:
+      af = dns.inet.AF_INET
+    if af not in self._sockets:
+      sock = socket.socket(af, socket.SOCK_DGRAM, 0)
+      sock.setblocking(0)
+      self._sockets[af] = sock
+    return self._sockets[af]
+
+  def _Destination(self, ip, port):
+    if ':' in ip:
+      return (ip, port, 0, 0)
+    else:
+      return (ip, port)
+
+  def Close(self):
+    for sock in self._sockets.values():
+      sock.close()
+    self._sockets = {}
+
+  def Query(self, requests, timeout):
+    """Send all requests, and wait up to timeout seconds for the answers.
+
+    Args:
+      requests: A list of tuples in the form of (key, ip, dns.message.Message).
+        An optional fourth value overrides the destination port.
+      timeout: How long to wait for all of the answers (float, seconds)
+
+    Returns:
+      A dictionary keyed by the request key, with values in the form of
+      (response, duration in ms [float], error_msg). Requests which were not
+      answered in time have a response of None and an error_msg of 'Timeout'.
+    """
+    pending = {}
+    results = {}
+    start_times = {}
+
+    for request_data in requests:
+      (key, ip, request) = request_data[0:3]
+      if len(request_data) > 3:
+        port = request_data[3]
+      else:
+        port = self.port
+
+      # Make sure no two outstanding requests to the same server share an id.
+      while (ip, port, request.id) in pending:
+        request.id = random.randint(0, 65535)
+
+      sock = self._GetSocket(ip)
+      start_times[key] = self.timer()
+      try:
+        sock.sendto(request.to_wire(), self._Destination(ip, port))
+      except socket.error:
+        results[key] = (None, 0, util.GetLastExceptionString())
+        continue
+      pending[(ip, port, request.id)] = (key, request)
+
+    expiration = self.timer() + timeout
+    sockets = self._sockets.values()
+    while pending:
+      remaining = expiration - self.timer()
+      if remaining <= 0:
+        break
+      try:
+        (readable, unused_w, unused_x) = select.select(sockets, [], [], remaining)
+      except select.error, e:
+        if e.args[0] == errno.EINTR:
+          continue
+        raise
+
+      for sock in readable:
+        self._ReadAnswers(sock, pending, start_times, results)
+
+    for (key, unused_request) in pending.values():
+      duration = util.SecondsToMilliseconds(self.timer() - start_times[key])
+      results[key] = (None, duration, 'Timeout')
+
+    if query_events.LISTENERS:
+      for request_data in requests:
+        (key, ip, request) = request_data[0:3]
+        if key in start_times:
+          self._Notify(ip, request, start_times[key], results[key])
+    return results
+
+  def Replay(self, requests, timeout):
+    """Send each request at a set time, regardless of how earlier ones fared.
+
+    This is an open loop: a slow or missing answer never delays the requests
+    which follow it, so the load seen by the servers is the load described.
+
+    Args:
+      requests: An iterable of tuples in the form of (offset, key, ip,
+        dns.message.Message), in order of offset: the number of seconds after
+        the start to send the request at. An optional fifth value overrides
+        the destination port.
+      timeout: How long to wait for each answer (float, seconds)
+
+    Returns:
+      A dictionary keyed by the request key, with values in the form of
+      (response, duration in ms [float], error_msg, lateness in ms [float]),
+      where lateness is how long after its set time the request was sent.
+    """
+    requests = iter(requests)
+    pending = {}
+    results = {}
+    start_times = {}
+    lateness = {}
+    # Every request has the same timeout, so they expire in the order sent.
+    deadlines = collections.deque()
+    next_request = next(requests, None)
+    start = self.timer()
+
+    while next_request or pending:
+      now = self.timer()
+      while next_request and start + next_request[0] <= now:
+        (offset, key, ip, request) = next_request[0:4]
+        if len(next_request) > 4:
+          port = next_request[4]
+        else:
+          port = self.port
+        next_request = next(requests, None)
+
+        while (ip, port, request.id) in pending:
+          request.id = random.randint(0, 65535)
+        sock = self._GetSocket(ip)
+        start_times[key] = self.timer()
+        lateness[key] = util.SecondsToMilliseconds(start_times[key] - start - offset)
+        try:
+          sock.sendto(request.to_wire(), self._Destination(ip, port))
+        except socket.error:
+          results[key] = (None, 0, util.GetLastExceptionString())
+          self._Notify(ip, request, start_times[key], results[key])
+          continue
+        pending[(ip, port, request.id)] = (key, request)
+        deadlines.append((start_times[key] + timeout, (ip, port, request.id), key))
+
+      while deadlines and deadlines[0][0] <= now:
+        (unused_deadline, pending_key, key) = deadlines.popleft()
+        if pending_key in pending and pending[pending_key][0] == key:
+          request = pending.pop(pending_key)[1]
+          duration = util.SecondsToMilliseconds(now - start_times[key])
+          results[key] = (None, duration, 'Timeout')
+          self._Notify(pending_key[0], request, start_times[key], results[key])
+
+      waits = []
+      if next_request:
+        waits.append(start + next_request[0] - now)
+      if deadlines:
+        waits.append(deadlines[0][0] - now)
+      if not waits:
+        break
+      wait = max(min(waits), 0)
+
+      sockets = self._sockets.values()
+      if not sockets:
+        time.sleep(wait)
+        continue
+      try:
+        (readable, unused_w, unused_x) = select.select(sockets, [], [], wait)
+      except select.error, e:
+        if e.args[0] == errno.EINTR:
+          continue
+        raise
+      for sock in readable:
+        for (ip, request, key) in self._ReadAnswers(sock, pending, start_times, results):
+          self._Notify(ip, request, start_times[key], results[key])
+
+    for key in results:
+      results[key] = results[key] + (lateness[key],)
+    return results
+
+  def _ReadAnswers(self, sock, pending, start_times, results):
+    """Read every answer waiting on a socket, and match it to its request.
+
+    Returns:
+      A list of (ip, request, key) for the requests which were answered.
+    """
+    answered = []
+    while True:
+      try:
+        (wire, from_address) = sock.recvfrom(MAX_PACKET_SIZE)
+      except socket.error, e:
+        if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+          break
+        # ICMP errors (ECONNREFUSED) are reported on the socket, but we
+        # can not tell which request caused them. Let them time out.
+        continue
+      end_time = self.timer()
+      try:
+        response = dns.message.from_wire(wire)
+      except dns.exception.DNSException:
+        continue
+      pending_key = (from_address[0], from_address[1], response.id)
+      if pending_key not in pending:
+        continue
+      (key, request) = pending[pending_key]
+      if not request.is_response(response):
+        continue
+      del pending[pending_key]
+      duration = util.SecondsToMilliseconds(end_time - start_times[key])
+      results[key] = (response, duration, None)
+      answered.append((from_address[0], request, key))
+    return answered
+
+  def _Notify(self, ip, request, start_time, result):
+    """Tell any query_events listeners about a finished request."""
+    if not query_events.LISTENERS:
+      return
+    (response, duration, error_msg) = result[0:3]
+    if response:
+      end_time = start_time + (duration / 1000.0)
+    else:
+      end_time = None
+    question = request.question[0]
+    query_events.Notify(ip, dns.rdatatype.to_text(question.rdtype), str(question.name),
+                        start_time, end_time, response, error_msg, phase=self.phase)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Binary per-query event trace: a buffered writer and a CSV/JSON exporter.
+
+The trace file is a short header followed by fixed-size records, one per
+query sent. Records are queued by the querying threads and packed + written
+in batches by a background thread, so tracing adds very little to the
+measured latency.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import csv
+import socket
+import struct
+import sys
+import threading
+
+if __name__ == '__main__':
+  sys.path.append('..')
+  import nb_third_party
+
+# external dependencies (from nb_third_party)
+import dns.rcode
+import dns.rdatatype
+import simplejson
+
+import query_events
+
+# Bumped whenever the record format changes.
+FILE_MAGIC = 'NBTRACE2'
+
+# The longest name DNS allows, in presentation form with its trailing dot.
+MAX_QNAME_LENGTH = 255
+
+# phase, server ip, qtype, qname, send time, receive time, rcode, size, error
+RECORD_FORMAT = '<12s16sH%dsddhI32s' % MAX_QNAME_LENGTH
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+FIELDS = ('phase', 'server', 'qtype', 'qname', 'send_time', 'receive_time',
+          'rcode', 'size', 'error')
+
+# receive_time and rcode values used when no response arrived.
+NO_RECEIVE_TIME = -1.0
+NO_RCODE = -1
+
+FLUSH_INTERVAL = 1.0
+FLUSH_RECORD_COUNT = 1024
+
+# Used for record types we can not name.
+UNKNOWN_QTYPE = 0
+
+
+# IPv4 addresses are stored as IPv4-mapped IPv6 addresses.
+IPV4_MAPPED_PREFIX = '\x00' * 10 + '\xff' * 2
+
+
+def _PackIp(ip):
+  try:
+    if ':' in ip:
+      return socket.inet_pton(socket.AF_INET6, ip)
+    else:
+      return IPV4_MAPPED_PREFIX + socket.inet_aton(ip)
+  except (socket.error, ValueError):
+    return ''
+
+
+def _UnpackIp(packed):
+  if packed.startswith(IPV4_MAPPED_PREFIX):
+    return socket.inet_ntoa(packed[12:16])
+  else:
+    return socket.inet_ntop(socket.AF_INET6, packed)
+
+
+class TraceWriter(object):
+  """Append query events to a binary trace file."""
+
+  def __init__(self, path, flush_interval=FLUSH_INTERVAL):
+    self.path = path
+    self.flush_interval = flush_interval
+    self.record_count = 0
+    self._pending = []
+    self._lock = threading.Lock()
+    self._wakeup = threading.Event()
+    self._halt = False
+    self._fp = open(path, 'wb')
+    self._fp.write(FILE_MAGIC)
+    self._thread = threading.Thread(target=self._FlushLoop)
+    self._thread.setDaemon(True)
+    self._thread.start()
+
+  def Start(self):
+    """Begin recording all queries namebench sends."""
+    query_events.AddListener(self.RecordQuery)
+
+  def RecordQuery(self, phase, ip, type_string, record_string, start_time, end_time,
+                  response, error_msg):
+    """query_events listener: queue an event for the background writer."""
+    self._lock.acquire()
+    try:
+      self._pending.append((phase, ip, type_string, record_string, start_time,
+                            end_time, response, error_msg))
+      pending_count = len(self._pending)
+    finally:
+      self._lock.release()
+    if pending_count >= FLUSH_RECORD_COUNT:
+      self._wakeup.set()
+
+  def _PackEvent(self, event):
+    (phase, ip, type_string, record_string, start_time, end_time, response,
+     error_msg) = event
+    try:
+      qtype = dns.rdatatype.from_text(type_string)
+    except:
+      qtype = UNKNOWN_QTYPE
+
+    if response:
+      rcode = response.rcode()
+      # Rendering is not free, which is why we do it here rather than in the
+      # querying thread.
+      size = len(response.to_wire())
+    else:
+      rcode = NO_RCODE
+      size = 0
+
+    if end_time is None:
+      end_time = NO_RECEIVE_TIME
+
+    return struct.pack(RECORD_FORMAT, str(phase)[0:12], _PackIp(ip), qtype,
+                       str(record_string)[0:MAX_QNAME_LENGTH], start_time, end_time, rcode, size,
+                       str(error_msg or '')[0:32])
+
+  def Flush(self):
+    self._lock.acquire()
+    try:
+      events = self._pending
+      self._pending = []
+    finally:
+      self._lock.release()
+
+    if events:
+      self._fp.write(''.join([self._PackEvent(x) for x in events]))
+      self._fp.flush()
+      self.record_count += len(events)
+
+  def _FlushLoop(self):
+    while not self._halt:
+      self._wakeup.wait(self.flush_interval)
+      self._wakeup.clear()
+      self.Flush()
+
+  def Close(self):
+    """Stop recording, write out everything pending, and close the file."""
+    query_events.RemoveListener(self.RecordQuery)
+    self._halt = True
+    self._wakeup.set()
+    self._thread.join()
+    self.Flush()
+    self._fp.close()
+
+
+def ReadTrace(path):
+  """Yield each record in a trace file as a dictionary."""
+  fp = open(path, 'rb')
+  try:
+    if fp.read(len(FILE_MAGIC)) != FILE_MAGIC:
+      raise ValueError('%s is not a namebench trace file' % path)
+    while True:
+      data = fp.read(RECORD_SIZE)
+      if len(data) < RECORD_SIZE:
+        break
+      values = list(struct.unpack(RECORD_FORMAT, data))
+      record = dict(zip(FIELDS, values))
+      for key in ('phase', 'qname', 'error'):
+        record[key] = record[key].rstrip('\x00')
+      record['server'] = _UnpackIp(record['server'])
+      if record['qtype'] == UNKNOWN_QTYPE:
+        record['qtype'] = None
+      else:
+        record['qtype'] = dns.rdatatype.to_text(record['qtype'])
+      if record['receive_time'] == NO_RECEIVE_TIME:
+        record['receive_time'] = None
+        record['duration'] = None
+      else:
+        record['duration'] = (record['receive_time'] - record['send_time']) * 1000
+      if record['rcode'] == NO_RCODE:
+        record['rcode'] = None
+      else:
+        record['rcode'] = dns.rcode.to_text(record['rcode'])
+      yield record
+  finally:
+    fp.close()
+
+
+def ExportCsv(path, output_fp):
+  """Write the contents of a trace file out as CSV."""
+  columns = list(FIELDS) + ['duration']
+  output = csv.writer(output_fp)
+  output.writerow(columns)
+  for record in ReadTrace(path):
+    output.writerow([record[x] for x in columns])
+
+
+def ExportJson(path, output_fp):
+  """Write the contents of a trace file out as a JSON list."""
+  output_fp.write(simplejson.dumps(list(ReadTrace(path))))
+
+
+if __name__ == '__main__':
+  if len(sys.argv) < 2:
+    print 'Usage: %s <trace file> [csv|json]' % sys.argv[0]
+    sys.exit(1)
+  if len(sys.argv) > 2 and sys.argv[2] == 'json':
+    ExportJson(sys.argv[1], sys.stdout)
+  else:
+    ExportCsv(sys.argv[1], sys.stdout)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the query_trace module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import os
+import StringIO
+import tempfile
+import unittest
+
+import mocks
+import query_events
+import query_trace
+
+
+class QueryTraceTest(unittest.TestCase):
+  def setUp(self):
+    (fd, self.path) = tempfile.mkstemp()
+    os.close(fd)
+
+  def tearDown(self):
+    os.unlink(self.path)
+
+  def testRoundTrip(self):
+    writer = query_trace.TraceWriter(self.path)
+    writer.Start()
+    query_events.SetPhase('benchmark')
+    mocks.MockNameServer(mocks.GOOD_IP).TimedRequest('A', 'www.paypal.com.')
+    mocks.MockNameServer(mocks.BROKEN_IP).TimedRequest('MX', 'paypal.com.')
+    writer.Close()
+    self.assertEquals(writer.record_count, 2)
+    self.assertEquals(os.path.getsize(self.path),
+                      len(query_trace.FILE_MAGIC) + query_trace.RECORD_SIZE * 2)
+
+    records = list(query_trace.ReadTrace(self.path))
+    self.assertEquals(records[0]['phase'], 'benchmark')
+    self.assertEquals(records[0]['server'], mocks.GOOD_IP)
+    self.assertEquals(records[0]['qtype'], 'A')
+    self.assertEquals(records[0]['qname'], 'www.paypal.com.')
+    self.assertEquals(records[0]['rcode'], 'NOERROR')
+    self.assertTrue(records[0]['size'] > 0)
+    self.assertTrue(records[0]['duration'] > 0)
+
+    self.assertEquals(records[1]['server'], mocks.BROKEN_IP)
+    self.assertEquals(records[1]['qtype'], 'MX')
+    self.assertEquals(records[1]['rcode'], None)
+    self.assertEquals(records[1]['receive_time'], None)
+    self.assertTrue('BadResponse' in records[1]['error'])
+
+  def testLongQname(self):
+    qname = '.'.join(['a' * 62] * 4) + '.'
+    writer = query_trace.TraceWriter(self.path)
+    writer.RecordQuery('benchmark', mocks.GOOD_IP, 'A', qname, 1.0, None, None, 'Timeout')
+    writer.Close()
+    self.assertEquals(list(query_trace.ReadTrace(self.path))[0]['qname'], qname)
+
+  def testListenerRemovedOnClose(self):
+    writer = query_trace.TraceWriter(self.path)
+    writer.Start()
+    writer.Close()
+    self.assertTrue(writer.RecordQuery not in query_events.LISTENERS)
+
+  def testExportCsv(self):
+    writer = query_trace.TraceWriter(self.path)
+    writer.RecordQuery('health', '::1', 'AAAA', 'example.com.', 10.0, None, None,
+                       'Timeout')
+    writer.Close()
+    output = StringIO.StringIO()
+    query_trace.ExportCsv(self.path, output)
+    lines = output.getvalue().splitlines()
+    self.assertEquals(lines[0], ','.join(query_trace.FIELDS) + ',duration')
+    self.assertEquals(lines[1], 'health,::1,AAAA,example.com.,10.0,,,0,Timeout,')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,165 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Replay captured DNS traffic against nameservers, keeping its timing.
+
+A standard benchmark sends a sampled list of records back-to-back. A replay
+instead sends every query from a capture, in its original order and with
+its original spacing (optionally sped up), to every nameserver at once.
+Sends are never held up waiting for answers, so bursts and cache reuse
+reach the servers just as they did in production.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import itertools
+
+# external dependencies (from nb_third_party)
+import dns.name
+import dns.rdataclass
+import dns.rdatatype
+
+import benchmark
+import latency_histogram
+import pcap_reader
+import query_events
+import query_multiplexer
+
+
+class ReplayError(Exception):
+  """The capture can not be replayed."""
+
+
+class ResponseSummary(object):
+  """What the reports use from a response, without holding on to the message.
+
+  A replay keeps one result per captured query per nameserver, so storing
+  whole responses would grow with the size of the capture.
+  """
+
+  __slots__ = ('rcode', 'answer_count', 'ttl')
+
+  def __init__(self, response):
+    self.rcode = response.rcode()
+    self.answer_count = len(response.answer)
+    if response.answer:
+      self.ttl = response.answer[0].ttl
+    else:
+      self.ttl = -1
+
+
+def LoadTrace(path, speedup=1.0, limit=None):
+  """Read the queries in a capture, with when to send them.
+
+  Args:
+    path: path to a pcap or pcapng file
+    speedup: how many times faster than real time to replay (float)
+    limit: maximum number of queries to read (int, optional)
+
+  Returns:
+    A list of (offset in seconds, request_type, hostname) tuples, in the
+    order they were captured.
+
+  Raises:
+    ReplayError: if the capture has no queries, or no timestamps.
+    pcap_reader.CaptureError: if path is not a capture file.
+  """
+  if speedup <= 0:
+    raise ReplayError('Replay speed must be above 0, not %s' % speedup)
+  trace = []
+  first = None
+  for (request_type, hostname, timestamp) in itertools.islice(pcap_reader.ReadQueries(path),
+                                                              limit):
+    if timestamp is None:
+      raise ReplayError('%s has no packet timestamps to replay' % path)
+    if first is None:
+      first = timestamp
+    # Captures may be merged from several interfaces, slightly out of order.
+    trace.append((max(timestamp - first, 0) / speedup, request_type, hostname))
+  if not trace:
+    raise ReplayError('No DNS queries found in %s' % path)
+  trace.sort(key=lambda x: x[0])
+  return trace
+
+
+class ReplayBenchmark(benchmark.Benchmark):
+  """A Benchmark whose single run replays a captured trace."""
+
+  def __init__(self, nameservers, trace, status_callback=None):
+    """Constructor.
+
+    Args:
+      nameservers: a list of NameServerData objects
+      trace: output of LoadTrace()
+      status_callback: Where to send msg() updates to.
+    """
+    benchmark.Benchmark.__init__(self, nameservers, run_count=1, query_count=len(trace),
+                                 status_callback=status_callback)
+    self.trace = trace
+    # nameserver -> LatencyHistogram of how late each query was sent (ms).
+    self.lateness = {}
+
+  def _Requests(self, servers):
+    for (position, (offset, request_type, hostname)) in enumerate(self.trace):
+      record = dns.name.from_text(hostname, None)
+      rdtype = dns.rdatatype.from_text(request_type)
+      for ns in servers:
+        request = ns.CreateRequest(record, rdtype, dns.rdataclass.IN)
+        yield (offset, (ns, position), ns.ip, request, ns.port)
+
+  def Run(self, test_records=None):
+    """Replay the trace against every enabled nameserver.
+
+    Args:
+      test_records: unused, the trace decides what is sent.
+
+    Returns:
+      A dictionary of nameserver -> [test run], as Benchmark.Run() does, except
+      that responses are ResponseSummary objects.
+    """
+    servers = list(self.nameservers.enabled_servers)
+    for ns in servers:
+      ns.ResetErrorCounts()
+
+    query_events.SetPhase('benchmark')
+    timeout = max([ns.timeout for ns in servers])
+    self.msg('Replaying %s queries over %0.1fs to %s servers' %
+             (len(self.trace), self.trace[-1][0], len(servers)))
+    multiplexer = query_multiplexer.QueryMultiplexer(phase='benchmark')
+    try:
+      answers = multiplexer.Replay(self._Requests(servers), timeout)
+    finally:
+      multiplexer.Close()
+
+    for ns in servers:
+      test_run = []
+      self.lateness[ns] = latency_histogram.LatencyHistogram()
+      for (position, (unused_offset, request_type, hostname)) in enumerate(self.trace):
+        (response, duration, error_msg, lateness) = answers.pop((ns, position))
+        ns.request_count += 1
+        if response:
+          response = ResponseSummary(response)
+        else:
+          ns.failure_count += 1
+        if error_msg:
+          ns.error_map[error_msg] = ns.error_map.get(error_msg, 0) + 1
+          duration = ns.timeout * 1000
+        test_run.append((hostname, request_type, duration, response, error_msg))
+        self.lateness[ns].Add(lateness)
+      self.results[ns] = [test_run]
+      self._AddToHistogram(ns, test_run)
+
+    slowest = max([x.Percentile(99) for x in self.lateness.values()])
+    self.msg('Replay finished: 99%% of queries were sent within %0.1fms of schedule' % slowest)
+    return self.results
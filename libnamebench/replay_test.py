@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the replay module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import os
+import tempfile
+import time
+import unittest
+
+import dns_responder
+import nameserver_list
+import pcap_reader
+import pcap_reader_test
+import replay
+import reporter
+
+UDP = pcap_reader.IPPROTO_UDP
+
+
+class FakeOptions(object):
+  timeout = 0.3
+  version = 'test'
+
+
+def Packet(timestamp, name, rdtype='A'):
+  frame = pcap_reader_test.IPv4(UDP, pcap_reader_test.Udp(pcap_reader_test.Query(name, rdtype)))
+  return (timestamp, frame)
+
+
+class ReplayTest(unittest.TestCase):
+  def setUp(self):
+    (fd, self.path) = tempfile.mkstemp()
+    os.close(fd)
+    self.responder = None
+
+  def tearDown(self):
+    os.unlink(self.path)
+    if self.responder:
+      self.responder.Stop()
+
+  def _WriteCapture(self, packets):
+    open(self.path, 'wb').write(pcap_reader_test.Pcap(pcap_reader.LINKTYPE_RAW, packets))
+
+  def testLoadTrace(self):
+    self._WriteCapture([Packet(1000.0, 'www.example.com'), Packet(1000.5, 'example.org', 'MX'),
+                        Packet(1000.25, 'www.example.com'), Packet(1001.0, 'www.example.com')])
+    self.assertEquals(replay.LoadTrace(self.path, speedup=2, limit=3),
+                      [(0.0, 'A', 'www.example.com.'), (0.125, 'A', 'www.example.com.'),
+                       (0.25, 'MX', 'example.org.')])
+    self.assertRaises(replay.ReplayError, replay.LoadTrace, self.path, speedup=0)
+    self._WriteCapture([])
+    self.assertRaises(replay.ReplayError, replay.LoadTrace, self.path)
+    open(self.path, 'wb').write('www.example.com\n')
+    self.assertRaises(pcap_reader.CaptureError, replay.LoadTrace, self.path)
+
+  def testOpenLoop(self):
+    zone = dns_responder.Zone(records={'www.example.com.': {'A': ['192.0.2.1']},
+                                       'example.org.': {'A': ['192.0.2.2']}})
+    # Answers take longer than the gap between queries, and one server never answers.
+    self.responder = dns_responder.DnsResponder(
+        {'127.0.0.1': dns_responder.ServerProfile(latency=150),
+         '127.0.0.2': dns_responder.ServerProfile(loss_rate=1)}, zone=zone)
+    self.responder.Start()
+    servers = nameserver_list.NameServers()
+    for ns in self.responder.CreateNameServers():
+      ns.timeout = 0.3
+      ns.health_timeout = 0.3
+      servers.append(ns)
+
+    self._WriteCapture([Packet(1000.0 + i * 0.1, ('www.example.com', 'example.org')[i % 2])
+                        for i in range(5)])
+    bmark = replay.ReplayBenchmark(servers, replay.LoadTrace(self.path, speedup=2))
+    start = time.time()
+    results = bmark.Run()
+    elapsed = time.time() - start
+    # Sent every 50ms, without waiting for the 150ms answers or 300ms timeouts.
+    self.assertTrue(elapsed < 0.2 + 0.3 + 0.2, elapsed)
+
+    (answering, lossy) = sorted(results, key=lambda x: x.ip)
+    self.assertEquals([x[0:2] for x in results[answering][0]],
+                      [('www.example.com.', 'A'), ('example.org.', 'A')] * 2 +
+                      [('www.example.com.', 'A')])
+    for (unused_host, unused_type, duration, response, error_msg) in results[answering][0]:
+      self.assertEquals(error_msg, None)
+      self.assertEquals((response.rcode, response.answer_count), (0, 1))
+      self.assertTrue(145 < duration < 400, duration)
+    self.assertEquals([x[2:] for x in results[lossy][0]], [(300.0, None, 'Timeout')] * 5)
+    self.assertEquals((lossy.request_count, lossy.failure_count), (5, 5))
+    self.assertTrue(bmark.lateness[answering].Percentile(100) < 50)
+    self.assertEquals(bmark.histograms[answering].count, 5)
+
+    # The summaries kept by a replay are enough to build the reports from.
+    report = reporter.ReportGenerator(FakeOptions(), servers, results, index={},
+                                      histograms=bmark.histograms)
+    for format in ('ascii', 'html'):
+      self.assertTrue(answering.name in report.CreateReport(format=format))
+    report.SaveResultsToCsv(self.path)
+    rows = open(self.path).read().splitlines()
+    self.assertEquals(len(rows), 11)
+    answered = [x for x in rows if x.startswith(answering.ip + ',')]
+    self.assertEquals(len(answered), 5)
+    self.assertFalse([x for x in answered if not x.endswith(',1,NOERROR,')], answered)
+
+
+if __name__ == '__main__':
+  unittest.main()
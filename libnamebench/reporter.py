@@ -21,25 +21,34 @@ import os.path
 import platform
 
 # external dependencies (from third_party)
+import dns.rcode
 import jinja2
 import simplejson
 
 import addr_util
+import calibration
 import charts
+import health_checks
 import nameserver
 import nameserver_list
+import replay
+import result_analysis
 import url_map
 import util
 
 # Only bother showing a percentage if we have this many tests.
 MIN_RELEVANT_COUNT = 50
 
+# Response time percentiles shown in reports.
+PERCENTILES = (50, 90, 99)
+
 
 class ReportGenerator(object):
   """Generate reports - ASCII, HTML, etc."""
 
   def __init__(self, config, nameservers, results, index=None, geodata=None,
-               status_callback=None):
+               status_callback=None, profiler=None, overhead=None,
+               subtract_overhead=False, histograms=None):
     """Constructor.
 
     Args:
@@ -49,40 +58,53 @@ class ReportGenerator(object):
       index: A dictionary of results for index hosts.
       geodata: A dictionary of geographic information.
       status_callback: where to send msg() calls.
+      profiler: A PhaseProfiler whose timings should be included (optional)
+      overhead: Client overhead, as returned by calibration.MeasureClientOverhead
+      subtract_overhead: Whether to subtract the median overhead from durations
+      histograms: dictionary of nameserver -> LatencyHistogram (optional, built
+        from results if not given)
     """
     self.nameservers = nameservers
+    self.overhead = overhead
+    self.subtract_overhead = bool(overhead and subtract_overhead)
+    if self.subtract_overhead:
+      results = calibration.SubtractOverhead(results, overhead['median'])
     self.results = results
+    # Histograms filled during the benchmark do not have overhead subtracted.
+    if self.subtract_overhead:
+      histograms = None
+    self.histograms = histograms
     self.index = index
     self.config = config
     self.geodata = geodata
     self.status_callback = status_callback
+    self.profiler = profiler
     self.cached_averages = {}
     self.cached_summary = None
+    self.cached_analysis = None
 
   def msg(self, msg, **kwargs):
     if self.status_callback:
       self.status_callback(msg, **kwargs)
 
+  def Analysis(self):
+    """Return a ResultAnalysis of our results, flattening them only once."""
+    if not self.cached_analysis or len(self.cached_analysis.servers) != len(self.results):
+      self.cached_analysis = result_analysis.ResultAnalysis(self.results)
+    return self.cached_analysis
+
   def ComputeAverages(self):
     """Process all runs for all hosts, yielding an average for each host."""
     if len(self.results) in self.cached_averages:
       return self.cached_averages[len(self.results)]
 
+    analysis = self.Analysis()
     records = []
     for ns in self.results:
       if ns.is_disabled or ns.is_hidden:
         continue
-      failure_count = 0
-      nx_count = 0
-      run_averages = []
-
-      for test_run in self.results[ns]:
-        # x: record, req_type, duration, response
-        total_count = len(test_run)
-        failure_count += len([x for x in test_run if not x[3]])
-        nx_count += len([x for x in test_run if x[3] and not x[3].answer])
-        duration = sum([x[2] for x in test_run])
-        run_averages.append(duration / len(test_run))
+      run_averages = analysis.RunAverages(ns)
+      (failure_count, nx_count, total_count) = analysis.Counts(ns)
 
       # This appears to be a safe use of averaging averages
       overall_average = util.CalculateListAverage(run_averages)
@@ -95,26 +117,7 @@ class ReportGenerator(object):
 
   def FastestAndSlowestDurationForNameServer(self, ns):
     """For a given nameserver, find the fastest/slowest non-error durations."""
-
-    fastest_duration = 2**32
-    slowest_duration = -1
-
-    durations = []
-    for test_run_results in self.results[ns]:
-      for (unused_host, unused_type, duration, response, unused_error) in test_run_results:
-        durations.append(duration)
-        if response and response.answer:
-          if duration < fastest_duration:
-            fastest_duration = duration
-        if duration > slowest_duration:
-          slowest_duration = duration
-
-    # If we have no error-free durations, settle for anything.
-    if fastest_duration == 2**32:
-      fastest_duration = min(durations)
-    if slowest_duration == -1:
-      slowest_duration = max(durations)
-    return (fastest_duration, slowest_duration)
+    return self.Analysis().FastestAndSlowest(ns)
 
   def FastestNameServerResult(self):
     """Process all runs for all hosts, yielding an average for each host."""
@@ -160,6 +163,20 @@ class ReportGenerator(object):
       chart.append((ns.name, textbar, overall_mean))
     return chart
 
+  def GenerateChartUrls(self):
+    """Return a dictionary of Google Chart URLs for the report."""
+    sorted_averages = sorted(self.ComputeAverages(), key=operator.itemgetter(1))
+    runs_data = [(x[0].name, x[2]) for x in sorted_averages]
+    distribution = self.CumulativeDistribution()
+    return {
+        'mean_duration_url': charts.PerRunDurationBarGraph(runs_data),
+        'min_duration_url': charts.MinimumDurationBarGraph(self.FastestNameServerResult()),
+        'distribution_url_200': charts.DistributionLineGraph(None, scale=200,
+                                                             distribution=distribution),
+        'distribution_url': charts.DistributionLineGraph(None, scale=self.config.timeout * 1000,
+                                                         distribution=distribution)
+    }
+
   def CreateReport(self, format='ascii', output_fp=None, csv_path=None,
                    sharing_url=None, sharing_state=None):
     """Create a Report in a given format.
@@ -183,14 +200,7 @@ class ReportGenerator(object):
       lowest_latency = None
       mean_duration = None
 
-    sorted_averages = sorted(self.ComputeAverages(), key=operator.itemgetter(1))
-    runs_data = [(x[0].name, x[2]) for x in sorted_averages]
-    mean_duration_url = charts.PerRunDurationBarGraph(runs_data)
-    min_duration_url = charts.MinimumDurationBarGraph(self.FastestNameServerResult())
-    distribution_url_200 = charts.DistributionLineGraph(self.DigestedResults(),
-                                                        scale=200)
-    distribution_url = charts.DistributionLineGraph(self.DigestedResults(),
-                                                    scale=self.config.timeout * 1000)
+    chart_urls = self.GenerateChartUrls()
 
     # Now generate all of the required textual information.
     ns_summary = self._GenerateNameServerSummary()
@@ -219,6 +229,12 @@ class ReportGenerator(object):
           compare_subtitle = 'Too few tests (needs %s)' % (MIN_RELEVANT_COUNT)
         break
 
+    (censored_domains, censorship) = self._GenerateCensorshipSummary()
+    if self.profiler:
+      phase_summary = self.profiler.Summary()
+    else:
+      phase_summary = []
+
     # Fragile, makes assumption about the CSV being in the same path as the HTML file
     if csv_path:
       csv_link = os.path.basename(csv_path)
@@ -245,11 +261,17 @@ class ReportGenerator(object):
         config=filtered_config,
         mean_duration=mean_duration,
         ns_summary=ns_summary,
-        mean_duration_url=mean_duration_url,
-        min_duration_url=min_duration_url,
-        distribution_url=distribution_url,
-        distribution_url_200=distribution_url_200,
+        mean_duration_url=chart_urls['mean_duration_url'],
+        min_duration_url=chart_urls['min_duration_url'],
+        distribution_url=chart_urls['distribution_url'],
+        distribution_url_200=chart_urls['distribution_url_200'],
         recommended=recommended,
+        censored_domains=censored_domains,
+        censorship=censorship,
+        phase_summary=phase_summary,
+        percentiles=self.PercentileSummary(),
+        overhead=self.overhead,
+        subtract_overhead=self.subtract_overhead,
         csv_link=csv_link
     )
     if output_fp:
@@ -269,15 +291,35 @@ class ReportGenerator(object):
         config_items.append((key, value))
     return sorted(config_items)
 
+  def LatencyHistograms(self):
+    """Return a dictionary of nameserver -> LatencyHistogram of all durations."""
+    if self.histograms is None:
+      analysis = self.Analysis()
+      self.histograms = {}
+      for ns in self.results:
+        self.histograms[ns] = analysis.Histogram(ns)
+    return self.histograms
+
+  def PercentileSummary(self):
+    """Return (ns, count, p50, p90, p99) for each nameserver, fastest p50 first."""
+    histograms = self.LatencyHistograms()
+    rows = []
+    for ns in histograms:
+      if ns.is_disabled or ns.is_hidden or not histograms[ns].count:
+        continue
+      rows.append(tuple([ns, histograms[ns].count] + histograms[ns].Percentiles(PERCENTILES)))
+    return sorted(rows, key=operator.itemgetter(2))
+
   def DigestedResults(self):
     """Return a tuple of nameserver and all associated durations."""
-    duration_data = []
-    for ns in self.results:
-      durations = []
-      for test_run_results in self.results[ns]:
-        durations += [x[2] for x in test_run_results]
-      duration_data.append((ns, durations))
-    return duration_data
+    analysis = self.Analysis()
+    return [(ns, analysis.Durations(ns)) for ns in self.results]
+
+  def CumulativeDistribution(self):
+    """Return [(ns, ((percentage, duration),))], as used by the distribution charts."""
+    analysis = self.Analysis()
+    return [(ns, analysis.CumulativeDistribution(ns)) for ns in self.results
+            if len(analysis.servers[ns].durations)]
 
   def _GenerateNameServerSummary(self):
     if self.cached_summary:
@@ -319,12 +361,15 @@ class ReportGenerator(object):
     for (ns, unused_avg, run_averages, fastest, slowest, unused_failures, nx_count, unused_total) in sorted_averages:
       placed_at += 1
 
-      durations = []
-      for _ in self.results[ns]:
-        durations.append([x[2] for x in self.results[ns][0]])
+      first_run = self.Analysis().RunDurations(ns, 0)
+      durations = [first_run for _ in self.results[ns]]
 
+      (p50, p90, p99) = self.LatencyHistograms()[ns].Percentiles(PERCENTILES)
       nsdata[ns].update({
           'position': placed_at,
+          'p50': p50,
+          'p90': p90,
+          'p99': p99,
           'overall_average': util.CalculateListAverage(run_averages),
           'averages': run_averages,
           'duration_min': float(fastest),
@@ -362,6 +407,41 @@ class ReportGenerator(object):
     self.cached_summary = sorted(nsdata.values(), key=operator.itemgetter('position'))
     return self.cached_summary
 
+  def _GenerateCensorshipSummary(self):
+    """Turn the censorship check matrix into rows for the report templates.
+
+    Returns:
+      A tuple of (domains, rows), where each row is a dictionary with the
+      nameserver name, ip, a list of statuses in the same order as domains,
+      and a list of (domain, status) tuples for checks that did not pass.
+    """
+    matrix = getattr(self.nameservers, 'censorship_results', None)
+    if not matrix:
+      return (None, None)
+
+    domains = set()
+    for ns in matrix:
+      domains.update(matrix[ns].keys())
+    domains = sorted(domains)
+
+    rows = []
+    for ns in sorted(matrix, key=operator.attrgetter('name')):
+      if ns.is_hidden:
+        continue
+      statuses = []
+      problems = []
+      for domain in domains:
+        if domain in matrix[ns]:
+          status = matrix[ns][domain][2]
+        else:
+          status = None
+        statuses.append(status)
+        if status != health_checks.ANSWER_OK:
+          problems.append((domain.rstrip('.'), status))
+      rows.append({'name': ns.name, 'ip': ns.ip, 'statuses': statuses,
+                   'problems': problems})
+    return (domains, rows)
+
   def _GenerateIndexSummary(self, ns):
     # Get the meat out of the index data.
     index = []
@@ -413,7 +493,7 @@ class ReportGenerator(object):
     """For a given DNS response, parse the most important details out.
 
     Args:
-      response: DNS response
+      response: DNS response, or a replay.ResponseSummary
 
     Returns:
       tuple of (answer_count, ttl, answer_text)
@@ -422,7 +502,13 @@ class ReportGenerator(object):
     answer_text = ''
     answer_count = -1
     ttl = -1
-    if response:
+    if isinstance(response, replay.ResponseSummary):
+      # Replays do not keep the answers themselves, only their count.
+      if response.answer_count:
+        answer_count = response.answer_count
+        ttl = response.ttl
+      answer_text = dns.rcode.to_text(response.rcode)
+    elif response:
       if response.answer:
         answer_count = len(response.answer)
         ttl = response.answer[0].ttl
@@ -454,3 +540,18 @@ class ReportGenerator(object):
     csv_file.close()
     self.msg('%s saved.' % filename, debug=True)
 
+  def SavePercentilesToCsv(self, filename):
+    """Write out a CSV file with response time percentiles for each nameserver.
+
+    Sample output:
+    IP, Name, Count, Mean, P50, P90, P99, Max
+    """
+    csv_file = open(filename, 'w')
+    output = csv.writer(csv_file)
+    output.writerow(['IP', 'Name', 'Count', 'Mean', 'P50', 'P90', 'P99', 'Max'])
+    histograms = self.LatencyHistograms()
+    for (ns, count, p50, p90, p99) in self.PercentileSummary():
+      output.writerow([ns.ip, ns.name, count, histograms[ns].mean, p50, p90, p99,
+                       histograms[ns].max])
+    csv_file.close()
+
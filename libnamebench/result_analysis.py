@@ -0,0 +1,213 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Summary statistics for benchmark results, computed in a single pass.
+
+The nested result tuples from Benchmark.Run() are flattened once per
+nameserver into durations, run boundaries and status flags. When NumPy is
+installed those become arrays, and every statistic is a vectorized
+operation; otherwise the same statistics are computed with plain lists.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import math
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+import charts
+import latency_histogram
+import replay
+
+
+class _ServerResults(object):
+  """Flattened results for a single nameserver."""
+
+  def __init__(self, test_runs, use_numpy):
+    durations = []
+    answered = []
+    has_answer = []
+    run_lengths = []
+    for test_run in test_runs:
+      run_lengths.append(len(test_run))
+      for result in test_run:
+        durations.append(result[2])
+        response = result[3]
+        answered.append(bool(response))
+        if isinstance(response, replay.ResponseSummary):
+          has_answer.append(response.answer_count > 0)
+        else:
+          has_answer.append(bool(response and response.answer))
+
+    self.run_lengths = run_lengths
+    self.use_numpy = use_numpy
+    if use_numpy:
+      self.durations = numpy.array(durations, dtype=numpy.float64)
+      self.answered = numpy.array(answered, dtype=bool)
+      self.has_answer = numpy.array(has_answer, dtype=bool)
+      self.offsets = numpy.cumsum([0] + run_lengths[:-1])
+    else:
+      self.durations = durations
+      self.answered = answered
+      self.has_answer = has_answer
+    self._sorted = None
+
+  @property
+  def sorted_durations(self):
+    if self._sorted is None:
+      if self.use_numpy:
+        self._sorted = numpy.sort(self.durations)
+      else:
+        self._sorted = sorted(self.durations)
+    return self._sorted
+
+
+class ResultAnalysis(object):
+  """Statistics for a dictionary of results from Benchmark.Run()."""
+
+  def __init__(self, results, use_numpy=None):
+    """Constructor.
+
+    Args:
+      results: dictionary of nameserver -> list of test runs
+      use_numpy: Use NumPy (default: if it is installed)
+    """
+    if use_numpy is None:
+      use_numpy = numpy is not None
+    self.use_numpy = use_numpy
+    self.servers = {}
+    self._distributions = {}
+    for ns in results:
+      self.servers[ns] = _ServerResults(results[ns], use_numpy)
+
+  def RunAverages(self, ns):
+    """Return the average duration of each test run."""
+    data = self.servers[ns]
+    if self.use_numpy:
+      sums = numpy.add.reduceat(data.durations, data.offsets)
+      return (sums / numpy.array(data.run_lengths, dtype=numpy.float64)).tolist()
+    averages = []
+    start = 0
+    for length in data.run_lengths:
+      averages.append(sum(data.durations[start:start + length]) / length)
+      start += length
+    return averages
+
+  def FastestAndSlowest(self, ns):
+    """Return the fastest answered duration (or fastest at all), and the slowest."""
+    data = self.servers[ns]
+    if self.use_numpy:
+      answered = data.durations[data.has_answer]
+      if len(answered):
+        fastest = answered.min()
+      else:
+        fastest = data.durations.min()
+      return (float(fastest), float(data.durations.max()))
+
+    answered = [x for (x, y) in zip(data.durations, data.has_answer) if y]
+    if answered:
+      fastest = min(answered)
+    else:
+      fastest = min(data.durations)
+    return (fastest, max(data.durations))
+
+  def Counts(self, ns):
+    """Return (failure count, NXDOMAIN/empty count, length of the last run)."""
+    data = self.servers[ns]
+    if self.use_numpy:
+      failures = int(len(data.answered) - numpy.count_nonzero(data.answered))
+      nx_count = int(numpy.count_nonzero(data.answered & ~data.has_answer))
+    else:
+      failures = data.answered.count(False)
+      nx_count = len([x for (x, y) in zip(data.answered, data.has_answer) if x and not y])
+    return (failures, nx_count, data.run_lengths[-1])
+
+  def Durations(self, ns):
+    """Return every duration for a nameserver, in the order they were recorded."""
+    durations = self.servers[ns].durations
+    if self.use_numpy:
+      return durations.tolist()
+    return list(durations)
+
+  def RunDurations(self, ns, run_number):
+    """Return the durations of a single test run."""
+    data = self.servers[ns]
+    start = sum(data.run_lengths[0:run_number])
+    durations = data.durations[start:start + data.run_lengths[run_number]]
+    if self.use_numpy:
+      return durations.tolist()
+    return list(durations)
+
+  def Percentile(self, ns, percent):
+    """Return the exact (nearest-rank) percentile of all durations."""
+    ordered = self.servers[ns].sorted_durations
+    if not len(ordered):
+      return None
+    rank = max(int(math.ceil(percent / 100.0 * len(ordered))), 1)
+    return float(ordered[rank - 1])
+
+  def Histogram(self, ns, relative_error=latency_histogram.DEFAULT_RELATIVE_ERROR):
+    """Return a LatencyHistogram of all durations for a nameserver."""
+    durations = self.servers[ns].durations
+    if self.use_numpy:
+      return latency_histogram.FromArray(durations, relative_error=relative_error)
+    return latency_histogram.FromDurations(durations, relative_error=relative_error)
+
+  def CumulativeDistribution(self, ns, x_chunk=1.5, percent_chunk=3.5):
+    """Return chunked (percent, duration) points, as charts uses them.
+
+    With NumPy, every chunk edge is looked up in the sorted durations at once
+    with searchsorted; otherwise the sorted durations are swept.
+
+    Returns:
+      A list of (percentage, duration) tuples, starting with (0, 0), or None
+      if there are no durations.
+    """
+    key = (ns, x_chunk, percent_chunk)
+    if key not in self._distributions:
+      ordered = self.servers[ns].sorted_durations
+      if not len(ordered):
+        self._distributions[key] = None
+      elif self.use_numpy:
+        self._distributions[key] = _SearchSortedDistribution(ordered, x_chunk, percent_chunk)
+      else:
+        self._distributions[key] = charts._SortedCumulativeDistribution(
+            ordered, x_chunk=x_chunk, percent_chunk=percent_chunk)
+    return self._distributions[key]
+
+
+def _SearchSortedDistribution(ordered, x_chunk, percent_chunk):
+  """charts._SortedCumulativeDistribution, for a sorted NumPy array."""
+  max_result = ordered[-1]
+  # Step exactly as charts does, so that chunk edges match to the bit.
+  steps = []
+  chunk_max = ordered[0]
+  while chunk_max < max_result:
+    steps.append(chunk_max)
+    chunk_max += x_chunk
+  below = numpy.searchsorted(ordered, steps, side='right').tolist()
+  ordered = ordered.tolist()
+
+  host_dist = [(0, 0)]
+  last_percent = -99
+  for value_count in below:
+    percent = float(value_count) / float(len(ordered)) * 100
+    if (percent - last_percent) > percent_chunk:
+      host_dist.append((percent, ordered[value_count - 1]))
+      last_percent = percent
+  host_dist.append((100, ordered[-1]))
+  return host_dist
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the result_analysis module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import random
+import unittest
+
+import charts
+import result_analysis
+
+
+class FakeResponse(object):
+  def __init__(self, answer):
+    self.answer = answer
+
+
+def MakeResults(seed, servers=3, runs=2, queries=200):
+  rng = random.Random(seed)
+  results = {}
+  for ns in range(servers):
+    results[ns] = []
+    for _ in range(runs):
+      test_run = []
+      for _ in range(queries):
+        roll = rng.random()
+        if roll < 0.05:
+          (duration, response) = (3000.0, None)
+        elif roll < 0.1:
+          (duration, response) = (rng.uniform(5, 40), FakeResponse([]))
+        else:
+          (duration, response) = (rng.lognormvariate(3, 0.8), FakeResponse(['1.2.3.4']))
+        test_run.append(('www.example.com.', 'A', duration, response, None))
+      results[ns].append(test_run)
+  return results
+
+
+class ResultAnalysisTest(unittest.TestCase):
+  def testStatistics(self):
+    results = MakeResults(39)
+    analysis = result_analysis.ResultAnalysis(results, use_numpy=False)
+    for ns in results:
+      flat = [x for test_run in results[ns] for x in test_run]
+      durations = [x[2] for x in flat]
+      self.assertEquals(analysis.Durations(ns), durations)
+      self.assertEquals(analysis.RunDurations(ns, 1), [x[2] for x in results[ns][1]])
+      self.assertEquals(analysis.RunAverages(ns),
+                        [sum([x[2] for x in run]) / len(run) for run in results[ns]])
+      self.assertEquals(analysis.FastestAndSlowest(ns),
+                        (min([x[2] for x in flat if x[3] and x[3].answer]), max(durations)))
+      self.assertEquals(analysis.Counts(ns),
+                        (len([x for x in flat if not x[3]]),
+                         len([x for x in flat if x[3] and not x[3].answer]), 200))
+      self.assertEquals(analysis.Percentile(ns, 100), max(durations))
+      self.assertEquals(analysis.Percentile(ns, 0), min(durations))
+
+  def testNumPyMatchesFallback(self):
+    if not result_analysis.numpy:
+      return
+    results = MakeResults(390)
+    fallback = result_analysis.ResultAnalysis(results, use_numpy=False)
+    vectorized = result_analysis.ResultAnalysis(results, use_numpy=True)
+    for ns in results:
+      self.assertEquals(vectorized.Durations(ns), fallback.Durations(ns))
+      self.assertEquals(vectorized.Counts(ns), fallback.Counts(ns))
+      self.assertEquals(vectorized.FastestAndSlowest(ns), fallback.FastestAndSlowest(ns))
+      for (average, expected) in zip(vectorized.RunAverages(ns), fallback.RunAverages(ns)):
+        self.assertAlmostEquals(average, expected)
+      for percent in (1, 50, 99):
+        self.assertEquals(vectorized.Percentile(ns, percent), fallback.Percentile(ns, percent))
+      self.assertEquals(vectorized.Histogram(ns).buckets, fallback.Histogram(ns).buckets)
+      self.assertEquals(vectorized.CumulativeDistribution(ns),
+                        fallback.CumulativeDistribution(ns))
+
+  def testCumulativeDistribution(self):
+    results = MakeResults(3900, servers=1, runs=1)
+    analysis = result_analysis.ResultAnalysis(results)
+    expected = charts._MakeCumulativeDistribution([(0, analysis.Durations(0))])[0][1]
+    self.assertEquals(analysis.CumulativeDistribution(0), expected)
+    self.assertEquals(result_analysis.ResultAnalysis({0: [[]]}).CumulativeDistribution(0), None)
+
+
+if __name__ == '__main__':
+  unittest.main()
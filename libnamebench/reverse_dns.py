@@ -0,0 +1,177 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Batched reverse DNS (PTR) lookups with a process-wide cache."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import threading
+import time
+
+# external dependencies (from nb_third_party)
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.reversename
+
+import query_multiplexer
+import sys_nameservers
+
+DEFAULT_TIMEOUT = 2.5
+DEFAULT_RETRIES = 2
+
+# How long (in seconds) to remember answers
+MIN_CACHE_TTL = 300
+MAX_CACHE_TTL = 86400
+NEGATIVE_CACHE_TTL = 900
+FAILURE_CACHE_TTL = 60
+
+# ip -> (hostname or None, expiration timestamp). Shared by all resolvers.
+REVERSE_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+_DEFAULT_RESOLVER = None
+
+
+def GetCachedHostname(ip):
+  """Return (found, hostname) for an IP address from the reverse cache."""
+  _CACHE_LOCK.acquire()
+  try:
+    entry = REVERSE_CACHE.get(ip)
+    if entry and entry[1] > time.time():
+      return (True, entry[0])
+    return (False, None)
+  finally:
+    _CACHE_LOCK.release()
+
+
+def _CacheHostname(ip, hostname, ttl):
+  _CACHE_LOCK.acquire()
+  try:
+    REVERSE_CACHE[ip] = (hostname, time.time() + ttl)
+  finally:
+    _CACHE_LOCK.release()
+
+
+def ClearCache():
+  _CACHE_LOCK.acquire()
+  try:
+    REVERSE_CACHE.clear()
+  finally:
+    _CACHE_LOCK.release()
+
+
+class ReverseResolver(object):
+  """Resolve PTR records for many IP addresses in a single round-trip."""
+
+  def __init__(self, nameserver_ips=None, timeout=DEFAULT_TIMEOUT,
+               retries=DEFAULT_RETRIES, port=query_multiplexer.DEFAULT_PORT):
+    if nameserver_ips is None:
+      nameserver_ips = sys_nameservers.GetCurrentNameServers()
+    self.nameserver_ips = list(nameserver_ips)
+    self.timeout = timeout
+    self.retries = retries
+    self.port = port
+
+  def _ProcessResponse(self, ip, response):
+    """Cache a response, returning True if it was conclusive."""
+    rcode = response.rcode()
+    if rcode == dns.rcode.NXDOMAIN:
+      _CacheHostname(ip, None, NEGATIVE_CACHE_TTL)
+      return True
+    elif rcode != dns.rcode.NOERROR:
+      return False
+
+    for rrset in response.answer:
+      if rrset.rdtype == dns.rdatatype.PTR:
+        ttl = min(max(rrset.ttl, MIN_CACHE_TTL), MAX_CACHE_TTL)
+        _CacheHostname(ip, rrset.items[0].to_text().rstrip('.'), ttl)
+        return True
+
+    # NOERROR, but no PTR record (NODATA)
+    _CacheHostname(ip, None, NEGATIVE_CACHE_TTL)
+    return True
+
+  def ResolveMany(self, ips):
+    """Resolve hostnames for a list of IP addresses.
+
+    Args:
+      ips: A list of IP addresses (str)
+
+    Returns:
+      A dictionary of ip -> hostname. If no hostname could be found, the
+      IP address is returned in its place.
+    """
+    hostnames = {}
+    unresolved = []
+    for ip in set(ips):
+      (found, hostname) = GetCachedHostname(ip)
+      if found:
+        hostnames[ip] = hostname or ip
+      else:
+        unresolved.append(ip)
+
+    attempt = 0
+    while unresolved and self.nameserver_ips and attempt <= self.retries:
+      # Rotate through the system nameservers on each retry.
+      ns_ip = self.nameserver_ips[attempt % len(self.nameserver_ips)]
+      attempt += 1
+      requests = []
+      for ip in unresolved:
+        try:
+          ptr_name = dns.reversename.from_address(ip)
+        except:
+          _CacheHostname(ip, None, NEGATIVE_CACHE_TTL)
+          continue
+        requests.append((ip, ns_ip, dns.message.make_query(ptr_name, dns.rdatatype.PTR),
+                         self.port))
+
+      multiplexer = query_multiplexer.QueryMultiplexer(port=self.port, phase='reverse')
+      try:
+        answers = multiplexer.Query(requests, self.timeout)
+      finally:
+        multiplexer.Close()
+
+      unresolved = []
+      for ip in answers:
+        response = answers[ip][0]
+        if not response or not self._ProcessResponse(ip, response):
+          unresolved.append(ip)
+
+    # Don't hammer on addresses which do not answer, but try again later.
+    for ip in unresolved:
+      _CacheHostname(ip, None, FAILURE_CACHE_TTL)
+
+    for ip in ips:
+      if ip not in hostnames:
+        hostnames[ip] = GetCachedHostname(ip)[1] or ip
+    return hostnames
+
+  def Resolve(self, ip):
+    return self.ResolveMany([ip])[ip]
+
+
+def GetDefaultResolver():
+  """Return the process-wide ReverseResolver, creating it if necessary."""
+  global _DEFAULT_RESOLVER
+  if not _DEFAULT_RESOLVER:
+    _DEFAULT_RESOLVER = ReverseResolver()
+  return _DEFAULT_RESOLVER
+
+
+def ResolveMany(ips):
+  return GetDefaultResolver().ResolveMany(ips)
+
+
+def GetReverseIp(ip):
+  return GetDefaultResolver().Resolve(ip)
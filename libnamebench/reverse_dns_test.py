@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the reverse_dns and query_multiplexer modules."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import time
+import unittest
+
+# external dependencies (from nb_third_party)
+import dns.message
+import dns.rcode
+
+import dns_responder
+import query_multiplexer
+import reverse_dns
+
+ANSWERING_IP = '127.0.0.1'
+LOSSY_IP = '127.0.0.2'
+
+
+class ReverseDnsTest(unittest.TestCase):
+  def setUp(self):
+    reverse_dns.ClearCache()
+    zone = dns_responder.Zone(records={'1.2.0.192.in-addr.arpa.': {'PTR': ['host.example.com.']}})
+    self.responder = dns_responder.DnsResponder(
+        {ANSWERING_IP: dns_responder.ServerProfile(latency=10),
+         LOSSY_IP: dns_responder.ServerProfile(loss_rate=1)}, zone=zone)
+    self.responder.Start()
+
+  def tearDown(self):
+    self.responder.Stop()
+    reverse_dns.ClearCache()
+
+  def Resolver(self, ip, retries=0):
+    return reverse_dns.ReverseResolver([ip], timeout=0.3, retries=retries,
+                                       port=self.responder.port)
+
+  def testResolveMany(self):
+    resolver = self.Resolver(ANSWERING_IP)
+    expected = {'192.0.2.1': 'host.example.com', '192.0.2.2': '192.0.2.2'}
+    self.assertEquals(resolver.ResolveMany(['192.0.2.1', '192.0.2.2']), expected)
+    self.assertEquals(self.responder.query_count, 2)
+
+    # The NXDOMAIN is remembered for longer than a failure would be.
+    (hostname, expiration) = reverse_dns.REVERSE_CACHE['192.0.2.2']
+    self.assertEquals(hostname, None)
+    self.assertTrue(expiration - time.time() > reverse_dns.FAILURE_CACHE_TTL)
+
+    # Everything is cached now, so nothing more is sent.
+    self.assertEquals(resolver.ResolveMany(['192.0.2.2', '192.0.2.1']), expected)
+    self.assertEquals(resolver.Resolve('192.0.2.2'), '192.0.2.2')
+    self.assertEquals(self.responder.query_count, 2)
+
+  def testTimeout(self):
+    resolver = self.Resolver(LOSSY_IP, retries=1)
+    start = time.time()
+    self.assertEquals(resolver.ResolveMany(['192.0.2.1']), {'192.0.2.1': '192.0.2.1'})
+    self.assertTrue(time.time() - start < 0.3 * 2 + 0.3)
+    self.assertEquals(self.responder.query_count, 2)
+
+    # Failures are cached briefly, so that a dead server is not hammered.
+    (hostname, expiration) = reverse_dns.REVERSE_CACHE['192.0.2.1']
+    self.assertEquals(hostname, None)
+    self.assertTrue(expiration - time.time() <= reverse_dns.FAILURE_CACHE_TTL)
+    self.assertEquals(resolver.ResolveMany(['192.0.2.1']), {'192.0.2.1': '192.0.2.1'})
+    self.assertEquals(self.responder.query_count, 2)
+
+  def testQuery(self):
+    multiplexer = query_multiplexer.QueryMultiplexer(port=self.responder.port)
+    requests = [('hit', ANSWERING_IP, dns.message.make_query('1.2.0.192.in-addr.arpa.', 'PTR')),
+                ('miss', ANSWERING_IP, dns.message.make_query('2.2.0.192.in-addr.arpa.', 'PTR')),
+                ('lost', LOSSY_IP, dns.message.make_query('1.2.0.192.in-addr.arpa.', 'PTR'))]
+    try:
+      answers = multiplexer.Query(requests, 0.3)
+    finally:
+      multiplexer.Close()
+
+    (response, duration, error_msg) = answers['hit']
+    self.assertEquals(error_msg, None)
+    self.assertEquals(response.answer[0].items[0].to_text(), 'host.example.com.')
+    self.assertTrue(5 < duration < 300, duration)
+    self.assertEquals(answers['miss'][0].rcode(), dns.rcode.NXDOMAIN)
+    (response, duration, error_msg) = answers['lost']
+    self.assertEquals((response, error_msg), (None, 'Timeout'))
+    self.assertTrue(duration >= 290, duration)
+
+
+if __name__ == '__main__':
+  unittest.main()
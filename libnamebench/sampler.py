@@ -0,0 +1,113 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Draw weighted samples, with a limit on how often each one may repeat.
+
+Weighted draws bisect a table of cumulative weights: after an O(n) setup,
+each draw is one random number and an O(log n) search, however skewed the
+weights are. (Walker's alias method draws in O(1), but in pure Python its
+setup and draws both measured slower than bisect, which runs in C.)
+
+Repeat limits are enforced by rejecting draws of anything already used up.
+Once rejections outnumber the accepted draws, the table is rebuilt without
+the used-up entries, so a sample always gets its full count (as long as the
+limits leave room for it) without rejecting its way into a stall.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import bisect
+import random
+
+# Rejections tolerated before rebuilding the table, however few draws were kept.
+MIN_REBUILD_MISSES = 32
+
+
+class WeightTable(object):
+  """Draws indexes in proportion to a list of weights, in O(log n) each."""
+
+  def __init__(self, weights, rng=random):
+    """Constructor.
+
+    Args:
+      weights: a list of non-negative weights (float), not all zero.
+      rng: where to get random numbers from (optional: the random module)
+    """
+    self.rng = rng
+    self.cumulative = []
+    self.total = 0.0
+    for weight in weights:
+      self.total += weight
+      self.cumulative.append(self.total)
+    self.last = len(weights) - 1
+
+  def Draw(self):
+    # min() guards against random() * total rounding up to total.
+    return min(bisect.bisect_right(self.cumulative, self.rng.random() * self.total), self.last)
+
+
+def Sample(size, count, weights=None, max_repeat=None, keys=None):
+  """Pick count indexes out of range(size).
+
+  Args:
+    size: how many things there are to pick from (int)
+    count: how many to pick (int)
+    weights: a list of size weights (float), or None to pick uniformly.
+      Zero-weight indexes are only picked once everything else is used up.
+    max_repeat: how many times the same key may be picked (int, optional)
+    keys: a list of size keys to apply max_repeat to (optional: the index)
+
+  Returns:
+    A list of count indexes, in the order drawn. It is only shorter if
+    max_repeat does not leave room for count picks.
+  """
+  picks = []
+  picked = {}
+  if keys is None:
+    keys = xrange(size)
+
+  def Usable(indexes):
+    if max_repeat is None:
+      return list(indexes)
+    return [x for x in indexes if picked.get(keys[x], 0) < max_repeat]
+
+  if weights is None:
+    preferred = None
+  else:
+    preferred = [i for i in xrange(size) if weights[i] > 0]
+
+  while len(picks) < count:
+    candidates = preferred and Usable(preferred)
+    if candidates:
+      table = WeightTable([weights[i] for i in candidates])
+      draw = lambda: candidates[table.Draw()]
+    else:
+      preferred = None
+      candidates = Usable(xrange(size))
+      if not candidates:
+        break
+      draw = lambda: candidates[int(random.random() * len(candidates))]
+
+    kept = 0
+    misses = 0
+    while len(picks) < count and misses <= max(kept, MIN_REBUILD_MISSES):
+      index = draw()
+      key = keys[index]
+      if max_repeat is not None and picked.get(key, 0) >= max_repeat:
+        misses += 1
+        continue
+      picks.append(index)
+      picked[key] = picked.get(key, 0) + 1
+      kept += 1
+  return picks
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the sampler module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import random
+import unittest
+
+import sampler
+
+
+class SamplerTest(unittest.TestCase):
+  def setUp(self):
+    random.seed(1287446400)
+
+  def testWeightTable(self):
+    table = sampler.WeightTable([1, 0, 3])
+    draws = [table.Draw() for unused in range(4000)]
+    self.assertEquals(draws.count(1), 0)
+    self.assertTrue(2800 < draws.count(2) < 3200, draws.count(2))
+
+  def testSample(self):
+    picks = sampler.Sample(5, 1000, weights=[1, 2, 3, 4, 5])
+    self.assertEquals(len(picks), 1000)
+    self.assertTrue(picks.count(4) > picks.count(0))
+
+    # A heavily skewed sample still fills up, within its repeat limit.
+    picks = sampler.Sample(1000, 2000, weights=[1e6] + [1] * 999, max_repeat=2)
+    self.assertEquals(len(picks), 2000)
+    self.assertEquals(picks[0], 0)
+    self.assertEquals(sorted(picks), sorted(range(1000) * 2))
+
+    # No room left for the full count.
+    self.assertEquals(sorted(sampler.Sample(3, 10, max_repeat=2)), [0, 0, 1, 1, 2, 2])
+    self.assertEquals(sampler.Sample(0, 10), [])
+
+  def testKeys(self):
+    keys = ['a', 'a', 'a', 'b']
+    picks = sampler.Sample(4, 4, max_repeat=2, keys=keys)
+    self.assertEquals(sorted([keys[x] for x in picks]), ['a', 'a', 'b', 'b'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -18,20 +18,25 @@
 import math
 import random
 
+import sampler
+
 # When running a weighted distribution, never repeat a domain more than this:
 MAX_REPEAT = 3
+# WeightedDistribution picks index total * x ** -POWER_LAW_EXPONENT for a random x.
+POWER_LAW_EXPONENT = 0.408506
 
 TYPES = {
     'automatic': 'Pick the most appropriate selector type for the data source',
     'weighted': 'Chooses based on a weighted distribution, preferring entries in the top of the list',
+    'popularity': 'Chooses in proportion to how often each entry was visited (browser history)',
     'random': 'Random selection, including repeats.',
     'chunk': 'Chooses a random contiguous segment of entries'
 }
 
 
 def MaxRepeatCount(elements, count):
-  # Avoid stalling out looking for the one unique choice
-  if count >= len(elements) * 0.5:
+  """How many times the same element may be picked, leaving room for count picks."""
+  if count > len(elements) * MAX_REPEAT:
     return 2**32
   else:
     return MAX_REPEAT
@@ -42,6 +47,19 @@ def GetTypes():
   return sorted(TYPES.keys())
 
 
+def PowerLawWeights(total):
+  """Return the chance of picking each of total entries under WeightedDistribution."""
+  # Picks used to be made by drawing x at random from [0, total) and taking
+  # int(FindY(x) - FindY(total)). Index i is picked when x falls between the
+  # values of x that map to i + 1 and to i, so that is its weight.
+  if not total:
+    return []
+  exponent = -1 / POWER_LAW_EXPONENT
+  offset = math.pow(total, 1 - POWER_LAW_EXPONENT)
+  edges = [min(math.pow((i + offset) / total, exponent), total) for i in xrange(total + 1)]
+  return [edges[i] - edges[i + 1] for i in xrange(total)]
+
+
 def WeightedDistribution(elements, count):
   """Given a set of elements, return a weighted distribution back.
 
@@ -57,30 +75,9 @@ def WeightedDistribution(elements, count):
 
   522.520776 * math.pow(x, -0.998506)-2
   """
-
-  def FindY(x, total):
-    return total * math.pow(x, -0.408506)
-
-  total = len(elements)
-  picks = []
-  picked = {}
-  offset = FindY(total, total)
-  max_repeat = MaxRepeatCount(elements, count)
-  attempts = 0
-  while len(picks) < count:
-    attempts += 1
-    # avoid dead-lock
-    if attempts > (count * 4):
-      break
-    x = random.random() * total
-    y = FindY(x, total) - offset
-    index = abs(int(y))
-    if index < total:
-      if picked.get(index, 0) < max_repeat:
-        picks.append(elements[index])
-        picked[index] = picked.get(index, 0) + 1
-#        print '%s: %s' % (index, elements[index])
-  return picks
+  indexes = sampler.Sample(len(elements), count, weights=PowerLawWeights(len(elements)),
+                           max_repeat=MaxRepeatCount(elements, count))
+  return [elements[i] for i in indexes]
 
 
 def ChunkSelect(elements, count):
@@ -93,20 +90,27 @@ def ChunkSelect(elements, count):
 
 def RandomSelect(elements, count, include_duplicates=False):
   """Randomly select elements, but enforce duplication limits."""
-  picks = []
-  picked = {}
   if include_duplicates:
-    max_repeat = 2**32
+    max_repeat = None
   else:
-    max_repeat = MaxRepeatCount(elements, count)
-  attempts = 0
-  while len(picks) < count:
-    attempts += 1
-    # avoid dead-lock
-    if attempts > (count * 4):
-      break
-    choice = random.choice(elements)
-    if picked.get(choice, 0) < max_repeat:
-      picks.append(choice)
-      picked[choice] = picked.get(choice, 0) + 1
-  return picks
+    # Limits apply to equal elements, wherever they are in the list.
+    max_repeat = MaxRepeatCount(set(elements), count)
+  indexes = sampler.Sample(len(elements), count, max_repeat=max_repeat, keys=elements)
+  return [elements[i] for i in indexes]
+
+
+def PopularitySelect(elements, weights, count):
+  """Select elements in proportion to their weights, enforcing duplication limits.
+
+  Args:
+    elements: A list of elements to choose from
+    weights: A list of popularity weights (float), one per element
+    count: how many elements to return
+
+  Returns:
+    A list of count elements. Elements without any weight are only picked
+    once the weighted ones have been repeated as often as they may be.
+  """
+  indexes = sampler.Sample(len(elements), count, weights=[max(x, 0) for x in weights],
+                           max_repeat=MaxRepeatCount(elements, count))
+  return [elements[i] for i in indexes]
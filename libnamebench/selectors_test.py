@@ -17,12 +17,16 @@
 
 __author__ = 'tstromberg@google.com (Thomas Stromberg)'
 
+import random
 import selectors
 import unittest
 
 
-
 class SelectorsTest(unittest.TestCase):
+  def setUp(self):
+    # The statistical checks below hold for nearly every seed, but not all.
+    random.seed(1287446400)
+
   def testMaxRepeatCount(self):
     self.assertEquals(selectors.MaxRepeatCount(range(1,10), 5),
                       selectors.MAX_REPEAT)
@@ -44,6 +48,11 @@ class SelectorsTest(unittest.TestCase):
     self.assertTrue(len(ones) <= selectors.MAX_REPEAT)
     self.assertTrue(len(twos) <= selectors.MAX_REPEAT)
 
+    # Limits count equal elements, not positions.
+    result = selectors.RandomSelect(['a'] * 90 + range(10), 30)
+    self.assertEquals(len(result), 30)
+    self.assertEquals(result.count('a'), selectors.MAX_REPEAT)
+
   def testRandomSelectVeryConstrained(self):
     """Test to make sure we don't infinite loop if count > len(elements)*3"""
     elements = range(2)
@@ -70,6 +79,31 @@ class SelectorsTest(unittest.TestCase):
     self.assertTrue(len(mid) <= 3)
     self.assertTrue(len(high) <= 2)
 
+    # Even when the limits leave only just enough room, nothing is left out.
+    result = selectors.WeightedDistribution(elements, 60)
+    self.assertEquals(sorted(result), sorted(elements * 3))
+
+  def testPowerLawWeights(self):
+    weights = selectors.PowerLawWeights(20)
+    self.assertEquals(len(weights), 20)
+    self.assertEquals(sorted(weights, reverse=True), weights)
+    # The first few entries get most of the picks.
+    self.assertTrue(sum(weights[:3]) / sum(weights) > 0.6)
+    self.assertEquals(selectors.PowerLawWeights(0), [])
+
+  def testPopularitySelect(self):
+    elements = ['a', 'b', 'c']
+    result = selectors.PopularitySelect(elements, [0, 0, 3.5], 10)
+    self.assertEquals(result, ['c'] * 10)
+    result = selectors.PopularitySelect(range(20), [1] * 20, 5)
+    self.assertEquals(len(result), 5)
+    self.assertTrue(max([result.count(x) for x in result]) <= selectors.MAX_REPEAT)
+    # Once the weighted entries are used up, the rest fill in.
+    result = selectors.PopularitySelect(range(10), [1] + [0] * 9, 5)
+    self.assertEquals(result[:3], [0] * 3)
+    self.assertFalse(0 in result[3:])
+    self.assertEquals(len(result), 5)
+
   def testChuckSelect(self):
     elements = range(10000)
     result = selectors.ChunkSelect(elements, 5)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark namebench's own hot paths, and catch performance regressions.
+
+Every case runs on fixed, seeded inputs so that numbers are comparable
+between runs on the same machine. Usage (from the top-level directory):
+
+  python -m libnamebench.self_benchmark -o results.json
+  python -m libnamebench.self_benchmark -b results.json -t 0.25
+
+The second form exits non-zero if any case got more than 25% slower.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import datetime
+import optparse
+import platform
+import random
+import StringIO
+import sys
+import time
+
+if __name__ == '__main__':
+  import nb_third_party
+
+# external dependencies (from nb_third_party)
+import dns.message
+import dns.rdataclass
+import dns.rdatatype
+import simplejson
+
+import addr_util
+import benchmark
+import charts
+import config
+import data_sources
+import dns_responder
+import nameserver
+import nameserver_list
+import reporter
+import selectors
+import util
+
+SEED = 2010
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.25
+LISTING_ROWS = 5400
+
+DOMAINS = ('com', 'net', 'org', 'co.uk', 'com.au', 'de', 'jp', 'info')
+RESPONSE_TEXT = """id 999
+opcode QUERY
+rcode NOERROR
+flags QR RD RA
+;QUESTION
+www.paypal.com. IN A
+;ANSWER
+www.paypal.com. 159 IN A 66.211.169.65
+www.paypal.com. 159 IN A 66.211.169.2
+;AUTHORITY
+paypal.com. 3459 IN NS ppns1.den.paypal.com.
+paypal.com. 3459 IN NS ppns1.phx.paypal.com.
+;ADDITIONAL
+ppns1.den.paypal.com. 165480 IN A 216.113.188.121
+ppns1.phx.paypal.com. 73170 IN A 66.211.168.226"""
+
+
+def _Hostnames(rng, count):
+  """Generate a repeatable list of plausible hostnames."""
+  hostnames = []
+  for _ in range(count):
+    labels = ['h%d' % rng.randint(0, 5000) for _ in range(rng.randint(0, 3))]
+    labels.append('site%d' % rng.randint(0, 20000))
+    hostnames.append('.'.join(labels + [rng.choice(DOMAINS)]))
+  return hostnames
+
+
+def _NameServers(count):
+  servers = nameserver_list.NameServers()
+  for i in range(count):
+    servers.append(nameserver.NameServer('10.0.%d.%d' % (i / 250, i % 250 + 1),
+                                         name='NS%d' % i))
+  return servers
+
+
+def QueryBuildAndParse(rng):
+  """Build, render and parse queries, as TimedRequest does."""
+  ns = nameserver.NameServer('127.0.0.1')
+  names = ['%s.' % x for x in _Hostnames(rng, 1000)]
+  response_wire = dns.message.from_text(RESPONSE_TEXT).to_wire()
+  def Run():
+    for name in names:
+      request = ns.CreateRequest(name, dns.rdatatype.A, dns.rdataclass.IN)
+      request.to_wire()
+      dns.message.from_wire(response_wire)
+  return Run
+
+
+def WeightedDistribution(rng):
+  elements = _Hostnames(rng, 10000)
+  def Run():
+    random.seed(SEED)
+    selectors.WeightedDistribution(elements, 2500)
+  return Run
+
+
+def CreateRecordsFromHostEntries(rng):
+  ds = data_sources.DataSources()
+  entries = []
+  for hostname in _Hostnames(rng, 20000):
+    if rng.random() < 0.1:
+      entries.append('A %s.' % hostname)
+    elif rng.random() < 0.05:
+      entries.append('10.%d.%d.%d' % (rng.randint(0, 255), rng.randint(0, 255),
+                                      rng.randint(1, 254)))
+    else:
+      entries.append(hostname)
+  def Run():
+    ds._CreateRecordsFromHostEntries(entries)
+  return Run
+
+
+def GetDomainFromHostname(rng):
+  hostnames = _Hostnames(rng, 2000)
+  def Run():
+    for hostname in hostnames:
+      addr_util.GetDomainFromHostname(hostname)
+  return Run
+
+
+def _BenchmarkResults(rng, server_count=20, run_count=3, query_count=250):
+  response = dns.message.from_text(RESPONSE_TEXT)
+  results = {}
+  for ns in _NameServers(server_count):
+    results[ns] = []
+    for _ in range(run_count):
+      run = []
+      for hostname in _Hostnames(rng, query_count):
+        if rng.random() < 0.02:
+          run.append((hostname, 'A', rng.uniform(1000, 3500), None, None))
+        else:
+          run.append((hostname, 'A', rng.expovariate(1 / 40.0), response, None))
+      results[ns].append(run)
+  return results
+
+
+def ComputeAverages(rng):
+  results = _BenchmarkResults(rng)
+  def Run():
+    report = reporter.ReportGenerator(None, None, results)
+    report.ComputeAverages()
+  return Run
+
+
+def MakeCumulativeDistribution(rng):
+  report = reporter.ReportGenerator(None, None, _BenchmarkResults(rng))
+  run_data = report.DigestedResults()
+  def Run():
+    charts._MakeCumulativeDistribution(run_data)
+  return Run
+
+
+def ParseNameServerListing(unused_rng):
+  lines = open(util.FindDataFile('config/servers.csv')).readlines()
+  while len(lines) < LISTING_ROWS:
+    lines += lines
+  listing = ''.join(lines[0:LISTING_ROWS])
+  def Run():
+    config._ParseNameServerListing(StringIO.StringIO(listing))
+  return Run
+
+
+def LoopbackBenchmark(rng):
+  """A complete Benchmark.Run against three loopback servers."""
+  profiles = {}
+  for (ip, latency) in (('127.0.0.1', 1), ('127.0.0.2', ['uniform', 0, 3]),
+                        ('127.0.0.3', ['exponential', 1])):
+    profiles[ip] = dns_responder.ServerProfile(latency=latency)
+  responder = dns_responder.DnsResponder(profiles, seed=SEED)
+  responder.Start()
+  servers = nameserver_list.NameServers()
+  for ns in responder.CreateNameServers():
+    servers.append(ns)
+  test_records = [('A', 'a.root-servers.net.')] * 100
+  def Run():
+    benchmark.Benchmark(servers, run_count=1, query_count=len(test_records),
+                        thread_count=3).Run(test_records)
+  Run.cleanup = responder.Stop
+  return Run
+
+
+CASES = (
+    ('query_build_and_parse', QueryBuildAndParse),
+    ('weighted_distribution', WeightedDistribution),
+    ('create_records_from_host_entries', CreateRecordsFromHostEntries),
+    ('get_domain_from_hostname', GetDomainFromHostname),
+    ('compute_averages', ComputeAverages),
+    ('make_cumulative_distribution', MakeCumulativeDistribution),
+    ('parse_nameserver_listing', ParseNameServerListing),
+    ('loopback_benchmark', LoopbackBenchmark),
+)
+
+
+def RunCases(repeat=DEFAULT_REPEAT, only=None, status_callback=None):
+  """Time each benchmark case.
+
+  Args:
+    repeat: How many times to run each case. The fastest run is reported.
+    only: A list of case names to run (optional, default all)
+    status_callback: function to send progress text to (optional)
+
+  Returns:
+    A dictionary of case name -> {'best': seconds, 'mean': seconds, 'repeat': int}
+  """
+  results = {}
+  for (name, setup) in CASES:
+    if only and name not in only:
+      continue
+    function = setup(random.Random(SEED))
+    timings = []
+    try:
+      for _ in range(repeat):
+        start = time.time()
+        function()
+        timings.append(time.time() - start)
+    finally:
+      if hasattr(function, 'cleanup'):
+        function.cleanup()
+    results[name] = {'best': min(timings), 'mean': util.CalculateListAverage(timings),
+                     'repeat': repeat}
+    if status_callback:
+      status_callback('%-34.34s %9.4fs (mean %.4fs)' % (name, min(timings),
+                                                       results[name]['mean']))
+  return results
+
+
+def CreateJsonData(results):
+  return simplejson.dumps({'timestamp': str(datetime.datetime.now()),
+                           'platform': platform.platform(),
+                           'python': platform.python_version(),
+                           'results': results}, indent=2)
+
+
+def FindRegressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+  """Compare results against a baseline.
+
+  Args:
+    results: dictionary as returned by RunCases
+    baseline: dictionary as returned by RunCases
+    threshold: how much slower a case may be (fraction: 0.25 is 25%)
+
+  Returns:
+    A list of (case name, baseline seconds, current seconds) which regressed.
+  """
+  regressions = []
+  for name in sorted(results):
+    if name not in baseline:
+      continue
+    old = baseline[name]['best']
+    new = results[name]['best']
+    if old and new > old * (1 + threshold):
+      regressions.append((name, old, new))
+  return regressions
+
+
+def main(argv):
+  parser = optparse.OptionParser()
+  parser.add_option('-b', '--baseline', dest='baseline', help='JSON results to compare against')
+  parser.add_option('-c', '--cases', dest='cases', default='', help='Comma-separated list of cases to run')
+  parser.add_option('-o', '--output', dest='output', help='Filename to write JSON results to')
+  parser.add_option('-r', '--repeat', dest='repeat', default=DEFAULT_REPEAT, type='int', help='How many times to run each case')
+  parser.add_option('-t', '--threshold', dest='threshold', default=DEFAULT_THRESHOLD, type='float', help='Allowed slowdown before failing (0.25 = 25%)')
+  (options, unused_args) = parser.parse_args(argv)
+
+  def Print(msg):
+    print msg
+    sys.stdout.flush()
+
+  only = [x for x in options.cases.split(',') if x]
+  results = RunCases(repeat=options.repeat, only=only, status_callback=Print)
+  if options.output:
+    f = open(options.output, 'w')
+    f.write(CreateJsonData(results))
+    f.close()
+    print 'Saved results to %s' % options.output
+
+  if options.baseline:
+    baseline = simplejson.load(open(options.baseline))['results']
+    regressions = FindRegressions(results, baseline, threshold=options.threshold)
+    for (name, old, new) in regressions:
+      print 'REGRESSION: %s took %.4fs (baseline: %.4fs, +%.0f%%)' % (
+          name, new, old, (new / old - 1) * 100)
+    if regressions:
+      return 1
+    print 'No regressions beyond %.0f%% of %s' % (options.threshold * 100, options.baseline)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the self_benchmark module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import random
+import unittest
+
+import self_benchmark
+
+
+class SelfBenchmarkTest(unittest.TestCase):
+  def testSeededInputs(self):
+    self.assertEquals(self_benchmark._Hostnames(random.Random(self_benchmark.SEED), 50),
+                      self_benchmark._Hostnames(random.Random(self_benchmark.SEED), 50))
+
+  def testRunCases(self):
+    results = self_benchmark.RunCases(repeat=2, only=['compute_averages'])
+    self.assertEquals(results.keys(), ['compute_averages'])
+    self.assertEquals(results['compute_averages']['repeat'], 2)
+    self.assertTrue(results['compute_averages']['best'] <= results['compute_averages']['mean'])
+
+  def testFindRegressions(self):
+    baseline = {'a': {'best': 1.0}, 'b': {'best': 1.0}, 'c': {'best': 1.0}}
+    results = {'a': {'best': 1.2}, 'b': {'best': 1.3}, 'd': {'best': 9.0}}
+    self.assertEquals(self_benchmark.FindRegressions(results, baseline, threshold=0.25),
+                      [('b', 1.0, 1.3)])
+
+
+if __name__ == '__main__':
+  unittest.main()
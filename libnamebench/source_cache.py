@@ -0,0 +1,179 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Keep the hostnames parsed out of each data source file between runs.
+
+Entries are keyed by the file path, and only used if the size, mtime and
+parser version still match. The record count is stored on its own, so that
+listing sources never has to load the records themselves: those are only
+read (and decompressed) when a source is actually used.
+
+The cache may hold browser history, so it lives in a directory of the
+user's own, and a file that someone else could have planted or can write
+to is never used.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import errno
+import os
+import os.path
+import stat
+import threading
+import zlib
+
+try:
+  import sqlite3
+except ImportError:
+  sqlite3 = None
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.namebench', 'sources.cache')
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sources (
+      path TEXT PRIMARY KEY, size INTEGER, mtime REAL, version INTEGER,
+      count INTEGER, hosts BLOB, weights BLOB)"""
+
+
+def _Pack(values):
+  return buffer(zlib.compress('\n'.join(values)))
+
+
+def _Unpack(blob):
+  data = zlib.decompress(str(blob))
+  if not data:
+    return []
+  return data.split('\n')
+
+
+class SourceCache(object):
+  """An on-disk cache of the hosts found in data source files."""
+
+  def __init__(self, path=DEFAULT_PATH, version=1):
+    """Constructor.
+
+    Args:
+      path: where to keep the cache
+      version: parser version: entries from other versions are ignored.
+    """
+    self.path = path
+    self.version = version
+    self.conn = None
+    self.lock = threading.Lock()
+
+  @property
+  def is_available(self):
+    return bool(sqlite3)
+
+  def _CreateFile(self):
+    """Create the cache file private to this user, or check that it still is.
+
+    Raises:
+      OSError: if the file is not a regular file owned by, and only writable
+        by, this user.
+    """
+    directory = os.path.dirname(self.path)
+    if directory and not os.path.isdir(directory):
+      os.makedirs(directory, 0700)
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_NOFOLLOW', 0)
+    try:
+      os.close(os.open(self.path, flags, 0600))
+    except OSError, e:
+      if e.errno != errno.EEXIST:
+        raise
+    info = os.lstat(self.path)
+    if not stat.S_ISREG(info.st_mode):
+      raise OSError('%s is not a regular file' % self.path)
+    if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+      raise OSError('%s is owned by someone else' % self.path)
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+      raise OSError('%s is writable by other users' % self.path)
+
+  def _Connect(self):
+    if not self.conn:
+      self._CreateFile()
+      self.conn = sqlite3.connect(self.path, check_same_thread=False)
+      self.conn.execute(SCHEMA)
+    return self.conn
+
+  def _Execute(self, sql, args=()):
+    """Run a statement, returning all rows (or None if the cache is unusable)."""
+    if not sqlite3:
+      return None
+    self.lock.acquire()
+    try:
+      try:
+        conn = self._Connect()
+        rows = conn.execute(sql, args).fetchall()
+        conn.commit()
+        return rows
+      except (sqlite3.Error, OSError, IOError):
+        return None
+    finally:
+      self.lock.release()
+
+  def _Key(self, filename):
+    stat = os.stat(filename)
+    return (os.path.abspath(filename), stat.st_size, stat.st_mtime, self.version)
+
+  def _Lookup(self, columns, filename):
+    try:
+      key = self._Key(filename)
+    except OSError:
+      return None
+    rows = self._Execute('SELECT %s FROM sources WHERE path=? AND size=? AND mtime=? '
+                         'AND version=?' % columns, key)
+    if rows:
+      return rows[0]
+    return None
+
+  def GetCount(self, filename):
+    """Return how many hosts are cached for a file, or None if it is not cached."""
+    row = self._Lookup('count', filename)
+    if row:
+      return row[0]
+    return None
+
+  def Get(self, filename):
+    """Return (hosts, weights) for a file, or None if it is not cached.
+
+    weights is a dictionary of host -> popularity, or None.
+    """
+    row = self._Lookup('hosts, weights', filename)
+    if not row:
+      return None
+    (hosts, weights) = row
+    hosts = _Unpack(hosts)
+    if weights is not None:
+      weights = dict(zip(hosts, [float(x) for x in _Unpack(weights)]))
+    return (hosts, weights)
+
+  def Set(self, filename, hosts, weights=None):
+    """Store the hosts (and optional host -> popularity weights) found in a file."""
+    try:
+      key = self._Key(filename)
+    except OSError:
+      return
+    if weights is not None:
+      weights = _Pack([repr(weights.get(x, 0.0)) for x in hosts])
+    self._Execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?, ?)',
+                  key + (len(hosts), _Pack(hosts), weights))
+
+  def Clear(self):
+    self._Execute('DELETE FROM sources')
+
+  def Close(self):
+    if self.conn:
+      self.conn.close()
+      self.conn = None
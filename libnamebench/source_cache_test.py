@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the source_cache module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import data_sources
+import source_cache
+
+
+class SourceCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    self.cache_path = os.path.join(self.tmp_dir, 'sources.cache')
+    self.data_path = os.path.join(self.tmp_dir, 'hosts.txt')
+    open(self.data_path, 'w').write('www.google.com\nexample.org\nA www.yahoo.com.\n')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+
+  def testCache(self):
+    cache = source_cache.SourceCache(self.cache_path)
+    self.assertEquals(cache.GetCount(self.data_path), None)
+    cache.Set(self.data_path, ['www.google.com', 'example.org'],
+              weights={'www.google.com': 2.5, 'example.org': 0.125})
+    open(self.data_path + '.empty', 'w').close()
+    cache.Set(self.data_path + '.empty', [])
+    self.assertEquals(cache.GetCount(self.data_path), 2)
+    self.assertEquals(stat.S_IMODE(os.stat(self.cache_path).st_mode), 0600)
+
+    # A new process sees the same entries.
+    cache = source_cache.SourceCache(self.cache_path)
+    self.assertEquals(cache.Get(self.data_path),
+                      (['www.google.com', 'example.org'],
+                       {'www.google.com': 2.5, 'example.org': 0.125}))
+    self.assertEquals(cache.Get(self.data_path + '.empty'), ([], None))
+
+    # Entries are ignored once the file or the parser changes.
+    self.assertEquals(source_cache.SourceCache(self.cache_path, version=2).Get(self.data_path),
+                      None)
+    os.utime(self.data_path, (1000, 1000))
+    self.assertEquals(cache.GetCount(self.data_path), None)
+
+  def testUntrustedFile(self):
+    # The directory is created on first use, for this user only.
+    cache_dir = os.path.join(self.tmp_dir, 'namebench')
+    cache = source_cache.SourceCache(os.path.join(cache_dir, 'sources.cache'))
+    cache.Set(self.data_path, ['www.google.com'])
+    self.assertEquals(cache.GetCount(self.data_path), 1)
+    self.assertEquals(stat.S_IMODE(os.stat(cache_dir).st_mode), 0700)
+
+    # A planted symlink is not followed, and its target is left alone.
+    target = os.path.join(self.tmp_dir, 'target')
+    open(target, 'w').close()
+    os.symlink(target, self.cache_path)
+    cache = source_cache.SourceCache(self.cache_path)
+    cache.Set(self.data_path, ['www.google.com'])
+    self.assertEquals(cache.GetCount(self.data_path), None)
+    self.assertEquals(os.path.getsize(target), 0)
+
+    # Nor is a file that other users can write to.
+    os.unlink(self.cache_path)
+    open(self.cache_path, 'w').close()
+    os.chmod(self.cache_path, 0666)
+    cache = source_cache.SourceCache(self.cache_path)
+    cache.Set(self.data_path, ['www.google.com'])
+    self.assertEquals(cache.GetCount(self.data_path), None)
+    self.assertEquals(os.path.getsize(self.cache_path), 0)
+
+  def testDataSources(self):
+    ds = data_sources.DataSources(status_callback=lambda *args, **kwargs: None,
+                                  cache_path=self.cache_path)
+    hosts = ds._GetHostsFromSource(self.data_path)
+    self.assertEquals(hosts, ['www.google.com', 'example.org', 'A www.yahoo.com.'])
+    del ds.source_cache[self.data_path]
+
+    # The second time around, the file is not parsed at all.
+    ds._ReadDataFile = None
+    self.assertEquals(ds._GetRecordCountForSource(self.data_path), 3)
+    self.assertEquals(ds.GetCachedRecordCountForSource(self.data_path), 3)
+    self.assertFalse(self.data_path in ds.source_cache)
+    self.assertEquals(ds._GetHostsFromSource(self.data_path), hosts)
+    del ds.source_cache[self.data_path]
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,95 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A replayable record of exactly which queries were sent to each server.
+
+Saving the plan from one run and loading it in another sends the same
+queries, in the same order, with the same random labels, so differences
+in the results come from the nameservers rather than from sampling.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+# external dependencies (from nb_third_party)
+import simplejson
+
+PLAN_VERSION = 1
+
+
+class TestPlan(object):
+  """The test records and per-server query order for each benchmark run."""
+
+  def __init__(self, seed=None, test_records=None, runs=None):
+    """Constructor.
+
+    Args:
+      seed: The random seed the plan was generated with (optional)
+      test_records: list of (request_type, hostname) tuples the plan was built from
+      runs: dictionary of run name -> [(ip, [(request_type, hostname), ...]), ...]
+    """
+    self.seed = seed
+    self.test_records = test_records or []
+    self.runs = runs or {}
+
+  def GetRecords(self, run_name, ip, position=None):
+    """Return the planned records for a server, or None if there are none.
+
+    Args:
+      run_name: the name of the benchmark run (str)
+      ip: nameserver IP (str)
+      position: the index of the server in this run. If the plan does not
+        mention ip, the records for the server at this position are used, so a
+        plan can be replayed against a different set of nameservers.
+
+    Returns:
+      A list of (request_type, hostname) tuples, or None.
+    """
+    servers = self.runs.get(run_name)
+    if not servers:
+      return None
+    for (planned_ip, records) in servers:
+      if planned_ip == ip:
+        return list(records)
+    if position is not None:
+      return list(servers[position % len(servers)][1])
+    return None
+
+  def SetRecords(self, run_name, ip, records):
+    self.runs.setdefault(run_name, []).append((ip, list(records)))
+
+  def CreateJsonData(self):
+    return simplejson.dumps({'version': PLAN_VERSION, 'seed': self.seed,
+                             'test_records': self.test_records, 'runs': self.runs})
+
+  def Save(self, path):
+    f = open(path, 'w')
+    f.write(self.CreateJsonData())
+    f.close()
+
+
+def _ToRecords(items):
+  return [(str(request_type), str(hostname)) for (request_type, hostname) in items]
+
+
+def Load(path):
+  """Load a TestPlan saved by TestPlan.Save."""
+  data = simplejson.load(open(path))
+  if data.get('version') != PLAN_VERSION:
+    raise ValueError('%s is not a version %s test plan' % (path, PLAN_VERSION))
+  runs = {}
+  for run_name in data['runs']:
+    runs[str(run_name)] = [(str(ip), _ToRecords(records))
+                           for (ip, records) in data['runs'][run_name]]
+  return TestPlan(seed=data.get('seed'), test_records=_ToRecords(data['test_records']),
+                  runs=runs)
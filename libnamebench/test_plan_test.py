@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the test_plan module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import os
+import random
+import tempfile
+import unittest
+
+import benchmark
+import mocks
+import nameserver_list
+import test_plan
+
+TEST_RECORDS = [('A', 'www.google.com.'), ('A', 'www.paypal.com.'),
+                ('A', 'cache-__RANDOM__.live.com.'), ('MX', 'google.com.')]
+
+
+def QueriesSent(results):
+  """Return the (request_type, hostname) tuples answered, per server and run.
+
+  Results arrive in the order the threads finish, so they are sorted.
+  """
+  sent = {}
+  for ns in results:
+    for test_run in results[ns]:
+      sent.setdefault(ns.ip, []).append(sorted([(x[1], x[0]) for x in test_run]))
+  return sent
+
+
+def RunBenchmark(ips, plan, seed=None):
+  servers = nameserver_list.NameServers()
+  for ip in ips:
+    servers.append(mocks.MockNameServer(ip))
+  bmark = benchmark.Benchmark(servers, run_count=2, thread_count=2, test_plan=plan, seed=seed)
+  return QueriesSent(bmark.Run(list(TEST_RECORDS)))
+
+
+class TestPlanTest(unittest.TestCase):
+  def setUp(self):
+    (fd, self.path) = tempfile.mkstemp()
+    os.close(fd)
+
+  def tearDown(self):
+    os.unlink(self.path)
+
+  def testSeededRunsMatch(self):
+    ips = (mocks.GOOD_IP, mocks.PERFECT_IP)
+    first = test_plan.TestPlan(seed=42)
+    second = test_plan.TestPlan(seed=42)
+    RunBenchmark(ips, first, seed=42)
+    RunBenchmark(ips, second, seed=42)
+    self.assertEquals(first.runs, second.runs)
+    self.assertEquals(sorted(first.runs.keys()), ['run0', 'run1'])
+    hostnames = [x[1] for x in first.GetRecords('run0', mocks.GOOD_IP)]
+    self.assertEquals(len(hostnames), len(TEST_RECORDS))
+    self.assertFalse([x for x in hostnames if '__RANDOM__' in x])
+
+  def testSeedAloneIsEnough(self):
+    ips = (mocks.GOOD_IP, mocks.PERFECT_IP, mocks.SLOW_IP)
+    first = test_plan.TestPlan(seed=7)
+    RunBenchmark(ips, first, seed=7)
+    # Whatever else uses the random module in between (data sources, health
+    # checks, a different set of servers) must not change the orders.
+    random.seed(1)
+    [random.random() for unused in range(37)]
+    second = test_plan.TestPlan(seed=7)
+    RunBenchmark(ips[1:], second, seed=7)
+    for run_name in ('run0', 'run1'):
+      for ip in ips[1:]:
+        self.assertEquals(first.GetRecords(run_name, ip), second.GetRecords(run_name, ip))
+    self.assertNotEquals(first.GetRecords('run0', mocks.PERFECT_IP),
+                         first.GetRecords('run1', mocks.PERFECT_IP))
+
+  def testReplay(self):
+    plan = test_plan.TestPlan(seed=1, test_records=TEST_RECORDS)
+    original = RunBenchmark((mocks.GOOD_IP, mocks.PERFECT_IP), plan, seed=1)
+    plan.Save(self.path)
+
+    loaded = test_plan.Load(self.path)
+    self.assertEquals(loaded.seed, 1)
+    self.assertEquals(loaded.test_records, TEST_RECORDS)
+    # No seed this time, and one server the plan has never seen.
+    replayed = RunBenchmark((mocks.PERFECT_IP, mocks.GOOD_IP, mocks.SLOW_IP), loaded)
+    self.assertEquals(loaded.runs, plan.runs)
+    self.assertEquals(replayed[mocks.GOOD_IP], original[mocks.GOOD_IP])
+    self.assertEquals(replayed[mocks.PERFECT_IP], original[mocks.PERFECT_IP])
+    # Third in line, so it gets the order of the first server in the plan.
+    self.assertEquals(replayed[mocks.SLOW_IP], original[mocks.GOOD_IP])
+    self.assertNotEquals(original[mocks.GOOD_IP], original[mocks.PERFECT_IP])
+
+
+if __name__ == '__main__':
+  unittest.main()
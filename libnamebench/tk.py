@@ -30,7 +30,10 @@ import traceback
 import addr_util
 import base_ui
 import conn_quality
+import dns_responder
 import nameserver_list
+import pcap_reader
+import replay
 import sys_nameservers
 import util
 
@@ -115,6 +118,11 @@ class WorkerThread(threading.Thread, base_ui.BaseUI):
   def run(self):
     self.msg('Started thread', enable_button=False)
     try:
+      self.StartQueryTrace()
+      self.StartMetricsServer()
+      self.StartProfiling()
+      self.PrepareTestPlan()
+      self.PrepareCheckpoint()
       self.PrepareTestRecords()
       self.PrepareNameServers()
       self.PrepareBenchmark()
@@ -128,11 +136,20 @@ class WorkerThread(threading.Thread, base_ui.BaseUI):
     except conn_quality.OfflineConnection:
       (exc_type, exception, tb) = sys.exc_info()
       self.msg('The connection appears to be offline!', error=exception)
+    except dns_responder.ResponderError:
+      (exc_type, exception, tb) = sys.exc_info()
+      self.msg('Unable to measure client overhead', error=exception)
+    except (replay.ReplayError, pcap_reader.CaptureError):
+      (exc_type, exception, tb) = sys.exc_info()
+      self.msg('Unable to replay %s' % self.options.replay_file, error=exception)
     except:
       (exc_type, exception, tb) = sys.exc_info()
       traceback.print_exc(tb)
       error_msg = '\n'.join(traceback.format_tb(tb)[-4:])
       self.msg(exception, error=error_msg)
+    self.StopQueryTrace()
+    self.StopMetricsServer()
+    self.StopProfiling()
     self.msg(None, enable_button=True)
 
 
@@ -178,6 +195,7 @@ class MainWindow(Frame, base_ui.BaseUI):
     """Update our little status window."""
     if not message:
       return None
+    self.ReportProgress(message, count, total)
 
     if total:
       state = '%s... [%s/%s]' % (message, count, total)
@@ -195,6 +213,11 @@ class MainWindow(Frame, base_ui.BaseUI):
     if not debug:
       self.status.set(state[0:75])
 
+  def ReportSourceCount(self, detail):
+    base_ui.BaseUI.ReportSourceCount(self, detail)
+    # Sources are counted while the window is drawn, before the event loop runs.
+    self.master.update_idletasks()
+
   def DrawWindow(self):
     """Draws the user interface."""
     self.nameserver_form = StringVar()
@@ -277,7 +300,7 @@ class MainWindow(Frame, base_ui.BaseUI):
 
     self.DiscoverLocation()
     self.LoadDataSources()
-    source_titles = self.data_src.ListSourceTitles()
+    source_titles = self.data_src.ListSourceTitles(callback=self.ReportSourceCount)
     left_dropdown_width = max([len(x) for x in source_titles]) - 3
 
     location_choices = [self.country, '(Other)']
@@ -0,0 +1,146 @@
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Generate synthetic query workloads of any size.
+
+Hostnames are picked by a Zipf popularity model over a ranked list: the
+entry at rank r is picked in proportion to 1 / r ** exponent. Queries that
+should miss the cache get a unique __RANDOM__ label, which the benchmark
+fills in, so that no resolver has the answer cached.
+"""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import random
+import zlib
+
+import addr_util
+import sampler
+
+DEFAULT_EXPONENT = 1.0
+DEFAULT_HIT_RATIO = 0.5
+DEFAULT_QTYPE_MIX = {'A': 70, 'AAAA': 15, 'MX': 5, 'TXT': 5, 'PTR': 5}
+MISS_LABEL = 'namebench__RANDOM__'
+
+
+class WorkloadError(Exception):
+  """The workload can not be generated with these settings."""
+
+
+def ParseQtypeMix(text):
+  """Parse a qtype mix such as 'A:70,AAAA:15,MX:5' into a dictionary."""
+  mix = {}
+  try:
+    for part in text.split(','):
+      (qtype, weight) = part.split(':')
+      mix[qtype.strip().upper()] = float(weight)
+  except ValueError:
+    raise WorkloadError('Invalid qtype mix: %s (expected TYPE:weight,...)' % text)
+  return mix
+
+
+def ZipfWeights(count, exponent=DEFAULT_EXPONENT):
+  """Return the popularity of each of count ranks under a Zipf distribution."""
+  return [1 / (rank ** exponent) for rank in xrange(1, count + 1)]
+
+
+class ZipfWorkload(object):
+  """Streams (request_type, hostname) tuples with a target cache-hit ratio."""
+
+  def __init__(self, hostnames, exponent=DEFAULT_EXPONENT, hit_ratio=DEFAULT_HIT_RATIO,
+               qtype_mix=None, seed=None):
+    """Constructor.
+
+    Args:
+      hostnames: hostnames to query, most popular first (duplicates are ignored)
+      exponent: Zipf exponent, higher values concentrate on the top entries (float)
+      hit_ratio: fraction of queries that should be answerable from cache (float)
+      qtype_mix: dictionary of request type -> relative weight
+      seed: seed for the random number generator (optional)
+
+    Raises:
+      WorkloadError: if the settings make no sense.
+    """
+    if not 0 <= hit_ratio <= 1:
+      raise WorkloadError('Cache hit ratio must be between 0 and 1, not %s' % hit_ratio)
+    if exponent <= 0:
+      raise WorkloadError('Zipf exponent must be above 0, not %s' % exponent)
+    self.hostnames = []
+    seen = set()
+    for hostname in hostnames:
+      hostname = hostname.lower().rstrip('.') + '.'
+      if hostname not in seen:
+        seen.add(hostname)
+        self.hostnames.append(hostname)
+    if not self.hostnames:
+      raise WorkloadError('No hostnames to build a workload from')
+
+    self.hit_ratio = hit_ratio
+    self.qtypes = sorted((qtype_mix or DEFAULT_QTYPE_MIX).items())
+    if not [x for x in self.qtypes if x[1] > 0]:
+      raise WorkloadError('No request types to generate: %s' % qtype_mix)
+    self.rng = random.Random(seed)
+    self.popularity = sampler.WeightTable(ZipfWeights(len(self.hostnames), exponent), rng=self.rng)
+    self.qtype_table = sampler.WeightTable([x[1] for x in self.qtypes], rng=self.rng)
+    self.queries = 0
+    self.hits = 0
+    self.asked = set()
+    # (request_type, rank) -> name, as working out a domain is slow.
+    self.names = {}
+
+  def _Name(self, request_type, rank):
+    """The name to query for a request type, derived from a popular hostname."""
+    key = (request_type, rank)
+    if key not in self.names:
+      self.names[key] = self._MakeName(request_type, self.hostnames[rank])
+    return self.names[key]
+
+  def _MakeName(self, request_type, hostname):
+    if request_type in ('MX', 'TXT', 'NS', 'SOA'):
+      return addr_util.GetDomainFromHostname(hostname[:-1]) + '.'
+    elif request_type == 'PTR':
+      # A stable, made-up address per hostname, so that repeats can be cached.
+      address = zlib.crc32(hostname) & 0xFFFFFFFF
+      return '%d.%d.%d.%d.in-addr.arpa.' % (address & 0xFF, (address >> 8) & 0xFF,
+                                            (address >> 16) & 0xFF, address >> 24)
+    return hostname
+
+  def Generate(self, count=None):
+    """Yield (request_type, hostname) tuples: count of them, or forever.
+
+    Each query is a repeat of a popular name while the hit ratio so far is
+    under target, and a guaranteed miss otherwise. Repeats of names that
+    have not been asked for yet are misses too, so the ratio is tracked on
+    what was actually generated.
+    """
+    generated = 0
+    while count is None or generated < count:
+      request_type = self.qtypes[self.qtype_table.Draw()][0]
+      name = self._Name(request_type, self.popularity.Draw())
+      if self.hits < self.hit_ratio * (self.queries + 1):
+        if (request_type, name) in self.asked:
+          self.hits += 1
+        else:
+          self.asked.add((request_type, name))
+      else:
+        name = '%s.%s' % (MISS_LABEL, name)
+      self.queries += 1
+      generated += 1
+      yield (request_type, name)
+
+  @property
+  def actual_hit_ratio(self):
+    if not self.queries:
+      return 0.0
+    return self.hits / float(self.queries)
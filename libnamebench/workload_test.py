@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# Copyright 2010 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for the workload module."""
+
+__author__ = 'tstromberg@google.com (Thomas Stromberg)'
+
+import itertools
+import unittest
+
+import data_sources
+import workload
+
+HOSTS = ['www.google.com.', 'www.facebook.com', 'mail.google.com.', 'www.bbc.co.uk.',
+         'www.google.com.', 'en.wikipedia.org.']
+
+
+class WorkloadTest(unittest.TestCase):
+  def testGenerate(self):
+    generator = workload.ZipfWorkload(HOSTS, hit_ratio=0.75, seed=42)
+    self.assertEquals(len(generator.hostnames), 5)
+    requests = list(generator.Generate(2000))
+    self.assertEquals(len(requests), 2000)
+    self.assertTrue(abs(generator.actual_hit_ratio - 0.75) < 0.01, generator.actual_hit_ratio)
+
+    misses = [x for x in requests if workload.MISS_LABEL in x[1]]
+    self.assertTrue(400 < len(misses) < 550, len(misses))
+    names = set([x[1] for x in requests if x not in misses])
+    self.assertTrue('bbc.co.uk.' in names)
+    self.assertTrue([x for x in names if x.endswith('.in-addr.arpa.')])
+    # The most popular host is asked for the most.
+    self.assertTrue(requests.count(('A', 'www.google.com.')) >
+                    requests.count(('A', 'en.wikipedia.org.')))
+
+    # The same seed makes the same workload, and it can stream forever.
+    again = workload.ZipfWorkload(HOSTS, hit_ratio=0.75, seed=42)
+    self.assertEquals(list(itertools.islice(again.Generate(), 2000)), requests)
+
+  def testSettings(self):
+    self.assertEquals(workload.ParseQtypeMix('a:2, MX:0.5'), {'A': 2.0, 'MX': 0.5})
+    self.assertRaises(workload.WorkloadError, workload.ParseQtypeMix, 'A=2')
+    self.assertRaises(workload.WorkloadError, workload.ZipfWorkload, HOSTS, hit_ratio=2)
+    self.assertRaises(workload.WorkloadError, workload.ZipfWorkload, [])
+    generator = workload.ZipfWorkload(HOSTS, hit_ratio=0, qtype_mix={'AAAA': 1}, seed=1)
+    for (request_type, hostname) in generator.Generate(50):
+      self.assertEquals(request_type, 'AAAA')
+      self.assertTrue(hostname.startswith(workload.MISS_LABEL))
+
+  def testDataSource(self):
+    ds = data_sources.DataSources(status_callback=lambda *args, **kwargs: None, cache_path=None)
+    self.assertEquals(ds.source_config['zipf']['workload']['hit_ratio'], 0.5)
+    requests = ds.GetTestsFromSource('zipf', 5000)
+    self.assertEquals(len(requests), 5000)
+    self.assertTrue(len(set(requests)) < 5000)
+
+
+if __name__ == '__main__':
+  unittest.main()